@@ -1,6 +1,7 @@
 from langgraph.prebuilt import create_react_agent
-from AI.tools import tavily_tool, movie_stats_tool
-from setup import llm
+from AI.tools import get_web_search_tool, movie_stats_tool
+from registry import registry
+from setup import get_llm
 from langchain_core.prompts import ChatPromptTemplate
 
 
@@ -30,16 +31,31 @@ search_prompt = ChatPromptTemplate.from_messages([
 
 
 # initialize the agent
-search_agent = create_react_agent(
-    llm,
-    tools=[tavily_tool],
-    prompt=search_prompt,
-    # response_format=
-)
+def create_search_agent():
+    return create_react_agent(
+        get_llm(),
+        tools=[get_web_search_tool()],
+        prompt=search_prompt,
+        # response_format=
+    )
 
-movie_stats_agent = create_react_agent(
-    llm,
-    tools=[movie_stats_tool],
-    prompt=stats_prompt,
-    # response_format=
-)
+
+def create_movie_stats_agent():
+    return create_react_agent(
+        get_llm(),
+        tools=[movie_stats_tool],
+        prompt=stats_prompt,
+        # response_format=
+    )
+
+
+registry.register("search_agent", create_search_agent, required=False)
+registry.register("movie_stats_agent", create_movie_stats_agent)
+
+
+def get_search_agent():
+    return registry.get("search_agent")
+
+
+def get_movie_stats_agent():
+    return registry.get("movie_stats_agent")
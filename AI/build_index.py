@@ -0,0 +1,30 @@
+import argparse
+
+from AI.vector import get_vector_store
+from DB.db import close_pool, init_db
+
+
+def main():
+    """
+    Офлайн-сборка индекса: скачивает каталог (сохраняя снимок сырых документов), строит
+    (или инкрементально синхронизирует) FAISS и загружает фильмы в БД. Запускается отдельно от сервера:
+        python -m AI.build_index [--sync] [--snapshot [ИМЯ]]
+    С --snapshot каталог читается из снимка без обращения к API Кинопоиска.
+    """
+    parser = argparse.ArgumentParser(description="Сборка векторного хранилища фильмов")
+    parser.add_argument("--sync", action="store_true",
+                        help="инкрементально обновить существующее хранилище по свежему каталогу")
+    parser.add_argument("--snapshot", nargs="?", const="latest", default=None, metavar="ИМЯ",
+                        help="пересобрать хранилище и БД из снимка каталога (по умолчанию - последнего полного), "
+                             "без обращения к API; вместе с --sync - инкрементально")
+    args = parser.parse_args()
+
+    init_db()
+    try:
+        get_vector_store(sync=args.sync, snapshot=args.snapshot)
+    finally:
+        close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,17 @@
 from langchain.chains import RetrievalQA
 
-from setup import llm
-from AI.vector import vector_store
+from setup import get_llm
+from AI.retriever import create_movie_retriever
+from AI.vector import current_vector_store
 
 
-def create_retrieval_chain():
+def create_retrieval_chain(genres=None, filters=None, search_query=None):
     """
     Создаем цепочку RetrievalQA, которая использует OpenAI (через langchain-community) и FAISS для RAG.
+    Ретривер учитывает жанровые предпочтения пользователя и ограничения по году/рейтингу,
+    поэтому цепочка собирается под конкретный запрос.
     """
-    retriever = vector_store.as_retriever(search_type="similarity", search_kwargs={"k": 2})
-    chain = RetrievalQA.from_chain_type(llm=llm, chain_type="stuff", retriever=retriever)
+    retriever = create_movie_retriever(current_vector_store(), genres=genres, filters=filters,
+                                       search_query=search_query)
+    chain = RetrievalQA.from_chain_type(llm=get_llm(), chain_type="stuff", retriever=retriever)
     return chain
-
-
-retrieval_chain = create_retrieval_chain()
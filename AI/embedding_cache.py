@@ -0,0 +1,248 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from monitoring import record_cache, span
+
+
+class EmbeddingCache:
+    """
+    Дисковый кэш эмбеддингов с адресацией по содержимому.
+    Ключ - sha256 от имени модели и текста. Векторы лежат в одном файле float32 (vectors.f32),
+    который открывается через np.memmap, а index.json хранит ключ -> (слот, время последнего обращения).
+    При превышении max_entries вытесняются давно не использованные записи (LRU).
+    Все векторы одного каталога кэша одной размерности, поэтому у каждой модели свой каталог (см. cache_path_for).
+    """
+
+    VECTORS_FILE = "vectors.f32"
+    INDEX_FILE = "index.json"
+
+    def __init__(self, path, max_entries=200_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.RLock()
+
+        self.dim = None
+        self.capacity = 0
+        self.clock = 0
+        self.entries = {}  # key -> [slot, last_used]
+        self.vectors = None
+
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def make_key(model, text):
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _vectors_path(self):
+        return os.path.join(self.path, self.VECTORS_FILE)
+
+    def _index_path(self):
+        return os.path.join(self.path, self.INDEX_FILE)
+
+    def _load(self):
+        if not os.path.exists(self._index_path()) or not os.path.exists(self._vectors_path()):
+            return
+
+        with open(self._index_path(), encoding="utf-8") as f:
+            index = json.load(f)
+
+        self.dim = index["dim"]
+        self.capacity = index["capacity"]
+        self.clock = index["clock"]
+        self.entries = index["entries"]
+        self.vectors = np.memmap(self._vectors_path(), dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+
+    def _resize(self, capacity):
+        """Увеличивает файл с векторами до capacity строк и переоткрывает memmap"""
+        if self.vectors is not None:
+            self.vectors.flush()
+            del self.vectors
+
+        with open(self._vectors_path(), "ab") as f:
+            f.truncate(capacity * self.dim * np.dtype(np.float32).itemsize)
+
+        self.capacity = capacity
+        self.vectors = np.memmap(self._vectors_path(), dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _allocate_slots(self, count):
+        """Выделяет count свободных слотов, при необходимости расширяя файл или вытесняя старые записи"""
+        used = {slot for slot, _ in self.entries.values()}
+        free = [slot for slot in range(self.capacity) if slot not in used]
+
+        if len(free) < count and self.capacity < self.max_entries:
+            new_capacity = min(self.max_entries, max(self.capacity * 2, len(self.entries) + count, 1024))
+            free.extend(range(self.capacity, new_capacity))
+            self._resize(new_capacity)
+
+        if len(free) < count:
+            victims = sorted(self.entries.items(), key=lambda item: item[1][1])[:count - len(free)]
+            for key, (slot, _) in victims:
+                del self.entries[key]
+                free.append(slot)
+            # Индекс без вытесненных ключей сохраняется до перезаписи их слотов: иначе после падения процесса
+            # между перезаписью и save() индекс на диске отдавал бы по этим ключам векторы других текстов
+            self.save()
+
+        return free[:count]
+
+    def get_many(self, model, texts):
+        """Возвращает список векторов (или None для промахов) в порядке texts"""
+        result = []
+        with self.lock:
+            self.clock += 1
+            for text in texts:
+                entry = self.entries.get(self.make_key(model, text))
+                if entry is None:
+                    self.misses += 1
+                    result.append(None)
+                    continue
+
+                self.hits += 1
+                entry[1] = self.clock
+                result.append(np.array(self.vectors[entry[0]]).tolist())
+
+        return result
+
+    def put_many(self, model, texts, vectors):
+        if not texts:
+            return
+
+        with self.lock:
+            if self.dim is None:
+                self.dim = len(vectors[0])
+            bad = next((len(vector) for vector in vectors if len(vector) != self.dim), None)
+            if bad is not None:
+                raise ValueError(f"Кэш эмбеддингов '{self.path}' хранит векторы размерности {self.dim}, а модель "
+                                 f"{model} вернула {bad}: у каждой модели должен быть свой каталог кэша")
+
+            # Если записей больше, чем вмещает кэш, сохраняем только последние
+            items = list(zip(texts, vectors))[-self.max_entries:]
+            new_items = [(self.make_key(model, text), vector) for text, vector in items]
+            new_items = [(key, vector) for key, vector in new_items if key not in self.entries]
+            if not new_items:
+                return
+
+            self.clock += 1
+            slots = self._allocate_slots(len(new_items))
+            for (key, vector), slot in zip(new_items, slots):
+                self.vectors[slot] = np.asarray(vector, dtype=np.float32)
+                self.entries[key] = [slot, self.clock]
+
+    def save(self):
+        """Сбрасывает векторы на диск и атомарно перезаписывает индекс"""
+        with self.lock:
+            if self.vectors is None:
+                return
+
+            self.vectors.flush()
+            tmp_path = self._index_path() + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "dim": self.dim,
+                    "capacity": self.capacity,
+                    "clock": self.clock,
+                    "entries": self.entries,
+                }, f)
+            os.replace(tmp_path, self._index_path())
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate(), 4),
+        }
+
+
+def embeddings_model_name(embeddings):
+    return getattr(embeddings, "model", type(embeddings).__name__)
+
+
+def cache_path_for(root, model):
+    """Каталог кэша модели внутри root: смена модели или бэкенда эмбеддингов не смешивает размерности"""
+    return os.path.join(root, re.sub(r"[^A-Za-z0-9._-]+", "_", model))
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Обертка над моделью эмбеддингов: сначала ищет тексты в EmbeddingCache,
+    а промахи отправляет в модель пачками по batch_size, держа до max_workers пачек одновременно.
+    """
+
+    def __init__(self, embeddings, cache, batch_size=256, max_workers=4):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.model = embeddings_model_name(embeddings)
+
+    def embed_documents(self, texts):
+        started_at = time.perf_counter()
+        vectors = self.cache.get_many(self.model, texts)
+
+        # Одинаковые тексты отправляем в модель один раз
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        record_cache("embeddings", "hit", len(texts) - len(missing))
+        record_cache("embeddings", "miss", len(missing))
+        if missing:
+            batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+            with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(batches)))) as executor:
+                batch_vectors = list(executor.map(self.embeddings.embed_documents, batches))
+
+            computed = dict(zip(missing, (vector for batch in batch_vectors for vector in batch)))
+            self.cache.put_many(self.model, missing, [computed[text] for text in missing])
+            self.cache.save()
+            vectors = [vector if vector is not None else computed[text] for text, vector in zip(texts, vectors)]
+
+        print('====> ', 'Эмбеддинги: ', len(texts), ' текстов, из кэша ', len(texts) - len(missing),
+              ', посчитано ', len(missing), ' за ', round(time.perf_counter() - started_at, 2), ' сек, ',
+              'hit rate кэша ', self.cache.stats()["hit_rate"])
+
+        return vectors
+
+    def embed_query(self, text):
+        with span("embeddings.query"):
+            return self.embeddings.embed_query(text)
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Детерминированная локальная замена модели эмбеддингов: вектор строится из хэшей слов текста.
+    Нужна для офлайн-пересборки индекса и тестов без обращения к OpenAI.
+    """
+
+    def __init__(self, dim=256):
+        self.dim = dim
+        self.model = f"hash-{dim}"
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vector[index] += 1.0 if digest[4] % 2 else -1.0
+
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
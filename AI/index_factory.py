@@ -0,0 +1,104 @@
+import os
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+# Тип индекса FAISS: flat (точный), ivf_flat, ivf_pq, hnsw
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+
+DEFAULT_INDEX_PARAMS = {
+    "nlist": int(os.getenv("FAISS_NLIST", "1024")),           # число кластеров IVF
+    "nprobe": int(os.getenv("FAISS_NPROBE", "16")),           # сколько кластеров IVF просматривать при поиске
+    "pq_m": int(os.getenv("FAISS_PQ_M", "64")),               # число подвекторов PQ (размерность должна делиться)
+    "pq_nbits": int(os.getenv("FAISS_PQ_NBITS", "8")),        # бит на код подвектора
+    "hnsw_m": int(os.getenv("FAISS_HNSW_M", "32")),           # число связей вершины в графе HNSW
+    "ef_construction": int(os.getenv("FAISS_EF_CONSTRUCTION", "200")),
+    "ef_search": int(os.getenv("FAISS_EF_SEARCH", "128")),
+}
+
+# Минимум обучающих векторов на кластер, при котором k-means в FAISS не ругается
+MIN_POINTS_PER_CENTROID = 39
+
+
+def index_params(**overrides):
+    params = dict(DEFAULT_INDEX_PARAMS)
+    params.update({key: value for key, value in overrides.items() if value is not None})
+    return params
+
+
+def effective_nlist(nlist, n_vectors):
+    """Число кластеров не больше, чем позволяет объем обучающей выборки"""
+    return max(1, min(nlist, n_vectors // MIN_POINTS_PER_CENTROID))
+
+
+def index_factory_string(index_type, dim, n_vectors, params):
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "ivf_flat":
+        return f"IVF{effective_nlist(params['nlist'], n_vectors)},Flat"
+    if index_type == "ivf_pq":
+        if dim % params["pq_m"]:
+            raise ValueError(f"Размерность {dim} не делится на pq_m={params['pq_m']}")
+        # Для обучения кодовой книги нужно хотя бы 2^nbits векторов
+        pq_nbits = min(params["pq_nbits"], max(1, n_vectors.bit_length() - 1))
+        return f"IVF{effective_nlist(params['nlist'], n_vectors)},PQ{params['pq_m']}x{pq_nbits}"
+    if index_type == "hnsw":
+        return f"HNSW{params['hnsw_m']},Flat"
+    raise ValueError(f"Неизвестный тип индекса FAISS: {index_type}")
+
+
+def apply_search_params(index, **overrides):
+    """Выставляет параметры поиска (nprobe для IVF, efSearch для HNSW), в том числе после загрузки с диска"""
+    params = index_params(**overrides)
+    try:
+        faiss.extract_index_ivf(index).nprobe = params["nprobe"]
+    except RuntimeError:
+        pass
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = params["ef_search"]
+    return index
+
+
+def build_faiss_index(vectors, index_type=FAISS_INDEX_TYPE, **overrides):
+    """Строит индекс FAISS заданного типа; IVF/PQ обучаются на самих векторах каталога"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n_vectors, dim = vectors.shape
+    params = index_params(**overrides)
+
+    index = faiss.index_factory(dim, index_factory_string(index_type, dim, n_vectors, params), faiss.METRIC_L2)
+    if hasattr(index, "hnsw"):
+        index.hnsw.efConstruction = params["ef_construction"]
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+
+    return apply_search_params(index, **overrides)
+
+
+def index_supports_removal(index):
+    """
+    Безопасно удалять векторы можно только из плоского индекса: он уплотняется, и позиции совпадают
+    с перенумерованным index_to_docstore_id в LangChain FAISS.delete. HNSW удаление не поддерживает,
+    а IVF/IVF-PQ после remove_ids сохраняют старые метки - такие индексы при изменениях пересобираются.
+    """
+    return isinstance(index, faiss.IndexFlat)
+
+
+def create_faiss_store(texts, embeddings, metadatas, ids, index_type=FAISS_INDEX_TYPE, **overrides):
+    """Аналог FAISS.from_texts, но с настраиваемым типом индекса"""
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    index = build_faiss_index(vectors, index_type, **overrides)
+
+    docstore = InMemoryDocstore({
+        doc_id: Document(page_content=text, metadata=metadata)
+        for doc_id, text, metadata in zip(ids, texts, metadatas)
+    })
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=dict(enumerate(ids)),
+    )
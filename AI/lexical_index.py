@@ -0,0 +1,231 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+# Файлы лексического индекса в каталоге поколения хранилища (см. AI/mmap_store.py)
+LEXICON_FILE = "lexicon.json"
+POSTINGS_OFFSETS_FILE = "postings.offsets.npy"
+POSTINGS_DOCS_FILE = "postings.docs.npy"
+POSTINGS_WEIGHTS_FILE = "postings.weights.npy"
+DOC_LENGTHS_FILE = "doc_lengths.npy"
+
+# Вес поля: название и актеры важнее для запросов "фильмы с ..." и поиска по названию
+FIELD_WEIGHTS = {"name": 3.0, "actors": 2.0, "countries": 1.0, "description": 1.0}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_RE = re.compile(r"[a-zа-я0-9]+")
+
+# Стеммер Snowball для русского языка (https://snowballstem.org/algorithms/russian/stemmer.html).
+# Окончания из *_AFTER_A групп отрезаются, только если перед ними стоит "а" или "я".
+VOWELS = "аеиоуыэюя"
+PERFECTIVE_GERUND_AFTER_A = ("в", "вши", "вшись")
+PERFECTIVE_GERUND = ("ив", "ивши", "ившись", "ыв", "ывши", "ывшись")
+ADJECTIVE = ("ее", "ие", "ые", "ое", "ими", "ыми", "ей", "ий", "ый", "ой", "ем", "им", "ым", "ом", "его", "ого", "ему",
+             "ому", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею")
+PARTICIPLE_AFTER_A = ("ем", "нн", "вш", "ющ", "щ")
+PARTICIPLE = ("ивш", "ывш", "ующ")
+REFLEXIVE = ("ся", "сь")
+VERB_AFTER_A = ("ла", "на", "ете", "йте", "ли", "й", "л", "ем", "н", "ло", "но", "ет", "ют", "ны", "ть", "ешь",
+                "нно")
+VERB = ("ила", "ыла", "ена", "ейте", "уйте", "ите", "или", "ыли", "ей", "уй", "ил", "ыл", "им", "ым", "ен", "ило",
+        "ыло", "ено", "ят", "ует", "уют", "ит", "ыт", "ены", "ить", "ыть", "ишь", "ую", "ю")
+NOUN = ("а", "ев", "ов", "ие", "ье", "е", "иями", "ями", "ами", "еи", "ии", "и", "ией", "ей", "ой", "ий", "й", "иям",
+        "ям", "ием", "ем", "ам", "ом", "о", "у", "ах", "иях", "ях", "ы", "ь", "ию", "ью", "ю", "ия", "ья", "я")
+SUPERLATIVE = ("ейше", "ейш")
+DERIVATIONAL = ("ость", "ост")
+
+
+def _region_after_vowel_consonant(word, start):
+    for i in range(max(start, 1), len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return i + 1
+    return len(word)
+
+
+def _remove_ending(word, start, endings, endings_after_a=()):
+    """
+    Отрезает самое длинное из окончаний, целиком лежащее в word[start:].
+    Возвращает None, если окончания нет или для окончания из endings_after_a перед ним не "а"/"я".
+    """
+    best = max((ending for ending in endings + endings_after_a
+                if word.endswith(ending) and len(word) - len(ending) >= start), key=len, default=None)
+    if best is None:
+        return None
+    stem = word[:-len(best)]
+    if best in endings_after_a and best not in endings and not (len(stem) > start and stem[-1] in "ая"):
+        return None
+    return stem
+
+
+def stem(word: str) -> str:
+    """Основа русского слова; слова без кириллицы возвращаются как есть"""
+    if not any("а" <= ch <= "я" for ch in word):
+        return word
+
+    rv = next((i + 1 for i, ch in enumerate(word) if ch in VOWELS), len(word))
+    r2 = _region_after_vowel_consonant(word, _region_after_vowel_consonant(word, 1) + 1)
+
+    # Шаг 1: деепричастие, иначе возвратная частица + прилагательное/причастие, глагол или существительное
+    result = _remove_ending(word, rv, PERFECTIVE_GERUND, PERFECTIVE_GERUND_AFTER_A)
+    if result is None:
+        word = _remove_ending(word, rv, REFLEXIVE) or word
+        result = _remove_ending(word, rv, ADJECTIVE)
+        if result is not None:
+            result = _remove_ending(result, rv, PARTICIPLE, PARTICIPLE_AFTER_A) or result
+        else:
+            result = _remove_ending(word, rv, VERB, VERB_AFTER_A)
+            if result is None:
+                result = _remove_ending(word, rv, NOUN)
+    word = result if result is not None else word
+
+    # Шаг 2
+    if word.endswith("и") and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Шаг 3: словообразовательный суффикс в R2
+    word = _remove_ending(word, r2, DERIVATIONAL) or word
+
+    # Шаг 4: двойное "н", превосходная степень, мягкий знак
+    if word.endswith("нн") and len(word) - 1 >= rv:
+        return word[:-1]
+    superlative = _remove_ending(word, rv, SUPERLATIVE)
+    if superlative is not None:
+        return superlative[:-1] if superlative.endswith("нн") else superlative
+    if word.endswith("ь") and len(word) - 1 >= rv:
+        return word[:-1]
+    return word
+
+
+STOP_WORDS = {
+    "и", "в", "во", "на", "с", "со", "про", "о", "об", "по", "для", "из", "от", "до", "за", "к", "у", "а", "но",
+    "не", "что", "как", "это", "мне", "я", "хочу", "посоветуй", "посоветуйте", "порекомендуй", "найди", "покажи",
+    "фильм", "фильмы", "фильмов", "фильмом", "сериал", "сериалы", "сериалов", "кино", "какой", "какие", "где",
+}
+
+
+def tokenize(text: str) -> list:
+    """Токены для индекса и запросов: нижний регистр, ё -> е, без стоп-слов, со стеммингом"""
+    tokens = TOKEN_RE.findall((text or "").lower().replace("ё", "е"))
+    return [stem(token) for token in tokens if token not in STOP_WORDS]
+
+
+def document_terms(document) -> Counter:
+    """Взвешенные частоты термов документа по полям FIELD_WEIGHTS"""
+    metadata = document.metadata
+    fields = {
+        "name": metadata.get("name") or "",
+        "actors": " ".join(metadata.get("actors") or []),
+        "countries": " ".join(metadata.get("countries") or []),
+        "description": document.page_content,
+    }
+    terms = Counter()
+    for field, text in fields.items():
+        for token in tokenize(text):
+            terms[token] += FIELD_WEIGHTS[field]
+    return terms
+
+
+class LexicalIndexBuilder:
+    """Накапливает термы документов по позициям в индексе FAISS и записывает индекс в CSR-массивы"""
+
+    def __init__(self):
+        self.postings = {}  # term -> [(position, weight)]
+        self.doc_lengths = []
+
+    def add(self, position, document):
+        terms = document_terms(document)
+        for term, weight in terms.items():
+            self.postings.setdefault(term, []).append((position, weight))
+        if position >= len(self.doc_lengths):
+            self.doc_lengths.extend([0.0] * (position + 1 - len(self.doc_lengths)))
+        self.doc_lengths[position] = sum(terms.values())
+
+    def save(self, directory):
+        terms = sorted(self.postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            offsets[i + 1] = offsets[i] + len(self.postings[term])
+
+        docs = np.empty(offsets[-1], dtype=np.int32)
+        weights = np.empty(offsets[-1], dtype=np.float32)
+        for i, term in enumerate(terms):
+            postings = self.postings[term]
+            docs[offsets[i]:offsets[i + 1]] = [position for position, _ in postings]
+            weights[offsets[i]:offsets[i + 1]] = [weight for _, weight in postings]
+
+        with open(os.path.join(directory, LEXICON_FILE), "w", encoding="utf-8") as f:
+            json.dump(terms, f, ensure_ascii=False)
+        np.save(os.path.join(directory, POSTINGS_OFFSETS_FILE), offsets)
+        np.save(os.path.join(directory, POSTINGS_DOCS_FILE), docs)
+        np.save(os.path.join(directory, POSTINGS_WEIGHTS_FILE), weights)
+        np.save(os.path.join(directory, DOC_LENGTHS_FILE), np.asarray(self.doc_lengths, dtype=np.float32))
+
+
+class LexicalIndex:
+    """
+    BM25 по названию, актерам, странам и описанию поверх memory-mapped CSR-массивов поколения.
+    В памяти процесса держится только словарь термов.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, LEXICON_FILE), encoding="utf-8") as f:
+            self.term_ids = {term: i for i, term in enumerate(json.load(f))}
+        self.offsets = np.load(os.path.join(directory, POSTINGS_OFFSETS_FILE), mmap_mode="r")
+        self.docs = np.load(os.path.join(directory, POSTINGS_DOCS_FILE), mmap_mode="r")
+        self.weights = np.load(os.path.join(directory, POSTINGS_WEIGHTS_FILE), mmap_mode="r")
+        self.doc_lengths = np.load(os.path.join(directory, DOC_LENGTHS_FILE), mmap_mode="r")
+        self.avg_doc_length = float(self.doc_lengths.mean()) if len(self.doc_lengths) else 0.0
+
+    @classmethod
+    def load(cls, directory):
+        """Индекс поколения или None, если поколение собрано без лексического индекса"""
+        if not os.path.exists(os.path.join(directory, LEXICON_FILE)):
+            return None
+        return cls(directory)
+
+    def search(self, query: str, k: int) -> list:
+        """Список (позиция в индексе FAISS, score BM25) по убыванию score"""
+        term_ids = {self.term_ids[term] for term in tokenize(query) if term in self.term_ids}
+        if not term_ids or not self.avg_doc_length:
+            return []
+
+        n_docs = len(self.doc_lengths)
+        scores = np.zeros(n_docs, dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.docs[start:end]
+            tf = self.weights[start:end]
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[docs] / self.avg_doc_length)
+            # Внутри одного терма позиции уникальны, поэтому прибавление по индексу корректно
+            scores[docs] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(int(position), float(scores[position])) for position in matched]
+
+
+def reciprocal_rank_fusion(rankings, k=60, key=lambda document: document.metadata.get("id"), weights=None):
+    """
+    Объединяет несколько ранжированных списков документов: score = сумма weight / (k + ранг) по спискам
+    (вес списка по умолчанию 1). При равенстве выше документ, раньше встретившийся в первых списках.
+    """
+    weights = weights or [1.0] * len(rankings)
+    scores = {}
+    documents = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, document in enumerate(ranking, start=1):
+            doc_key = key(document)
+            scores[doc_key] = scores.get(doc_key, 0.0) + weight / (k + rank)
+            documents.setdefault(doc_key, document)
+
+    order = sorted(scores, key=lambda doc_key: scores[doc_key], reverse=True)
+    return [documents[doc_key] for doc_key in order]
@@ -0,0 +1,251 @@
+import json
+import logging
+import os
+import shutil
+import threading
+from collections.abc import Mapping
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from AI.index_factory import apply_search_params
+from AI.lexical_index import LexicalIndex, LexicalIndexBuilder
+from AI.similar import SimilarityGraph, build_similarity_graph
+
+logger = logging.getLogger(__name__)
+
+# Формат хранилища на диске, рассчитанный на общий page cache между воркерами uvicorn:
+#
+#     movie_vector_store/
+#         CURRENT                  - имя актуального поколения, подменяется атомарно через os.replace
+#         gen-000001/
+#             index.faiss          - индекс FAISS, открывается с IO_FLAG_MMAP (векторы не копируются в кучу)
+#             docs.bin             - документы подряд: UTF-8 JSON {"page_content": ..., "metadata": ...}
+#             docs.offsets.npy     - int64[n + 1], смещения документов в docs.bin по позиции в индексе
+#             ids.npy              - int64[n], id фильма по позиции в индексе
+#             ids.sorted.npy       - int64[n], отсортированные id для бинарного поиска
+#             ids.positions.npy    - int64[n], позиции в индексе для ids.sorted.npy
+#             lexicon.json, postings.*.npy, doc_lengths.npy - лексический индекс BM25 (AI/lexical_index.py)
+#             similar.*.npy        - граф похожих фильмов в CSR-формате (AI/similar.py)
+
+CURRENT_FILE = "CURRENT"
+INDEX_FILE = "index.faiss"
+DOCS_FILE = "docs.bin"
+OFFSETS_FILE = "docs.offsets.npy"
+IDS_FILE = "ids.npy"
+SORTED_IDS_FILE = "ids.sorted.npy"
+POSITIONS_FILE = "ids.positions.npy"
+
+# Сколько поколений хранить на диске (воркеры могут еще читать предыдущее)
+KEEP_GENERATIONS = int(os.getenv("VECTOR_STORE_KEEP_GENERATIONS", "2"))
+# Как часто воркер проверяет, не опубликовано ли новое поколение (секунды)
+VECTOR_STORE_RELOAD_INTERVAL = float(os.getenv("VECTOR_STORE_RELOAD_INTERVAL", "30"))
+
+
+def read_current_generation(path):
+    try:
+        with open(os.path.join(path, CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def list_generations(path):
+    if not os.path.isdir(path):
+        return []
+    return sorted(name for name in os.listdir(path) if name.startswith("gen-") and not name.endswith(".tmp"))
+
+
+def publish_generation(vector_store, path):
+    """
+    Записывает хранилище новым поколением и атомарно переключает на него CURRENT.
+    Старые поколения сверх KEEP_GENERATIONS удаляются: уже открытые воркерами mmap остаются валидными.
+    """
+    os.makedirs(path, exist_ok=True)
+    generations = list_generations(path)
+    number = int(generations[-1].split("-")[1]) + 1 if generations else 1
+    name = f"gen-{number:06d}"
+    tmp_dir = os.path.join(path, name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    n_vectors = vector_store.index.ntotal
+    ids = np.empty(n_vectors, dtype=np.int64)
+    offsets = np.empty(n_vectors + 1, dtype=np.int64)
+    offsets[0] = 0
+    lexical = LexicalIndexBuilder()
+    kinopoisk_similar = []
+
+    with open(os.path.join(tmp_dir, DOCS_FILE), "wb") as f:
+        for position in range(n_vectors):
+            doc_id = vector_store.index_to_docstore_id[position]
+            document = vector_store.docstore.search(doc_id)
+            lexical.add(position, document)
+            kinopoisk_similar.append(document.metadata.get("similar") or [])
+            record = json.dumps({"page_content": document.page_content, "metadata": document.metadata},
+                                ensure_ascii=False).encode("utf-8")
+            f.write(record)
+            ids[position] = int(doc_id)
+            offsets[position + 1] = offsets[position] + len(record)
+
+    order = np.argsort(ids, kind="stable")
+    np.save(os.path.join(tmp_dir, OFFSETS_FILE), offsets)
+    np.save(os.path.join(tmp_dir, IDS_FILE), ids)
+    np.save(os.path.join(tmp_dir, SORTED_IDS_FILE), ids[order])
+    np.save(os.path.join(tmp_dir, POSITIONS_FILE), order.astype(np.int64))
+    faiss.write_index(vector_store.index, os.path.join(tmp_dir, INDEX_FILE))
+    lexical.save(tmp_dir)
+    build_similarity_graph(vector_store.index, ids, kinopoisk_similar, tmp_dir)
+
+    os.replace(tmp_dir, os.path.join(path, name))
+
+    current_tmp = os.path.join(path, CURRENT_FILE + ".tmp")
+    with open(current_tmp, "w", encoding="utf-8") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(current_tmp, os.path.join(path, CURRENT_FILE))
+
+    for old in list_generations(path)[:-KEEP_GENERATIONS]:
+        shutil.rmtree(os.path.join(path, old), ignore_errors=True)
+
+    print('====> ', 'Опубликовано поколение хранилища ', name, ' (', n_vectors, ' векторов)')
+    return name
+
+
+class MmapDocstore(Docstore):
+    """Docstore только для чтения поверх memory-mapped файлов поколения"""
+
+    def __init__(self, generation_dir):
+        docs_path = os.path.join(generation_dir, DOCS_FILE)
+        # np.memmap не умеет отображать пустой файл
+        if os.path.getsize(docs_path):
+            self.docs = np.memmap(docs_path, dtype=np.uint8, mode="r")
+        else:
+            self.docs = np.empty(0, dtype=np.uint8)
+        self.offsets = np.load(os.path.join(generation_dir, OFFSETS_FILE), mmap_mode="r")
+        self.ids = np.load(os.path.join(generation_dir, IDS_FILE), mmap_mode="r")
+        self.sorted_ids = np.load(os.path.join(generation_dir, SORTED_IDS_FILE), mmap_mode="r")
+        self.positions = np.load(os.path.join(generation_dir, POSITIONS_FILE), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def position(self, doc_id):
+        try:
+            key = int(doc_id)
+        except (TypeError, ValueError):
+            return None
+        i = int(np.searchsorted(self.sorted_ids, key))
+        if i < len(self.sorted_ids) and self.sorted_ids[i] == key:
+            return int(self.positions[i])
+        return None
+
+    def document_at(self, position):
+        record = json.loads(bytes(self.docs[self.offsets[position]:self.offsets[position + 1]]))
+        return Document(id=str(self.ids[position]), page_content=record["page_content"], metadata=record["metadata"])
+
+    def search(self, search):
+        position = self.position(search)
+        if position is None:
+            return f"ID {search} not found."
+        return self.document_at(position)
+
+    def iter_documents(self):
+        for position in range(len(self.ids)):
+            yield self.document_at(position)
+
+
+class PositionToIdMapping(Mapping):
+    """index_to_docstore_id для FAISS без словаря в куче: позиция -> id из ids.npy"""
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def __getitem__(self, position):
+        if not 0 <= position < len(self.ids):
+            raise KeyError(position)
+        return str(self.ids[position])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(range(len(self.ids)))
+
+
+def load_generation(path, embeddings, name=None, mmap=True):
+    """
+    Загружает поколение хранилища.
+    mmap=True - для обслуживания запросов: индекс и документы отображаются в память и делятся между процессами.
+    mmap=False - изменяемая копия в куче для инкрементальной синхронизации.
+    """
+    name = name or read_current_generation(path)
+    if name is None:
+        raise FileNotFoundError(f"В '{path}' нет опубликованного поколения хранилища")
+    generation_dir = os.path.join(path, name)
+    index_path = os.path.join(generation_dir, INDEX_FILE)
+
+    if mmap:
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+        index = apply_search_params(faiss.read_index(index_path, flags))
+        docstore = MmapDocstore(generation_dir)
+        vector_store = FAISS(embedding_function=embeddings, index=index, docstore=docstore,
+                             index_to_docstore_id=PositionToIdMapping(docstore.ids))
+        # Гибридный поиск в MovieRetriever использует лексический индекс, если поколение собрано с ним
+        vector_store.lexical_index = LexicalIndex.load(generation_dir)
+        vector_store.similarity_graph = SimilarityGraph.load(generation_dir)
+        return vector_store
+
+    index = apply_search_params(faiss.read_index(index_path))
+    mmap_docstore = MmapDocstore(generation_dir)
+    documents = {str(document.id): document for document in mmap_docstore.iter_documents()}
+    return FAISS(embedding_function=embeddings, index=index, docstore=InMemoryDocstore(documents),
+                 index_to_docstore_id={position: str(doc_id) for position, doc_id in enumerate(mmap_docstore.ids)})
+
+
+class GenerationalVectorStore:
+    """
+    Держит открытым текущее поколение хранилища. Фоновый поток раз в VECTOR_STORE_RELOAD_INTERVAL секунд
+    проверяет CURRENT и загружает новое поколение, опубликованное сборкой индекса, без рестарта воркера.
+    current() вызывается из асинхронных обработчиков и только возвращает ссылку, без обращения к диску:
+    подмена ссылки атомарна, а запрос, уже получивший старое поколение, дорабатывает с ним.
+    """
+
+    def __init__(self, path, embeddings, reload_interval=VECTOR_STORE_RELOAD_INTERVAL):
+        self.path = path
+        self.embeddings = embeddings
+        self.reload_interval = reload_interval
+        self.generation = read_current_generation(path)
+        self.store = load_generation(path, embeddings, self.generation)
+        self.stopped = threading.Event()
+        self.thread = None
+        if reload_interval > 0:
+            self.thread = threading.Thread(target=self._watch, name="vector_store_reload", daemon=True)
+            self.thread.start()
+
+    def _watch(self):
+        while not self.stopped.wait(self.reload_interval):
+            self.reload()
+
+    def reload(self):
+        """Загружает новое поколение, если CURRENT изменился; вызывается из фонового потока"""
+        try:
+            generation = read_current_generation(self.path)
+            if generation and generation != self.generation:
+                store = load_generation(self.path, self.embeddings, generation)
+                self.store = store
+                self.generation = generation
+                logger.info(f"Векторное хранилище переключено на поколение {generation}")
+        except Exception as e:
+            logger.error(f"Не удалось загрузить новое поколение хранилища: {e}")
+
+    def current(self):
+        return self.store
+
+    def close(self):
+        self.stopped.set()
@@ -0,0 +1,160 @@
+import os
+from typing import Dict, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+
+from AI.lexical_index import reciprocal_rank_fusion
+from monitoring import span
+
+RETRIEVER_K = int(os.getenv("RETRIEVER_K", "4"))
+RETRIEVER_FETCH_K = int(os.getenv("RETRIEVER_FETCH_K", "50"))
+RETRIEVER_MAX_FETCH_K = int(os.getenv("RETRIEVER_MAX_FETCH_K", "800"))
+# Насколько поднимать в выдаче фильм за каждый любимый жанр и за рейтинг Кинопоиска
+RETRIEVER_FAVORITE_BOOST = float(os.getenv("RETRIEVER_FAVORITE_BOOST", "0.05"))
+RETRIEVER_RATING_BOOST = float(os.getenv("RETRIEVER_RATING_BOOST", "0.01"))
+# Сколько кандидатов брать из лексического индекса (BM25) и константа reciprocal-rank fusion
+RETRIEVER_LEXICAL_K = int(os.getenv("RETRIEVER_LEXICAL_K", "50"))
+RETRIEVER_RRF_K = int(os.getenv("RETRIEVER_RRF_K", "60"))
+# Вес списка BM25 в fusion: больше 1, чтобы единственное точное совпадение по названию или актеру
+# выигрывало у первого векторного результата, а не делило с ним место
+RETRIEVER_LEXICAL_WEIGHT = float(os.getenv("RETRIEVER_LEXICAL_WEIGHT", "1.2"))
+# Сколько похожих фильмов (из графа AI/similar.py) лучшего результата добавлять в контекст RetrievalQA
+RETRIEVER_SIMILAR_K = int(os.getenv("RETRIEVER_SIMILAR_K", "2"))
+
+
+def normalize_genres(genres) -> set:
+    return {genre.strip().lower() for genre in genres or []}
+
+
+class MovieRetriever(BaseRetriever):
+    """
+    Ретривер с учетом метаданных фильмов.
+    Делает поиск ближайших соседей с запасом (fetch_k), жестко отбрасывает фильмы с нелюбимыми жанрами
+    и не подходящие по году/рейтингу, затем переранжирует кандидатов: близость описания
+    плюс бонус за любимые жанры и рейтинг. Если после фильтрации кандидатов меньше k, запас увеличивается.
+    Если у хранилища есть лексический индекс, результаты BM25 по названию, актерам, странам и описанию
+    объединяются с векторными через reciprocal-rank fusion: запросы с названием фильма или именем актера
+    находятся без веб-поиска. К результатам добавляются похожие на лучший фильм из предрасчитанного графа.
+    """
+
+    vector_store: VectorStore
+    k: int = RETRIEVER_K
+    fetch_k: int = RETRIEVER_FETCH_K
+    max_fetch_k: int = RETRIEVER_MAX_FETCH_K
+
+    favorite_genres: List[str] = []
+    hated_genres: List[str] = []
+    year_from: Optional[int] = None
+    year_to: Optional[int] = None
+    min_rating_kp: Optional[float] = None
+    min_rating_imdb: Optional[float] = None
+
+    favorite_boost: float = RETRIEVER_FAVORITE_BOOST
+    rating_boost: float = RETRIEVER_RATING_BOOST
+    lexical_k: int = RETRIEVER_LEXICAL_K
+    rrf_k: int = RETRIEVER_RRF_K
+    lexical_weight: float = RETRIEVER_LEXICAL_WEIGHT
+    similar_k: int = RETRIEVER_SIMILAR_K
+
+    # Если задан, поиск идет по этому тексту, а не по полному промпту цепочки
+    search_query: Optional[str] = None
+
+    def matches(self, metadata: dict) -> bool:
+        """Жесткие ограничения: нелюбимые жанры, год и минимальный рейтинг"""
+        hated = normalize_genres(self.hated_genres)
+        if hated & normalize_genres(metadata.get("genres")):
+            return False
+
+        year = metadata.get("year")
+        if self.year_from is not None and (year is None or year < self.year_from):
+            return False
+        if self.year_to is not None and (year is None or year > self.year_to):
+            return False
+
+        if self.min_rating_kp is not None and (metadata.get("rating_kp") or 0) < self.min_rating_kp:
+            return False
+        if self.min_rating_imdb is not None and (metadata.get("rating_imdb") or 0) < self.min_rating_imdb:
+            return False
+
+        return True
+
+    def rank_score(self, document: Document, distance: float) -> float:
+        """Чем больше, тем выше в выдаче; distance - расстояние FAISS (меньше - ближе)"""
+        favorite = normalize_genres(self.favorite_genres)
+        favorite_hits = len(favorite & normalize_genres(document.metadata.get("genres")))
+        rating = document.metadata.get("rating_kp") or 0
+        return -distance + self.favorite_boost * favorite_hits + self.rating_boost * rating
+
+    def search(self, query: str) -> List[Document]:
+        fetch_k = max(self.fetch_k, self.k)
+        total = getattr(getattr(self.vector_store, "index", None), "ntotal", None)
+
+        while True:
+            candidates = self.vector_store.similarity_search_with_score(
+                query, k=fetch_k, fetch_k=fetch_k, filter=self.matches,
+            )
+            exhausted = total is not None and fetch_k >= total
+            if len(candidates) >= self.k * 2 or exhausted or fetch_k >= self.max_fetch_k:
+                break
+            fetch_k = min(fetch_k * 4, self.max_fetch_k)
+
+        candidates.sort(key=lambda item: self.rank_score(*item), reverse=True)
+        vector_documents = [document for document, _ in candidates]
+
+        lexical_index = getattr(self.vector_store, "lexical_index", None)
+        if lexical_index is None:
+            return self.with_similar(vector_documents[:self.k])
+
+        with span("retriever.lexical"):
+            lexical_documents = self.lexical_search(lexical_index, query)
+        fused = reciprocal_rank_fusion([vector_documents, lexical_documents], self.rrf_k,
+                                       weights=[1.0, self.lexical_weight])
+        return self.with_similar(fused[:self.k])
+
+    def with_similar(self, documents: List[Document]) -> List[Document]:
+        """Дополняет результаты похожими на первый фильм из графа (для запросов вида "что-то вроде ...")"""
+        graph = getattr(self.vector_store, "similarity_graph", None)
+        if graph is None or not documents or self.similar_k <= 0:
+            return documents
+
+        position = self.vector_store.docstore.position(documents[0].metadata.get("id"))
+        if position is None:
+            return documents
+
+        seen = {document.metadata.get("id") for document in documents}
+        similar = []
+        for neighbor, _ in graph.neighbors_of(position):
+            document = self.vector_store.docstore.document_at(neighbor)
+            if document.metadata.get("id") not in seen and self.matches(document.metadata):
+                similar.append(document)
+                if len(similar) >= self.similar_k:
+                    break
+        return documents + similar
+
+    def lexical_search(self, lexical_index, query: str) -> List[Document]:
+        """Кандидаты BM25 с теми же жесткими ограничениями, что и у векторного поиска"""
+        documents = []
+        for position, _ in lexical_index.search(query, self.lexical_k):
+            document = self.vector_store.docstore.document_at(position)
+            if self.matches(document.metadata):
+                documents.append(document)
+        return documents
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        with span("retriever.search"):
+            return self.search(self.search_query or query)
+
+
+def create_movie_retriever(vector_store, genres: Optional[Dict[str, List[str]]] = None,
+                           filters: Optional[dict] = None, search_query: Optional[str] = None) -> MovieRetriever:
+    genres = genres or {}
+    return MovieRetriever(
+        vector_store=vector_store,
+        favorite_genres=genres.get("favorite", []),
+        hated_genres=genres.get("hated", []),
+        search_query=search_query,
+        **{key: value for key, value in (filters or {}).items() if value is not None},
+    )
@@ -0,0 +1,121 @@
+import os
+
+import faiss
+import numpy as np
+
+from AI.retriever import normalize_genres
+
+# Файлы графа похожих фильмов в каталоге поколения хранилища (см. AI/mmap_store.py)
+SIMILAR_OFFSETS_FILE = "similar.offsets.npy"
+SIMILAR_NEIGHBORS_FILE = "similar.neighbors.npy"
+SIMILAR_SCORES_FILE = "similar.scores.npy"
+
+# Сколько ближайших соседей по эмбеддингам хранить для каждого фильма
+SIMILAR_K = int(os.getenv("SIMILAR_K", "30"))
+SIMILAR_BATCH_SIZE = int(os.getenv("SIMILAR_BATCH_SIZE", "1024"))
+# Прибавка к score для связей из similarMovies Кинопоиска: редакционные связи важнее близости описаний
+KINOPOISK_EDGE_BONUS = float(os.getenv("SIMILAR_KINOPOISK_EDGE_BONUS", "1.0"))
+# Прибавка к score за каждый любимый жанр соседа: поднимает его среди близких по score, но не над почти дублями
+SIMILAR_FAVORITE_BOOST = float(os.getenv("SIMILAR_FAVORITE_BOOST", "0.05"))
+
+
+def searchable_copy(index):
+    """
+    Индекс, из которого можно восстанавливать векторы. IVF требует прямой карты позиций; она строится
+    на копии, потому что make_direct_map на индексе хранилища запретил бы последующий remove_ids.
+    """
+    try:
+        index.reconstruct(0)
+        return index
+    except RuntimeError:
+        index = faiss.clone_index(index)
+        faiss.extract_index_ivf(index).make_direct_map()
+        return index
+
+
+def build_similarity_graph(index, ids, kinopoisk_similar, directory, k=SIMILAR_K, batch_size=SIMILAR_BATCH_SIZE):
+    """
+    Граф похожих фильмов в CSR-формате по позициям индекса FAISS:
+    k ближайших соседей каждого фильма (пакетный поиск по всему каталогу) плюс связи similarMovies Кинопоиска.
+    Score соседа - 1 / (1 + расстояние L2); у связей Кинопоиска к нему прибавляется KINOPOISK_EDGE_BONUS.
+    """
+    n_vectors = index.ntotal
+    if n_vectors:
+        index = searchable_copy(index)
+    position_by_id = {int(doc_id): position for position, doc_id in enumerate(ids)}
+    search_k = min(k + 1, n_vectors)
+
+    offsets = np.zeros(n_vectors + 1, dtype=np.int64)
+    neighbors, scores = [], []
+
+    for start in range(0, n_vectors, batch_size):
+        count = min(batch_size, n_vectors - start)
+        distances, found = index.search(index.reconstruct_n(start, count), search_k)
+
+        for row in range(count):
+            position = start + row
+            edges = {}
+            for neighbor, distance in zip(found[row], distances[row]):
+                if neighbor >= 0 and neighbor != position:
+                    edges[int(neighbor)] = 1 / (1 + max(float(distance), 0.0))
+
+            for similar_id in kinopoisk_similar[position]:
+                neighbor = position_by_id.get(int(similar_id))
+                if neighbor is not None and neighbor != position:
+                    edges[neighbor] = edges.get(neighbor, 0.0) + KINOPOISK_EDGE_BONUS
+
+            ranked = sorted(edges.items(), key=lambda item: item[1], reverse=True)
+            neighbors.extend(neighbor for neighbor, _ in ranked)
+            scores.extend(score for _, score in ranked)
+            offsets[position + 1] = offsets[position] + len(ranked)
+
+    np.save(os.path.join(directory, SIMILAR_OFFSETS_FILE), offsets)
+    np.save(os.path.join(directory, SIMILAR_NEIGHBORS_FILE), np.asarray(neighbors, dtype=np.int32))
+    np.save(os.path.join(directory, SIMILAR_SCORES_FILE), np.asarray(scores, dtype=np.float32))
+
+
+class SimilarityGraph:
+    """Граф похожих фильмов поверх memory-mapped CSR-массивов поколения"""
+
+    def __init__(self, directory):
+        self.offsets = np.load(os.path.join(directory, SIMILAR_OFFSETS_FILE), mmap_mode="r")
+        self.neighbors = np.load(os.path.join(directory, SIMILAR_NEIGHBORS_FILE), mmap_mode="r")
+        self.scores = np.load(os.path.join(directory, SIMILAR_SCORES_FILE), mmap_mode="r")
+
+    @classmethod
+    def load(cls, directory):
+        """Граф поколения или None, если поколение собрано без него"""
+        if not os.path.exists(os.path.join(directory, SIMILAR_OFFSETS_FILE)):
+            return None
+        return cls(directory)
+
+    def neighbors_of(self, position):
+        """Список (позиция соседа, score) по убыванию score"""
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return list(zip(self.neighbors[start:end].tolist(), self.scores[start:end].tolist()))
+
+
+def find_similar_movies(vector_store, movie_id, favorite_genres=(), hated_genres=(), limit=10,
+                        favorite_boost=SIMILAR_FAVORITE_BOOST):
+    """
+    Похожие фильмы из предрасчитанного графа без обращения к LLM: фильмы с нелюбимыми жанрами отбрасываются,
+    к score фильмов с любимыми жанрами прибавляется favorite_boost за каждый жанр (как rank_score в ретривере).
+    Возвращает None, если фильма нет в каталоге или графа нет. Результат - список (Document, score из графа).
+    """
+    graph = getattr(vector_store, "similarity_graph", None)
+    position = vector_store.docstore.position(movie_id) if graph is not None else None
+    if position is None:
+        return None
+
+    favorite = normalize_genres(favorite_genres)
+    hated = normalize_genres(hated_genres)
+    results = []
+    for neighbor, score in graph.neighbors_of(position):
+        document = vector_store.docstore.document_at(neighbor)
+        genres = normalize_genres(document.metadata.get("genres"))
+        if genres & hated:
+            continue
+        results.append((document, score, score + favorite_boost * len(genres & favorite)))
+
+    results.sort(key=lambda item: item[2], reverse=True)
+    return [(document, score) for document, score, _ in results[:limit]]
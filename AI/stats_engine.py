@@ -0,0 +1,125 @@
+from typing import Dict, List, Optional
+
+from AI.lexical_index import TOKEN_RE, stem
+from AI.tools import format_movie_stats
+from DB.db import aensure_fresh_genre_stats, aget_movies_stats_by_genres, genre_stats_cache
+
+# Признаки того, что пользователь просит статистику
+STATS_MARKERS = ("статистик", "средний рейтинг", "среднего рейтинга", "средняя оценка", "среднюю оценку",
+                 "средний балл", "количеств", "сколько фильм", "сколько сериал", "число фильм")
+
+# Вопросы, на которые шаблон не отвечает (сравнения, рейтинги жанров, разрезы по годам) - их разбирает агент
+OPEN_ENDED_MARKERS = ("какой жанр", "какие жанр", "каких жанр", "самый", "самые", "самого", "лучш", "худш",
+                      "сравн", "по годам", "в каком году", "топ-", "топ ", "больше всего", "меньше всего")
+
+# Разговорные названия жанров -> названия жанров Кинопоиска (сравниваются по основам целых слов, как названия жанров)
+GENRE_SYNONYMS = {
+    "ужастик": "ужасы",
+    "хоррор": "ужасы",
+    "horror": "ужасы",
+    "комедийный": "комедия",
+    "comedy": "комедия",
+    "экшн": "боевик",
+    "экшен": "боевик",
+    "action": "боевик",
+    "научная фантастика": "фантастика",
+    "научно-фантастический": "фантастика",
+    "sci-fi": "фантастика",
+    "романтический": "мелодрама",
+    "романтика": "мелодрама",
+    "ромком": "мелодрама",
+    "мультик": "мультфильм",
+    "мультфильм": "мультфильм",
+    "анимация": "мультфильм",
+    "анимационный": "мультфильм",
+    "аниме": "аниме",
+    "фэнтези": "фэнтези",
+    "фентези": "фэнтези",
+    "детектив": "детектив",
+    "детективный": "детектив",
+    "криминал": "криминал",
+    "криминальный": "криминал",
+    "документальный": "документальный",
+    "документалка": "документальный",
+    "военный": "военный",
+    "про войну": "военный",
+    "биография": "биография",
+    "биографический": "биография",
+    "байопик": "биография",
+    "мюзикл": "мюзикл",
+    "вестерн": "вестерн",
+    "семейный": "семейный",
+    "триллер": "триллер",
+}
+
+
+def phrase_terms(text: str) -> list:
+    """
+    Основы слов запроса для сравнения с жанрами. В отличие от tokenize, стоп-слова не отбрасываются,
+    чтобы фраза "про войну" не совпадала со "звездные войны".
+    """
+    return [stem(token) for token in TOKEN_RE.findall(text.lower().replace("ё", "е"))]
+
+
+def contains_phrase(query_terms: list, phrase: str) -> bool:
+    """
+    Есть ли в запросе фраза целыми словами подряд. Слово фразы совпадает с основой слова запроса или само
+    является ею: стеммер иногда режет словарную форму сильнее косвенных (детектив -> детект, детективы -> детектив).
+    """
+    words = TOKEN_RE.findall(phrase.lower().replace("ё", "е"))
+    if not words:
+        return False
+    variants = [{stem(word), word} for word in words]
+    return any(all(query_terms[start + i] in variants[i] for i in range(len(words)))
+               for start in range(len(query_terms) - len(words) + 1))
+
+
+def is_stats_request(text: str) -> bool:
+    return any(marker in text for marker in STATS_MARKERS)
+
+
+def is_open_ended(text: str) -> bool:
+    return any(marker in text for marker in OPEN_ENDED_MARKERS)
+
+
+def detect_genres(text: str, vocabulary=None) -> List[str]:
+    """
+    Находит в тексте жанры: формы названий жанров каталога ("комедии", "ужасов") и синонимы ("хоррор").
+    Сравниваются основы целых слов (стеммер лексического индекса), а не префиксы: "исторический" не означает
+    жанр "история". Синонимы учитываются, только если такой жанр есть в каталоге (когда словарь каталога загружен).
+    """
+    vocabulary = genre_stats_cache.vocabulary if vocabulary is None else vocabulary
+    terms = phrase_terms(text)
+    found = [genre for genre in sorted(vocabulary) if contains_phrase(terms, genre)]
+
+    for synonym, genre in GENRE_SYNONYMS.items():
+        if contains_phrase(terms, synonym) and (not vocabulary or genre in vocabulary):
+            found.append(genre)
+
+    return list(dict.fromkeys(found))
+
+
+def preference_genres(genres: Dict[str, List[str]]) -> List[str]:
+    return [genre.strip().lower() for genre in genres.get("favorite", []) + genres.get("hated", []) if genre.strip()]
+
+
+async def answer_stats(user_query: str, genres: Dict[str, List[str]]) -> Optional[str]:
+    """
+    Детерминированный ответ на запрос статистики без LLM:
+      ''   - статистика не нужна (большинство запросов, без обращения к БД);
+      str  - статистика по жанрам из запроса (или, если их нет, из предпочтений) одним запросом к БД;
+      None - открытый статистический вопрос, который нужно передать агенту статистики.
+    """
+    text = user_query.lower()
+    if not is_stats_request(text):
+        return ''
+    if is_open_ended(text):
+        return None
+
+    # Словарь жанров мог устареть после загрузки каталога другим процессом
+    await aensure_fresh_genre_stats()
+    requested = detect_genres(text) or preference_genres(genres)
+    if not requested:
+        return None
+
+    return format_movie_stats(await aget_movies_stats_by_genres(requested))
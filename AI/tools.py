@@ -1,11 +1,239 @@
+import asyncio
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any
+
 from langchain_community.utilities.tavily_search import TavilySearchAPIWrapper
 from langchain_community.tools.tavily_search.tool import TavilySearchResults
 from langchain.agents import Tool
+from langchain_core.tools import BaseTool
+
+from DB.db import aget_movies_stats_by_genres, get_movies_stats_by_genres
+from monitoring import record_cache, span
+from registry import registry
+from setup import require_env
+
+logger = logging.getLogger(__name__)
+
+# Кэш результатов веб-поиска по нормализованному запросу
+WEB_SEARCH_CACHE_TTL = float(os.getenv("WEB_SEARCH_CACHE_TTL", "1800"))
+WEB_SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("WEB_SEARCH_CACHE_MAX_ENTRIES", "2000"))
+# Сколько запросов к провайдеру поиска выполняется одновременно, остальные ждут в очереди
+WEB_SEARCH_CONCURRENCY = int(os.getenv("WEB_SEARCH_CONCURRENCY", "4"))
+# Circuit breaker: после стольких ошибок или медленных ответов подряд веб-поиск отключается на WEB_SEARCH_RESET_TIMEOUT
+WEB_SEARCH_FAILURE_THRESHOLD = int(os.getenv("WEB_SEARCH_FAILURE_THRESHOLD", "5"))
+WEB_SEARCH_RESET_TIMEOUT = float(os.getenv("WEB_SEARCH_RESET_TIMEOUT", "30"))
+WEB_SEARCH_SLOW_CALL = float(os.getenv("WEB_SEARCH_SLOW_CALL", "8"))
+
+
+def create_tavily_tool():
+    search = TavilySearchAPIWrapper(tavily_api_key=require_env("TAVILY_API_KEY"))
+    return TavilySearchResults(api_wrapper=search, max_results=10, include_answer=True)
+
+
+# Без ключа Tavily сервис продолжает работать, только без веб-поиска
+registry.register("tavily_tool", create_tavily_tool, required=False)
+
+
+def get_tavily_tool():
+    return registry.get("tavily_tool")
+
+
+class SearchUnavailable(Exception):
+    """Веб-поиск отключен circuit breaker'ом или провайдер вернул ошибку"""
+
+
+class CircuitBreaker:
+    """
+    Размыкается после failure_threshold ошибок подряд и reset_timeout секунд отклоняет вызовы сразу.
+    Затем пропускает один пробный вызов (half-open): успех замыкает цепь, ошибка снова размыкает.
+    """
+
+    def __init__(self, failure_threshold=WEB_SEARCH_FAILURE_THRESHOLD, reset_timeout=WEB_SEARCH_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+        self.lock = threading.Lock()
+
+    def is_open(self):
+        """Разомкнута ли цепь (без пробного вызова) - для быстрого пропуска стадии веб-поиска"""
+        with self.lock:
+            return self.opened_at is not None and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probe_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.probe_in_flight:
+                    logger.warning(f"Веб-поиск отключен на {self.reset_timeout} сек после {self.failures} ошибок")
+                self.opened_at = time.monotonic()
+            self.probe_in_flight = False
+
+
+def normalize_search_query(query: str) -> str:
+    query = query.lower().replace("ё", "е")
+    return re.sub(r"\s+", " ", query).strip(" .,!?;:\"'")
+
+
+class WebSearchGuard:
+    """
+    Защита провайдера веб-поиска от всплесков fallback'ов:
+      - результаты кэшируются по нормализованному запросу на WEB_SEARCH_CACHE_TTL;
+      - одинаковые одновременные запросы ждут один вызов провайдера (single-flight);
+      - к провайдеру одновременно идет не больше WEB_SEARCH_CONCURRENCY запросов (отдельный пул потоков);
+      - при ошибках или медленных ответах circuit breaker на время отключает поиск.
+    Вызов провайдера доводится до конца в пуле потоков, даже если запрос, который его начал, отменен по таймауту:
+    результат достанется ожидающим и попадет в кэш.
+    """
+
+    def __init__(self, ttl=WEB_SEARCH_CACHE_TTL, max_entries=WEB_SEARCH_CACHE_MAX_ENTRIES,
+                 concurrency=WEB_SEARCH_CONCURRENCY, slow_call=WEB_SEARCH_SLOW_CALL, breaker=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.slow_call = slow_call
+        self.breaker = breaker or CircuitBreaker()
+        self.results = OrderedDict()  # key -> (result, expires_at)
+        self.in_flight = {}  # key -> Future
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="web_search")
+
+    def _cached(self, key):
+        entry = self.results.get(key)
+        if entry is None:
+            return None
+        if entry[1] < time.monotonic():
+            del self.results[key]
+            return None
+        self.results.move_to_end(key)
+        return entry[0]
+
+    def _store(self, key, result):
+        with self.lock:
+            self.results[key] = (result, time.monotonic() + self.ttl)
+            self.results.move_to_end(key)
+            while len(self.results) > self.max_entries:
+                self.results.popitem(last=False)
+
+    def submit(self, tool, query: str) -> Future:
+        """Future с результатом поиска: из кэша, уже идущего вызова или нового вызова провайдера"""
+        key = normalize_search_query(query)
+        with self.lock:
+            cached = self._cached(key)
+            if cached is not None:
+                record_cache("web_search", "hit")
+                future = Future()
+                future.set_result(cached)
+                return future
 
-from DB.db import get_movies_stats_by_genres
+            future = self.in_flight.get(key)
+            if future is not None:
+                record_cache("web_search", "coalesced")
+                return future
 
-search = TavilySearchAPIWrapper()
-tavily_tool = TavilySearchResults(api_wrapper=search, max_results=10, include_answer=True)
+            if not self.breaker.allow():
+                record_cache("web_search", "rejected")
+                raise SearchUnavailable("Веб-поиск временно отключен после ошибок провайдера")
+
+            future = self.in_flight[key] = Future()
+
+        record_cache("web_search", "miss")
+        self.executor.submit(contextvars.copy_context().run, self._fetch, tool, key, query, future)
+        return future
+
+    def _fetch(self, tool, key, query, future):
+        started_at = time.perf_counter()
+        try:
+            with span("tool.web_search"):
+                result = tool.invoke(query)
+                # TavilySearchResults не бросает исключения, а возвращает текст ошибки вместо списка результатов
+                if isinstance(result, str):
+                    raise SearchUnavailable(result)
+        except Exception as e:
+            self.breaker.record_failure()
+            with self.lock:
+                self.in_flight.pop(key, None)
+            if not future.cancelled():
+                future.set_exception(e)
+            return
+
+        # Медленный ответ полезен, но для breaker'а считается сбоем: провайдер деградирует
+        if time.perf_counter() - started_at > self.slow_call:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+        self._store(key, result)
+        with self.lock:
+            self.in_flight.pop(key, None)
+        if not future.cancelled():
+            future.set_result(result)
+
+    def search(self, tool, query: str):
+        return self.submit(tool, query).result()
+
+    async def asearch(self, tool, query: str):
+        # Future общий для всех ожидающих этот запрос: shield не дает таймауту стадии одного запроса
+        # отменить его для остальных (иначе они получат CancelledError вместо результата)
+        return await asyncio.shield(asyncio.wrap_future(self.submit(tool, query)))
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+web_search_guard = WebSearchGuard()
+
+
+def web_search_available():
+    return not web_search_guard.breaker.is_open()
+
+
+class GuardedSearchTool(BaseTool):
+    """Инструмент веб-поиска для агента: тот же интерфейс, что у Tavily, но вызовы идут через WebSearchGuard"""
+
+    name: str = "tavily_search_results_json"
+    description: str = ""
+    tool: Any = None
+
+    def _run(self, query: str, run_manager=None):
+        return web_search_guard.search(self.tool, query)
+
+    async def _arun(self, query: str, run_manager=None):
+        return await web_search_guard.asearch(self.tool, query)
+
+
+def create_web_search_tool():
+    tool = get_tavily_tool()
+    return GuardedSearchTool(name=tool.name, description=tool.description, tool=tool)
+
+
+registry.register("web_search_tool", create_web_search_tool, required=False)
+
+
+def get_web_search_tool():
+    return registry.get("web_search_tool")
 
 
 #################################################################
@@ -16,30 +244,51 @@ tavily_tool = TavilySearchResults(api_wrapper=search, max_results=10, include_an
 #################################################################
 
 
-def compute_movie_stats(genre: str) -> str:
+def parse_genres(genres: str) -> list:
+    return [genre.strip() for genre in genres.split(',') if genre.strip()]
+
+
+def compute_movie_stats(genres: str) -> str:
     """
-    Функция принимает жанр и возвращает строку с количеством фильмов и средним рейтингом.
-    Фильтрация осуществляется по вхождению жанра в поле 'genre'.
+    Функция принимает жанр (или несколько жанров через запятую) и возвращает строку
+    с количеством фильмов и средним рейтингом по каждому жанру.
+    Статистика по всем жанрам считается одним запросом к агрегатам в БД.
     """
+    with span("tool.movie_stats"):
+        return format_movie_stats(get_movies_stats_by_genres(parse_genres(genres)))
+
+
+async def acompute_movie_stats(genres: str) -> str:
+    """
+    Асинхронная версия compute_movie_stats: запрос к БД выполняется в пуле потоков БД, не блокируя event loop.
+    """
+    with span("tool.movie_stats"):
+        return format_movie_stats(await aget_movies_stats_by_genres(parse_genres(genres)))
+
 
-    stats = get_movies_stats_by_genres(genre)
+def format_movie_stats(stats_by_genre: dict) -> str:
+    lines = []
+    for genre, stats in stats_by_genre.items():
+        if stats['movie_count'] == 0:
+            lines.append(f"По жанру '{genre}' не найдено фильмов.")
+            continue
 
-    if stats['movie_count'] == 0:
-        return f"По жанру '{genre}' не найдено фильмов."
+        lines.append(f"По жанру '{genre}' найдено {stats['movie_count']} фильмов, средний рейтинг по кинопоиску: "
+                     f"{stats['avg_rating_kp']}, средний рейтинг по IMDB: {stats['avg_rating_imdb']}")
 
-    return (f"По жанру '{genre}' найдено {stats['movie_count']} фильмов, средний рейтинг по кинопоиску: {stats['avg_rating_kp']}, "
-            f"средний рейтинг по IMDB: {stats['avg_rating_imdb']}")
+    return '\n'.join(lines)
 
 
 # Создаём tool для получения статистики
 movie_stats_tool = Tool(
     name="MovieStatsTool",
     func=compute_movie_stats,
+    coroutine=acompute_movie_stats,
     description=(
-        "Принимает в качестве входных данных название жанра и возвращает количество фильмов "
-        "и средний рейтинг для этого жанра по кинопоиску и по IMDB. Если в запросе пользователя присутствуют слова "
+        "Принимает в качестве входных данных название жанра или несколько жанров через запятую и возвращает "
+        "количество фильмов и средний рейтинг для каждого жанра по кинопоиску и по IMDB. Если в запросе пользователя присутствуют слова "
         "'статистика', 'средний рейтинг', 'количество фильмов' или упоминания жанров, связанных с "
         "агрегированием, вызовите этот инструмент с нужным жанром. "
-        "Если запрос подразумевает агрегирование по нескольким жанрам, можно вызывать инструмент для каждого жанра."
+        "Если запрос подразумевает агрегирование по нескольким жанрам, передайте их все в одном вызове через запятую."
     )
 )
@@ -1,34 +1,84 @@
-import asyncio
+import hashlib
+import json
 import os
 
 from langchain_openai.embeddings import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
 
+from AI.index_factory import create_faiss_store, index_supports_removal
+from AI.mmap_store import GenerationalVectorStore, load_generation, publish_generation, read_current_generation
+from AI.embedding_cache import (CachedEmbeddings, EmbeddingCache, HashEmbeddings, cache_path_for,
+                                embeddings_model_name)
 from DB.db import add_movies_from_metadata
-from external_api.api import get_movies
-from setup import openai_api_key
+from external_api.api import MOVIES_QUERY, get_movies
+from external_api.snapshot import CATALOG_SNAPSHOT_PATH, SnapshotWriter, iter_snapshot_movies, read_manifest
+from registry import registry
+from setup import require_env
 
 
 #########################################
 # Часть 1. Настройка Retrieval с LangChain #
 #########################################
 
-VECTOR_STORE_PATH = "movie_vector_store"
+VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", "movie_vector_store")
+# Файлы формата FAISS.save_local, которым хранилище сохранялось раньше
+LEGACY_INDEX_FILE = "index.faiss"
+LEGACY_DOCSTORE_FILE = "index.pkl"
+CATALOG_PAGES = 40
 
+# Кэш эмбеддингов и параметры пакетных запросов к модели
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+EMBEDDING_MAX_WORKERS = int(os.getenv("EMBEDDING_MAX_WORKERS", "4"))
+# "openai" - OpenAIEmbeddings, "hash" - локальная детерминированная замена для офлайн-сборки
+EMBEDDINGS_BACKEND = os.getenv("EMBEDDINGS_BACKEND", "openai")
 
-def get_vector_store():
-    """
-    Создаем векторное хранилище (FAISS) на основе описаний фильмов.
-    """
-    embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key)
 
-    if os.path.exists(VECTOR_STORE_PATH):
-        return FAISS.load_local(VECTOR_STORE_PATH, embeddings, allow_dangerous_deserialization=True)
+def get_embeddings():
+    """Возвращает модель эмбеддингов, обернутую дисковым кэшем"""
+    if EMBEDDINGS_BACKEND == "hash":
+        embeddings = HashEmbeddings()
+    else:
+        embeddings = OpenAIEmbeddings(openai_api_key=require_env("OPENAI_API_KEY"))
+
+    cache = EmbeddingCache(cache_path_for(EMBEDDING_CACHE_PATH, embeddings_model_name(embeddings)),
+                           max_entries=EMBEDDING_CACHE_MAX_ENTRIES)
+    return CachedEmbeddings(embeddings, cache, batch_size=EMBEDDING_BATCH_SIZE, max_workers=EMBEDDING_MAX_WORKERS)
+
 
-    movies = get_movies(1, 40)
+def download_catalog():
+    """Скачивает каталог по API, по пути потоково записывая сырые документы в новый снимок каталога"""
+    if not CATALOG_SNAPSHOT_PATH:
+        return get_movies(1, CATALOG_PAGES)
 
-    texts = [movie["shortDescription"] for movie in movies]
-    metadatas = [{
+    source = {"query": MOVIES_QUERY, "pages_start": 1, "pages_count": CATALOG_PAGES}
+    with SnapshotWriter(CATALOG_SNAPSHOT_PATH, source=source) as snapshot:
+        return get_movies(1, CATALOG_PAGES, snapshot=snapshot)
+
+
+def load_catalog(snapshot=None):
+    """
+    Каталог фильмов: из снимка (snapshot - имя снимка или "latest") без обращения к API,
+    иначе - свежая загрузка по API.
+    """
+    if snapshot is None:
+        return download_catalog()
+
+    name = None if snapshot == "latest" else snapshot
+    # Неполный снимок (часть страниц не скачалась) отклоняется с SnapshotError: пересборка по части каталога
+    # удалила бы пропавшие фильмы из индекса и БД
+    manifest = read_manifest(CATALOG_SNAPSHOT_PATH, name)
+    movies = list(iter_snapshot_movies(CATALOG_SNAPSHOT_PATH, manifest["name"]))
+    print('====> ', 'Из снимка ', manifest["name"], ' (', manifest["created_at"], ') прочитано ', len(movies),
+          ' фильмов')
+    return movies
+
+
+def build_movie_metadata(movie):
+    """Формирует метаданные фильма, которые сохраняются в FAISS и в БД"""
+    return {
+        "id": movie["id"],
         "name": movie["name"],
         "type": movie.get("type"),
         "genres": [genre["name"] for genre in movie["genres"]],
@@ -37,18 +87,158 @@ def get_vector_store():
         "year": movie["year"],
         "actors": [person["name"] for person in movie["persons"] if person["enProfession"] == 'actor'],
         "countries": [country["name"] for country in movie["countries"]],
-    } for movie in movies]
+        # Связи "похожие фильмы" Кинопоиска для графа похожих фильмов (AI/similar.py)
+        "similar": [similar["id"] for similar in movie.get("similarMovies") or []],
+    }
+
+
+def movie_content_hash(text, metadata):
+    """Хэш содержимого фильма: описание + метаданные (без служебного поля content_hash)"""
+    payload = {key: value for key, value in metadata.items() if key != "content_hash"}
+    raw = json.dumps([text, payload], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def prepare_movies(movies):
+    """
+    Готовит тексты, метаданные и id документов для FAISS.
+    id документа в docstore совпадает с id фильма на Кинопоиске.
+    """
+    texts, metadatas, ids = [], [], []
+    for movie in movies:
+        text = movie["shortDescription"]
+        metadata = build_movie_metadata(movie)
+        metadata["content_hash"] = movie_content_hash(text, metadata)
+
+        texts.append(text)
+        metadatas.append(metadata)
+        ids.append(str(movie["id"]))
+
+    return texts, metadatas, ids
 
 
-    vector_store = FAISS.from_texts(texts, embeddings, metadatas=metadatas)
-    vector_store.save_local(VECTOR_STORE_PATH)
+def save_vector_store(vector_store, path=VECTOR_STORE_PATH):
+    """
+    Публикует индекс новым поколением в mmap-формате и атомарно переключает на него CURRENT,
+    поэтому читатели никогда не видят наполовину записанный индекс.
+    """
+    publish_generation(vector_store, path)
+
+    # Хранилище в старом формате FAISS.save_local больше не нужно
+    for legacy_file in (LEGACY_INDEX_FILE, LEGACY_DOCSTORE_FILE):
+        legacy_path = os.path.join(path, legacy_file)
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+
+def is_legacy_vector_store(path=VECTOR_STORE_PATH):
+    return read_current_generation(path) is None and os.path.exists(os.path.join(path, LEGACY_DOCSTORE_FILE))
+
+
+def sync_vector_store(vector_store, movies):
+    """
+    Инкрементально синхронизирует хранилище с каталогом:
+    эмбеддинги считаются только для новых и изменившихся фильмов, удаленные фильмы убираются из индекса.
+    Возвращает метаданные добавленных/обновленных фильмов и id удаленных.
+    """
+    texts, metadatas, ids = prepare_movies(movies)
+
+    existing = {
+        doc_id: doc.metadata.get("content_hash")
+        for doc_id, doc in vector_store.docstore._dict.items()
+    }
+    fresh_ids = set(ids)
+
+    changed = [i for i, doc_id in enumerate(ids) if existing.get(doc_id) != metadatas[i]["content_hash"]]
+    stale_ids = [doc_id for doc_id in existing if doc_id not in fresh_ids]
+    outdated_ids = [ids[i] for i in changed if ids[i] in existing]
+
+    if (stale_ids or outdated_ids) and not index_supports_removal(vector_store.index):
+        # Индекс без безопасного удаления (HNSW, IVF) пересобираем целиком; неизменившиеся тексты берутся из кэша
+        # эмбеддингов
+        rebuilt = create_faiss_store(texts, vector_store.embeddings, metadatas, ids)
+        vector_store.index = rebuilt.index
+        vector_store.docstore = rebuilt.docstore
+        vector_store.index_to_docstore_id = rebuilt.index_to_docstore_id
+        changed = list(range(len(ids)))
+    else:
+        # Удаление не зависит от наличия изменений: синхронизация, в которой фильмы только пропали из каталога,
+        # тоже должна убрать их из индекса
+        if stale_ids or outdated_ids:
+            vector_store.delete(stale_ids + outdated_ids)
+        if changed:
+            vector_store.add_texts(
+                [texts[i] for i in changed],
+                metadatas=[metadatas[i] for i in changed],
+                ids=[ids[i] for i in changed],
+            )
+
+    print('====> ', 'Синхронизация хранилища: добавлено/обновлено ', len(changed),
+          ', удалено ', len(stale_ids), ', без изменений ', len(ids) - len(changed))
+
+    return [metadatas[i] for i in changed], stale_ids
+
+
+def get_vector_store(sync=False, snapshot=None):
+    """
+    Создаем векторное хранилище (FAISS) на основе описаний фильмов.
+    При sync=True существующее хранилище обновляется инкрементально по свежему каталогу.
+    С snapshot хранилище, производные индексы и строки БД пересобираются из снимка каталога без обращения к API
+    (или, вместе с sync=True, синхронизируются с ним); эмбеддинги неизменившихся описаний берутся из кэша.
+    Используется офлайн-командой сборки индекса (AI/build_index.py), а не при старте сервера.
+    """
+    embeddings = get_embeddings()
+    # Снимок без sync - полная пересборка: так применяются изменения схемы метаданных и колонок БД
+    rebuild = snapshot is not None and not sync
+
+    if not rebuild and (read_current_generation(VECTOR_STORE_PATH) or is_legacy_vector_store()):
+        legacy = is_legacy_vector_store()
+        if legacy:
+            # Хранилище в формате FAISS.save_local переводим в mmap-формат через синхронизацию:
+            # в старых версиях id документов были uuid, а не id фильмов
+            vector_store = FAISS.load_local(VECTOR_STORE_PATH, embeddings, allow_dangerous_deserialization=True)
+        else:
+            vector_store = load_generation(VECTOR_STORE_PATH, embeddings, mmap=False)
+        if not sync and not legacy:
+            return vector_store
+
+        changed_metadatas, removed = sync_vector_store(vector_store, load_catalog(snapshot))
+        if changed_metadatas or removed or legacy:
+            save_vector_store(vector_store)
+        # В старом формате id документов - uuid, а не kp_id: такие в БД не удаляем
+        removed_kp_ids = [int(doc_id) for doc_id in removed if doc_id.isdigit()]
+        if changed_metadatas or removed_kp_ids:
+            # Из старого формата синхронизация перезаписывает все фильмы, как полная загрузка
+            add_movies_from_metadata(changed_metadatas, removed_ids=removed_kp_ids, full_load=legacy)
+
+        return vector_store
+
+    movies = load_catalog(snapshot)
+    texts, metadatas, ids = prepare_movies(movies)
+
+    vector_store = create_faiss_store(texts, embeddings, metadatas, ids)
+    save_vector_store(vector_store)
 
     print('====> ', 'В векторное хранилище записано ', len(movies), ' фильмов')
 
-    add_movies_from_metadata(metadatas)
+    add_movies_from_metadata(metadatas, full_load=True)
 
     return vector_store
 
 
-vector_store = get_vector_store()
+def load_vector_store():
+    """
+    Открывает текущее поколение хранилища для обслуживания запросов (через mmap, с горячей перезагрузкой).
+    Сборка индекса при старте сервера не выполняется.
+    """
+    if read_current_generation(VECTOR_STORE_PATH) is None:
+        raise Exception(f"Векторное хранилище '{VECTOR_STORE_PATH}' не найдено или в старом формате, "
+                        f"соберите его командой: python -m AI.build_index")
+    return GenerationalVectorStore(VECTOR_STORE_PATH, get_embeddings())
+
+
+registry.register("vector_store", load_vector_store)
+
 
+def current_vector_store():
+    return registry.get("vector_store").current()
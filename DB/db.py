@@ -1,78 +1,363 @@
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from DB.sql_query import CREATE_TABLE_QUERY, INSERT_MOVIE_QUERY, STATS_MOVIE_BY_GENRE_QUERY
-from setup import db_password
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from DB.sql_query import (
+    ALL_GENRE_STATS_QUERY,
+    CREATE_TABLE_QUERY,
+    DELETE_LEGACY_MOVIES_QUERY,
+    DELETE_MOVIES_QUERY,
+    GENRE_STATS_VERSION_QUERY,
+    INSERT_MOVIE_QUERY,
+    REFRESH_GENRE_STATS_QUERY,
+    STATS_MOVIE_BY_GENRES_QUERY,
+    UPSERT_MOVIES_QUERY,
+)
+from monitoring import record_cache, span
+from setup import require_env
+
+# Ключи метаданных в порядке колонок INSERT_MOVIE_QUERY / UPSERT_MOVIES_QUERY ("id" - это kp_id)
+MOVIE_COLUMNS = ("id", "name", "type", "genres", "rating_kp", "rating_imdb", "year", "actors", "countries")
+
+BULK_CHUNK_SIZE = 1000
+
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+
+# Время жизни статистики по жанрам в памяти процесса (секунды)
+GENRE_STATS_TTL = float(os.getenv("GENRE_STATS_TTL", "600"))
+# Как часто сверять номер пересчета genre_stats в БД: каталог загружает отдельный процесс (AI.build_index)
+GENRE_STATS_CHECK_INTERVAL = float(os.getenv("GENRE_STATS_CHECK_INTERVAL", "30"))
 
 DB_CONFIG = {
     "dbname": "Film_Recomendation_Ai",
     "user": "postgres",
-    "password": db_password,
     "host": "localhost",
     "port": 5432
 }
 
 
+class DBPool:
+    """
+    Пул соединений с БД поверх psycopg2 ThreadedConnectionPool.
+    Семафор заставляет потоки ждать свободное соединение вместо PoolError при исчерпании пула,
+    а отдельный пул потоков того же размера выполняет запросы асинхронного API, не блокируя event loop.
+    """
+
+    def __init__(self, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE):
+        self.pool = ThreadedConnectionPool(min_size, max_size, **DB_CONFIG, password=require_env("DB_PASSWORD"),
+                                           cursor_factory=RealDictCursor)
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.executor = ThreadPoolExecutor(max_workers=max_size, thread_name_prefix="db")
+
+    @contextmanager
+    def connection(self):
+        """Выдает соединение из пула: коммит при успехе, откат при ошибке"""
+        # Время ожидания свободного соединения показывает, что узким местом стал пул БД
+        with span("db.acquire"):
+            self.slots.acquire()
+        try:
+            conn = self.pool.getconn()
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+            finally:
+                # Разорванные соединения не возвращаем в пул
+                self.pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            self.slots.release()
+
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # Контекст копируется, чтобы спаны запросов к БД попали в трассу HTTP-запроса
+        return await loop.run_in_executor(self.executor, contextvars.copy_context().run, partial(func, *args, **kwargs))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.pool.closeall()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Возвращает пул соединений, создавая его при первом обращении"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = DBPool()
+    return _pool
+
+
+def close_pool():
+    """Закрывает все соединения пула (вызывается при остановке приложения)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+            print("Database pool closed.")
+
+
 def get_db_connection():
-    """Создаёт и возвращает подключение к БД"""
-    return psycopg2.connect(**DB_CONFIG, cursor_factory=RealDictCursor)
+    """Контекстный менеджер с соединением из пула"""
+    return get_pool().connection()
+
+
+def check_db():
+    """Проверка доступности БД для health check"""
+    with span("db.check"), get_db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT 1 AS ok")
+        return cursor.fetchone()["ok"] == 1
 
 
 def init_db():
     """Создаёт таблицы в БД"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(CREATE_TABLE_QUERY)
-    conn.commit()
-    cursor.close()
-    conn.close()
+    with get_db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(CREATE_TABLE_QUERY)
     print("Database initialized.")
 
 
 def add_movie(movie):
     """Добавляет фильм в БД"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(INSERT_MOVIE_QUERY, movie)
-
-    conn.commit()
-    cursor.close()
-    conn.close()
+    with get_db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(INSERT_MOVIE_QUERY, movie)
 
 
 def fetch_movies():
     """Получает все фильмы из БД"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM movies")
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return rows
+    with span("db.fetch_movies"), get_db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT * FROM movies")
+        return cursor.fetchall()
 
 
-def get_movies_stats_by_genres(genre):
-    """Возвращает количество фильмов, средний рейтинг по rating_kp и rating_imdb"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def normalize_genre(genre):
+    return genre.strip().lower()
 
-    cursor.execute(STATS_MOVIE_BY_GENRE_QUERY, genre)
-    result = cursor.fetchone()  # Получаем одну строку
-
-    cursor.close()
-    conn.close()
 
+def format_genre_stats_row(row):
     return {
-        "movie_count": result[0] or 0,
-        "avg_rating_kp": round(result[1], 2) if result[1] else None,
-        "avg_rating_imdb": round(result[2], 2) if result[2] else None
+        "movie_count": row["movie_count"] or 0,
+        "avg_rating_kp": round(row["avg_rating_kp"], 2) if row["avg_rating_kp"] else None,
+        "avg_rating_imdb": round(row["avg_rating_imdb"], 2) if row["avg_rating_imdb"] else None
     }
 
 
-def add_movies_from_metadata(metadata):
+EMPTY_GENRE_STATS = {"movie_count": 0, "avg_rating_kp": None, "avg_rating_imdb": None}
+
+
+class GenreStatsCache:
+    """
+    Кэш статистики по жанрам в памяти процесса поверх материализованного представления genre_stats.
+    Запрошенные жанры, которых нет в кэше, догружаются одним запросом. Раз в check_interval сверяется номер
+    пересчета genre_stats в БД: после загрузки каталога в любом процессе (или по истечении ttl) статистика
+    и словарь жанров загружаются заново.
+    """
+
+    def __init__(self, ttl=GENRE_STATS_TTL, check_interval=GENRE_STATS_CHECK_INTERVAL):
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.stats = {}  # genre -> (stats, loaded_at)
+        # Все жанры каталога (словарь для распознавания жанров в тексте запроса), заполняется при прогреве
+        self.vocabulary = frozenset()
+        self.version = None  # номер пересчета genre_stats, с которым загружен кэш
+        self.primed_at = None
+        self.checked_at = None
+        self.lock = threading.Lock()
+
+    def get_many(self, genres):
+        """Возвращает (найденная статистика, жанры которых нет в кэше)"""
+        now = time.monotonic()
+        found, missing = {}, []
+        with self.lock:
+            for genre in genres:
+                entry = self.stats.get(genre)
+                if entry is not None and now - entry[1] < self.ttl:
+                    found[genre] = entry[0]
+                else:
+                    missing.append(genre)
+        return found, missing
+
+    def put_many(self, stats):
+        now = time.monotonic()
+        with self.lock:
+            for genre, genre_stats in stats.items():
+                self.stats[genre] = (genre_stats, now)
+
+    def prime(self, stats, version):
+        """Заменяет содержимое кэша и словарь жанров агрегатами по всем жанрам"""
+        now = time.monotonic()
+        with self.lock:
+            self.stats = {genre: (genre_stats, now) for genre, genre_stats in stats.items()}
+            self.vocabulary = frozenset(stats)
+            self.version = version
+            self.primed_at = self.checked_at = now
+
+    def needs_check(self):
+        now = time.monotonic()
+        return (self.checked_at is None or now - self.checked_at >= self.check_interval
+                or (self.primed_at is not None and now - self.primed_at >= self.ttl))
+
+    def claim_check(self):
+        """True, если пора сверить версию; одновременно сверяет только один поток"""
+        with self.lock:
+            if not self.needs_check():
+                return False
+            self.checked_at = time.monotonic()
+            return True
+
+    def invalidate(self):
+        with self.lock:
+            self.stats.clear()
+            self.version = self.primed_at = self.checked_at = None
+
+
+genre_stats_cache = GenreStatsCache()
+
+
+def load_movies_stats_by_genres(genres):
+    """Одним запросом загружает статистику по жанрам из genre_stats и кладет ее в кэш"""
+    with span("db.genre_stats"), get_db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(STATS_MOVIE_BY_GENRES_QUERY, (list(genres),))
+        rows = cursor.fetchall()
+
+    stats = {genre: EMPTY_GENRE_STATS for genre in genres}
+    stats.update({row["genre"]: format_genre_stats_row(row) for row in rows})
+    genre_stats_cache.put_many(stats)
+    return stats
+
+
+def get_movies_stats_by_genres(genres):
+    """
+    Возвращает словарь жанр -> количество фильмов, средний рейтинг по rating_kp и rating_imdb.
+    Горячие жанры отдаются из кэша без обращения к БД.
+    """
+    ensure_fresh_genre_stats()
+    genres = list(dict.fromkeys(normalize_genre(genre) for genre in genres))
+    stats, missing = genre_stats_cache.get_many(genres)
+    record_cache("genre_stats", "hit", len(stats))
+    record_cache("genre_stats", "miss", len(missing))
+    if missing:
+        stats.update(load_movies_stats_by_genres(missing))
+    return {genre: stats[genre] for genre in genres}
+
+
+def read_genre_stats_version(cursor):
+    cursor.execute(GENRE_STATS_VERSION_QUERY)
+    row = cursor.fetchone()
+    return row["version"] if row else None
+
+
+def prime_genre_stats_cache():
+    """Загружает в кэш агрегаты и словарь по всем жанрам (прогрев при старте и после пересчета)"""
+    with get_db_connection() as conn, conn.cursor() as cursor:
+        version = read_genre_stats_version(cursor)
+        cursor.execute(ALL_GENRE_STATS_QUERY)
+        rows = cursor.fetchall()
+
+    genre_stats_cache.prime({row["genre"]: format_genre_stats_row(row) for row in rows}, version)
+
+
+def ensure_fresh_genre_stats():
+    """
+    Не чаще раза в check_interval сверяет номер пересчета genre_stats в БД и перезагружает кэш,
+    если агрегаты пересчитал другой процесс или истек ttl словаря жанров.
+    """
+    if not genre_stats_cache.claim_check():
+        return
+    primed_at = genre_stats_cache.primed_at
+    if primed_at is None or time.monotonic() - primed_at >= genre_stats_cache.ttl:
+        prime_genre_stats_cache()
+        return
+
+    with get_db_connection() as conn, conn.cursor() as cursor:
+        version = read_genre_stats_version(cursor)
+    if version != genre_stats_cache.version:
+        prime_genre_stats_cache()
+
+
+def refresh_genre_stats():
+    """Пересчитывает агрегаты по жанрам и заново прогревает кэш"""
+    with get_db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(REFRESH_GENRE_STATS_QUERY)
+
+    genre_stats_cache.invalidate()
+    prime_genre_stats_cache()
+
+
+def add_movies_from_metadata(metadata, chunk_size=BULK_CHUNK_SIZE, removed_ids=(), full_load=False):
+    """
+    Пакетно загружает фильмы в БД через execute_values: одно соединение,
+    одна транзакция на пачку и upsert по kp_id, поэтому повторная загрузка каталога не создает дублей.
+    removed_ids - kp_id фильмов, пропавших из каталога: они удаляются, чтобы не попадать в статистику по жанрам.
+    full_load - в metadata весь каталог: строки без kp_id (загруженные до миграции) удаляются, иначе эти фильмы
+    считались бы в статистике дважды.
+    """
     print('====> ', 'Началось добавление данных в базу')
+    started_at = time.perf_counter()
+
+    # В одной пачке kp_id должен встречаться один раз, иначе ON CONFLICT DO UPDATE упадет
+    rows = list({
+        movie.get("id"): tuple(movie.get(column) for column in MOVIE_COLUMNS)
+        for movie in metadata
+    }.values())
+
+    removed_ids = list(removed_ids)
+
+    with get_db_connection() as conn, conn.cursor() as cursor:
+        # Удаления коммитятся вместе с первой пачкой upsert (или при выходе из get_db_connection)
+        if full_load:
+            cursor.execute(DELETE_LEGACY_MOVIES_QUERY)
+        if removed_ids:
+            cursor.execute(DELETE_MOVIES_QUERY, (removed_ids,))
+        for start in range(0, len(rows), chunk_size):
+            execute_values(cursor, UPSERT_MOVIES_QUERY, rows[start:start + chunk_size], page_size=chunk_size)
+            conn.commit()
+
+    elapsed = time.perf_counter() - started_at
+    print('====> ', 'Закончилось добавление данных в базу: ', len(rows), ' строк, удалено ', len(removed_ids),
+          ' за ', round(elapsed, 2), ' сек (', round(len(rows) / elapsed) if elapsed else len(rows), ' строк/сек)')
+
+    refresh_genre_stats()
+
+
+#########################################
+# Асинхронный API для FastAPI-обработчиков #
+#########################################
+
+
+async def acheck_db():
+    return await get_pool().run(check_db)
+
+
+async def afetch_movies():
+    return await get_pool().run(fetch_movies)
+
 
-    for movie in metadata:
-        add_movie(tuple(movie.values()))
+async def aget_movies_stats_by_genres(genres):
+    normalized = [normalize_genre(genre) for genre in genres]
+    stats, missing = genre_stats_cache.get_many(normalized)
+    if not missing and not genre_stats_cache.needs_check():
+        # Все жанры в кэше: обходимся без пула потоков и БД
+        record_cache("genre_stats", "hit", len(stats))
+        return {genre: stats[genre] for genre in normalized}
+    # Попадания и промахи посчитает get_movies_stats_by_genres
+    return await get_pool().run(get_movies_stats_by_genres, genres)
 
-    print('====> ', 'Закончилось добавление данных в базу')
 
+async def aensure_fresh_genre_stats():
+    if genre_stats_cache.needs_check():
+        await get_pool().run(ensure_fresh_genre_stats)
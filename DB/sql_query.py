@@ -1,6 +1,7 @@
 CREATE_TABLE_QUERY = """
 CREATE TABLE IF NOT EXISTS movies (
     id SERIAL PRIMARY KEY,
+    kp_id INTEGER UNIQUE,
     name TEXT NOT NULL,
     type TEXT NOT NULL,
     genres TEXT[] NOT NULL,
@@ -10,18 +11,85 @@ CREATE TABLE IF NOT EXISTS movies (
     actors TEXT[],
     countries TEXT[]
 );
+
+-- Миграция для таблиц, созданных до появления kp_id
+ALTER TABLE movies ADD COLUMN IF NOT EXISTS kp_id INTEGER;
+CREATE UNIQUE INDEX IF NOT EXISTS movies_kp_id_key ON movies (kp_id);
+
+-- Статистика читается только из genre_stats, а GIN-индекс по жанрам лишь замедлял пакетную загрузку
+DROP INDEX IF EXISTS movies_genres_gin;
+
+-- Агрегаты по жанрам, пересчитываются после загрузки каталога
+CREATE MATERIALIZED VIEW IF NOT EXISTS genre_stats AS
+SELECT lower(genre) AS genre,
+       COUNT(*) AS movie_count,
+       AVG(rating_kp) AS avg_rating_kp,
+       AVG(rating_imdb) AS avg_rating_imdb
+FROM movies, unnest(genres) AS genre
+GROUP BY lower(genre);
+
+CREATE UNIQUE INDEX IF NOT EXISTS genre_stats_genre_key ON genre_stats (genre);
+
+-- Номер пересчета genre_stats: по нему процессы сервера узнают, что агрегаты пересчитал другой процесс
+CREATE TABLE IF NOT EXISTS genre_stats_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO genre_stats_version (id, version) VALUES (TRUE, 0) ON CONFLICT (id) DO NOTHING;
 """
 
 INSERT_MOVIE_QUERY = """
-INSERT INTO movies (name, type, genres, rating_kp, rating_imdb, year, actors, countries)
-VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+INSERT INTO movies (kp_id, name, type, genres, rating_kp, rating_imdb, year, actors, countries)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+ON CONFLICT (kp_id) DO UPDATE SET
+    name = EXCLUDED.name,
+    type = EXCLUDED.type,
+    genres = EXCLUDED.genres,
+    rating_kp = EXCLUDED.rating_kp,
+    rating_imdb = EXCLUDED.rating_imdb,
+    year = EXCLUDED.year,
+    actors = EXCLUDED.actors,
+    countries = EXCLUDED.countries
 RETURNING id;
 """
 
-STATS_MOVIE_BY_GENRE_QUERY = query = """
-    SELECT COUNT(*) AS movie_count, 
-           AVG(rating_kp) AS avg_rating_kp, 
-           AVG(rating_imdb) AS avg_rating_imdb
-    FROM movies
-    WHERE %s in genres
+# Шаблон для psycopg2.extras.execute_values: %s раскрывается в список VALUES
+UPSERT_MOVIES_QUERY = """
+INSERT INTO movies (kp_id, name, type, genres, rating_kp, rating_imdb, year, actors, countries)
+VALUES %s
+ON CONFLICT (kp_id) DO UPDATE SET
+    name = EXCLUDED.name,
+    type = EXCLUDED.type,
+    genres = EXCLUDED.genres,
+    rating_kp = EXCLUDED.rating_kp,
+    rating_imdb = EXCLUDED.rating_imdb,
+    year = EXCLUDED.year,
+    actors = EXCLUDED.actors,
+    countries = EXCLUDED.countries
+"""
+
+# Фильмы, пропавшие из каталога при инкрементальной синхронизации
+DELETE_MOVIES_QUERY = "DELETE FROM movies WHERE kp_id = ANY(%s::int[])"
+
+# Строки, загруженные до появления kp_id: upsert их не находит, поэтому при полной загрузке каталога они удаляются
+DELETE_LEGACY_MOVIES_QUERY = "DELETE FROM movies WHERE kp_id IS NULL"
+
+REFRESH_GENRE_STATS_QUERY = """
+    REFRESH MATERIALIZED VIEW CONCURRENTLY genre_stats;
+    UPDATE genre_stats_version SET version = version + 1;
+    """
+
+GENRE_STATS_VERSION_QUERY = "SELECT version FROM genre_stats_version"
+
+ALL_GENRE_STATS_QUERY = """
+    SELECT genre, movie_count, avg_rating_kp, avg_rating_imdb
+    FROM genre_stats
+    """
+
+# Статистика сразу по нескольким жанрам за один запрос к агрегатам
+STATS_MOVIE_BY_GENRES_QUERY = """
+    SELECT genre, movie_count, avg_rating_kp, avg_rating_imdb
+    FROM genre_stats
+    WHERE genre = ANY(%s::text[])
     """
+
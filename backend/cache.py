@@ -0,0 +1,243 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from monitoring import record_cache
+from registry import registry
+
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")  # memory | file | redis | none
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "response_cache")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Заголовок, которым клиент может попросить пропустить кэш
+CACHE_BYPASS_HEADER = "X-Cache-Bypass"
+
+
+def normalize_query(query: str) -> str:
+    """Нормализует текст запроса: регистр, ё/е, лишние пробелы и пунктуация по краям"""
+    query = query.lower().replace("ё", "е")
+    query = re.sub(r"\s+", " ", query)
+    return query.strip(" .,!?;:")
+
+
+def make_cache_key(endpoint: str, query: str, genres: Dict[str, List[str]], filters: Optional[dict] = None) -> str:
+    """Ключ кэша: эндпоинт + нормализованный запрос + отсортированные любимые и нелюбимые жанры + фильтры"""
+    payload = {
+        "endpoint": endpoint,
+        "query": normalize_query(query),
+        "favorite": sorted({genre.strip().lower() for genre in genres.get("favorite", [])}),
+        "hated": sorted({genre.strip().lower() for genre in genres.get("hated", [])}),
+        "filters": {key: value for key, value in (filters or {}).items() if value is not None},
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryCacheBackend:
+    """
+    LRU-кэш в памяти процесса с ограничением по количеству записей и суммарному размеру.
+    Размер считается в байтах UTF-8, а не в символах: кириллица занимает по два байта на букву.
+    """
+
+    blocking = False
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()  # key -> (payload, expires_at, size_bytes)
+        self.lock = threading.Lock()
+
+    def get(self, key) -> Optional[str]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, payload: str, ttl: float):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            size = len(payload.encode("utf-8"))
+            if size > self.max_bytes:
+                return
+
+            self.entries[key] = (payload, time.time() + ttl, size)
+            self.size += size
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        _, _, size = self.entries.pop(key)
+        self.size -= size
+
+
+class FileCacheBackend:
+    """
+    Кэш в директории на диске: один файл на запись.
+    Директорию могут разделять несколько воркеров на одной машине.
+    """
+
+    blocking = True
+    CLEANUP_EVERY = 100
+
+    def __init__(self, path=RESPONSE_CACHE_PATH, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.writes = 0
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, key + ".json")
+
+    def get(self, key) -> Optional[str]:
+        try:
+            with open(self._file(key), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if entry["expires_at"] < time.time():
+            try:
+                os.remove(self._file(key))
+            except OSError:
+                pass
+            return None
+        return entry["payload"]
+
+    def set(self, key, payload: str, ttl: float):
+        tmp_path = f"{self._file(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"expires_at": time.time() + ttl, "payload": payload}, f, ensure_ascii=False)
+        os.replace(tmp_path, self._file(key))
+
+        self.writes += 1
+        if self.writes % self.CLEANUP_EVERY == 0:
+            self.cleanup()
+
+    def cleanup(self):
+        """Удаляет самые старые файлы сверх max_entries"""
+        files = [entry for entry in os.scandir(self.path) if entry.name.endswith(".json")]
+        if len(files) <= self.max_entries:
+            return
+        files.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in files[:len(files) - self.max_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+class RedisCacheBackend:
+    """Общий для всех инстансов кэш в Redis (вытеснение настраивается политикой maxmemory самого Redis)"""
+
+    blocking = True
+
+    def __init__(self, url=REDIS_URL, prefix="response_cache:"):
+        import redis  # необязательная зависимость, нужна только для этого бэкенда
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key) -> Optional[str]:
+        payload = self.client.get(self.prefix + key)
+        return payload.decode("utf-8") if payload is not None else None
+
+    def set(self, key, payload: str, ttl: float):
+        self.client.set(self.prefix + key, payload, ex=max(1, int(ttl)))
+
+
+class ResponseCache:
+    """Кэш ответов эндпоинтов со счетчиками попаданий и промахов"""
+
+    def __init__(self, backend, ttl=RESPONSE_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.errors = 0
+
+    async def _call(self, func, *args):
+        if self.backend.blocking:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    async def get(self, key) -> Optional[dict]:
+        try:
+            payload = await self._call(self.backend.get, key)
+        except Exception:
+            # Недоступный кэш не должен ломать запрос
+            self.errors += 1
+            record_cache("response", "error")
+            payload = None
+
+        if payload is None:
+            self.misses += 1
+            record_cache("response", "miss")
+            return None
+
+        self.hits += 1
+        record_cache("response", "hit")
+        return json.loads(payload)
+
+    async def set(self, key, value: dict):
+        try:
+            await self._call(self.backend.set, key, json.dumps(value, ensure_ascii=False), self.ttl)
+        except Exception:
+            self.errors += 1
+            record_cache("response", "error")
+
+    def record_bypass(self):
+        self.bypasses += 1
+        record_cache("response", "bypass")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def create_response_cache(backend=RESPONSE_CACHE_BACKEND) -> Optional[ResponseCache]:
+    if backend == "none":
+        return None
+    if backend == "file":
+        return ResponseCache(FileCacheBackend())
+    if backend == "redis":
+        return ResponseCache(RedisCacheBackend())
+    return ResponseCache(MemoryCacheBackend())
+
+
+def is_cache_bypassed(headers) -> bool:
+    """Клиент может пропустить кэш заголовком X-Cache-Bypass: 1 или Cache-Control: no-cache"""
+    if headers.get(CACHE_BYPASS_HEADER, "").lower() in ("1", "true", "yes"):
+        return True
+    return "no-cache" in headers.get("Cache-Control", "").lower()
+
+
+# None, если кэш ответов отключен; создается при прогреве или первом обращении, а не при импорте
+registry.register("response_cache", create_response_cache, required=False)
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    return registry.get("response_cache")
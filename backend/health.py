@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import os
+
+from fastapi import APIRouter, Response
+from fastapi.responses import JSONResponse
+
+from DB.db import check_db, prime_genre_stats_cache
+from monitoring import render_metrics
+from registry import registry
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Компоненты, которые создаются заранее при прогреве
+WARMUP_COMPONENTS = ["llm", "vector_store", "movie_stats_agent", "tavily_tool", "search_agent", "response_cache",
+                     "speech_synthesizer"]
+
+# Пауза между повторными попытками прогрева (например, пока поднимается БД)
+WARMUP_RETRY_DELAY = float(os.getenv("WARMUP_RETRY_DELAY", "10"))
+
+# Пути, доступные до окончания прогрева
+ALWAYS_ALLOWED_PATHS = {"/healthz", "/readyz", "/docs", "/redoc", "/openapi.json", "/metrics"}
+
+
+class Readiness:
+    """Состояние прогрева: сервис принимает трафик только после готовности обязательных компонентов"""
+
+    def __init__(self):
+        self.ready = False
+        self.error = None
+        self.task = None
+
+    def warmup(self):
+        """Блокирующий прогрев: БД, кэш статистики, LLM, индекс и агенты"""
+        check_db()
+        prime_genre_stats_cache()
+        if not registry.warmup(WARMUP_COMPONENTS):
+            raise Exception("Не все обязательные компоненты инициализированы")
+
+    async def run_warmup(self):
+        while not self.ready:
+            try:
+                await asyncio.to_thread(self.warmup)
+                self.ready = True
+                self.error = None
+                logger.info("Прогрев завершен, сервис готов принимать запросы")
+            except Exception as e:
+                self.error = str(e)
+                logger.error(f"Ошибка прогрева: {e}, повтор через {WARMUP_RETRY_DELAY} сек")
+                await asyncio.sleep(WARMUP_RETRY_DELAY)
+
+    def start(self):
+        self.task = asyncio.create_task(self.run_warmup())
+
+    async def stop(self):
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+
+readiness = Readiness()
+
+
+@router.get("/healthz")
+async def healthz():
+    """Liveness: процесс жив и обрабатывает запросы"""
+    return {"status": "ok"}
+
+
+@router.get("/readyz")
+async def readyz():
+    """Readiness: прогрев завершен и обязательные компоненты готовы"""
+    body = {"ready": readiness.ready, "error": readiness.error, "components": registry.status()}
+    return JSONResponse(body, status_code=200 if readiness.ready else 503)
+
+
+@router.get("/metrics")
+async def metrics():
+    """Метрики Prometheus: задержки запросов и стадий, попадания в кэши, fallback, токены LLM, ошибки"""
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
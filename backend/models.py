@@ -1,10 +1,18 @@
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Dict, Optional
+
+
+class MovieFilters(BaseModel):
+    year_from: Optional[int] = None
+    year_to: Optional[int] = None
+    min_rating_kp: Optional[float] = None
+    min_rating_imdb: Optional[float] = None
 
 
 class MovieQuery(BaseModel):
     query: str
     genres: Dict[str, List[str]]
+    filters: Optional[MovieFilters] = None
 
     class Config:
         json_schema_extra = {
@@ -31,9 +39,36 @@ class MovieResponse(BaseModel):
         }
 
 
+class SimilarMovie(BaseModel):
+    id: int
+    name: Optional[str] = None
+    year: Optional[int] = None
+    genres: List[str] = []
+    rating_kp: Optional[float] = None
+    rating_imdb: Optional[float] = None
+    score: float
+
+
+class SimilarMoviesResponse(BaseModel):
+    movie_id: int
+    similar: List[SimilarMovie]
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "movie_id": 326,
+                "similar": [
+                    {"id": 435, "name": "Зеленая миля", "year": 1999, "genres": ["драма", "фэнтези"],
+                     "rating_kp": 9.1, "rating_imdb": 8.6, "score": 1.82}
+                ]
+            }
+        }
+
+
 class VoiceQuery(BaseModel):
     transcription: str
     genres: Dict[str, List[str]]
+    filters: Optional[MovieFilters] = None
 
     class Config:
         json_schema_extra = {
@@ -58,3 +93,14 @@ class VoiceResponse(BaseModel):
                 "audio_base64": "UklGRlwAAABXQVZFZm10IBAAAAABAAEAgD4AAAB9AAACABAAZGF0YU4AAAAA..."  # сокращенный пример
             }
         }
+
+
+class SpeechQuery(BaseModel):
+    text: str
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "text": "Могу порекомендовать фильм 'Человек Паук' ..."
+            }
+        }
@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from langchain_core.messages import AIMessageChunk
+
+from AI.agents import get_movie_stats_agent, get_search_agent
+from AI.chains import create_retrieval_chain
+from AI.stats_engine import answer_stats
+from AI.tools import web_search_available
+from monitoring import record_pipeline_run, record_span
+
+logger = logging.getLogger(__name__)
+
+# Таймауты стадий /search в секундах
+RETRIEVAL_TIMEOUT = float(os.getenv("SEARCH_RETRIEVAL_TIMEOUT", "30"))
+WEB_SEARCH_TIMEOUT = float(os.getenv("SEARCH_WEB_SEARCH_TIMEOUT", "25"))
+STATS_TIMEOUT = float(os.getenv("SEARCH_STATS_TIMEOUT", "15"))
+
+NOT_FOUND_PHRASES = ["не найден", "не смог", "нет похожих", "ничего не найдено", "не найдено"]
+NOT_FOUND_ANSWER = "Извините, к сожалению, я не смог найти подходящих фильмов или сериалов"
+
+
+class StageFailed(Exception):
+    """Стадия пайплайна завершилась ошибкой или не уложилась в таймаут"""
+
+
+# Наблюдатели стадий: callback(name, seconds, status), status - "ok" | "timeout" | "error" | "skipped"
+stage_observers = []
+
+
+def notify_stage(name: str, started_at: float, status: str):
+    elapsed = time.perf_counter() - started_at
+    record_span(f"pipeline.{name}", elapsed, status, started_at)
+    for observer in stage_observers:
+        observer(name, elapsed, status)
+
+
+async def run_stage(name: str, awaitable, timeout: float):
+    """Выполняет стадию с собственным таймаутом; ошибки и таймауты превращаются в StageFailed"""
+    started_at = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        notify_stage(name, started_at, "timeout")
+        logger.warning(f"Стадия '{name}' не уложилась в {timeout} сек")
+        raise StageFailed(name)
+    except Exception as e:
+        notify_stage(name, started_at, "error")
+        logger.warning(f"Стадия '{name}' завершилась ошибкой: {e}")
+        raise StageFailed(name) from e
+
+    notify_stage(name, started_at, "ok")
+    return result
+
+
+def agent_answer(result: dict) -> str:
+    """Текст последнего сообщения агента"""
+    messages = result.get('messages', [])
+    return messages[-1].text() if messages else ''
+
+
+def stats_request(user_query: str, genres: Dict[str, List[str]]) -> str:
+    """Запрос для агента статистики: текст пользователя и его жанровые предпочтения"""
+    request = user_query
+    if genres.get("favorite"):
+        request += f"\nЛюбимые жанры: {', '.join(genres['favorite'])}."
+    if genres.get("hated"):
+        request += f"\nНелюбимые жанры: {', '.join(genres['hated'])}."
+    return request
+
+
+def needs_fallback(answer: str) -> bool:
+    return not answer or any(phrase in answer.lower() for phrase in NOT_FOUND_PHRASES)
+
+
+async def retrieve_answer(prompt: str, user_query: str, genres: Dict[str, List[str]],
+                          filters: Optional[dict] = None) -> str:
+    chain = create_retrieval_chain(genres=genres, filters=filters, search_query=user_query)
+    result = await chain.ainvoke(prompt)
+    return result.get('result', '')
+
+
+async def web_search_answer(prompt: str) -> str:
+    result = await get_search_agent().ainvoke({"messages": [("user", prompt)]})
+    return agent_answer(result)
+
+
+async def stats_answer(user_query: str, genres: Dict[str, List[str]]) -> str:
+    """
+    Статистика по жанрам: обычные запросы обрабатываются шаблоном без LLM (AI/stats_engine.py),
+    агент статистики вызывается только для открытых статистических вопросов.
+    """
+    stats = await answer_stats(user_query, genres)
+    if stats is not None:
+        return stats
+
+    result = await get_movie_stats_agent().ainvoke({"messages": [("user", stats_request(user_query, genres))]})
+    return agent_answer(result)
+
+
+async def run_search_pipeline(user_query: str, genres: Dict[str, List[str]], prompt: str,
+                              filters: Optional[dict] = None) -> dict:
+    """
+    Конкурентный пайплайн /search: поиск по векторному хранилищу и статистика выполняются одновременно,
+    веб-поиск запускается только если RAG ничего не нашел. Медленные статистика или веб-поиск
+    не роняют запрос: ответ собирается из того, что успело выполниться, и помечается как degraded.
+    """
+    stats_task = asyncio.create_task(run_stage("stats", stats_answer(user_query, genres), STATS_TIMEOUT))
+    degraded = False
+
+    try:
+        try:
+            answer = await run_stage("retrieval", retrieve_answer(prompt, user_query, genres, filters),
+                                     RETRIEVAL_TIMEOUT)
+        except StageFailed:
+            answer, degraded = '', True
+
+        fallback = needs_fallback(answer)
+        if fallback and not web_search_available():
+            # Провайдер поиска отключен circuit breaker'ом - не ждем заведомо неудачного вызова агента
+            notify_stage("web_search", time.perf_counter(), "skipped")
+            answer, degraded = answer or NOT_FOUND_ANSWER, True
+        elif fallback:
+            try:
+                answer = await run_stage("web_search", web_search_answer(prompt), WEB_SEARCH_TIMEOUT)
+            except StageFailed:
+                degraded = True
+                answer = answer or NOT_FOUND_ANSWER
+
+        try:
+            stats = await stats_task
+        except StageFailed:
+            stats, degraded = '', True
+    finally:
+        # При отмене запроса (например, клиент отключился) не оставляем агента статистики работать впустую
+        stats_task.cancel()
+
+    record_pipeline_run(fallback, degraded)
+    return {"answer": answer + '\n' + stats if stats else answer, "degraded": degraded}
+
+
+#########################################
+# Потоковая версия пайплайна (SSE)       #
+#########################################
+
+
+async def stream_retrieval_answer(prompt: str, user_query: str, genres: Dict[str, List[str]],
+                                  filters: Optional[dict], emit) -> str:
+    """Пробрасывает токены LLM из RetrievalQA по мере генерации и возвращает итоговый ответ"""
+    parts = []
+    final_answer = None
+    chain = create_retrieval_chain(genres=genres, filters=filters, search_query=user_query)
+    async for event in chain.astream_events(prompt, version="v2"):
+        if event["event"] == "on_chat_model_stream":
+            text = event["data"]["chunk"].text()
+            if text:
+                parts.append(text)
+                await emit("token", {"stage": "retrieval", "text": text})
+        elif event["event"] == "on_chain_end" and not event.get("parent_ids"):
+            final_answer = event["data"]["output"].get("result")
+
+    return final_answer if final_answer is not None else ''.join(parts)
+
+
+async def stream_web_search_answer(prompt: str, emit) -> str:
+    """Пробрасывает токены ответа агента веб-поиска (без промежуточных вызовов инструментов)"""
+    parts = []
+    async for chunk, metadata in get_search_agent().astream({"messages": [("user", prompt)]}, stream_mode="messages"):
+        if metadata.get("langgraph_node") != "agent" or not isinstance(chunk, AIMessageChunk):
+            continue
+        text = chunk.text()
+        if text:
+            parts.append(text)
+            await emit("token", {"stage": "web_search", "text": text})
+
+    return ''.join(parts)
+
+
+async def stream_search_pipeline(user_query: str, genres: Dict[str, List[str]], prompt: str,
+                                 filters: Optional[dict] = None):
+    """
+    Потоковый вариант run_search_pipeline. Асинхронный генератор пар (event, data):
+      stage  - границы стадий: {"stage": ..., "status": "started" | "done" | "failed" | "skipped"};
+               старт стадии web_search означает, что текст стадии retrieval нужно отбросить;
+      token  - очередной фрагмент ответа LLM: {"stage": ..., "text": ...};
+      stats  - статистика по жанрам, дописывается к ответу;
+      done   - итоговый ответ: {"answer": ..., "degraded": ...};
+      error  - непредвиденная ошибка: {"detail": ...}.
+    При закрытии генератора (клиент отключился) все стадии отменяются.
+    """
+    queue = asyncio.Queue()
+
+    async def emit(event, data):
+        await queue.put((event, data))
+
+    stats_task = asyncio.create_task(run_stage("stats", stats_answer(user_query, genres), STATS_TIMEOUT))
+
+    async def produce():
+        try:
+            degraded = False
+
+            await emit("stage", {"stage": "retrieval", "status": "started"})
+            try:
+                answer = await run_stage("retrieval",
+                                         stream_retrieval_answer(prompt, user_query, genres, filters, emit),
+                                         RETRIEVAL_TIMEOUT)
+                await emit("stage", {"stage": "retrieval", "status": "done"})
+            except StageFailed:
+                answer, degraded = '', True
+                await emit("stage", {"stage": "retrieval", "status": "failed"})
+
+            fallback = needs_fallback(answer)
+            if fallback and not web_search_available():
+                notify_stage("web_search", time.perf_counter(), "skipped")
+                answer, degraded = answer or NOT_FOUND_ANSWER, True
+                await emit("stage", {"stage": "web_search", "status": "skipped"})
+            elif fallback:
+                await emit("stage", {"stage": "web_search", "status": "started"})
+                try:
+                    answer = await run_stage("web_search", stream_web_search_answer(prompt, emit), WEB_SEARCH_TIMEOUT)
+                    await emit("stage", {"stage": "web_search", "status": "done"})
+                except StageFailed:
+                    degraded = True
+                    answer = answer or NOT_FOUND_ANSWER
+                    await emit("stage", {"stage": "web_search", "status": "failed"})
+
+            try:
+                stats = await stats_task
+            except StageFailed:
+                stats, degraded = '', True
+            if stats:
+                await emit("stats", {"text": stats})
+
+            record_pipeline_run(fallback, degraded)
+            await emit("done", {"answer": answer + '\n' + stats if stats else answer, "degraded": degraded})
+        except Exception as e:
+            logger.error(f"Ошибка в потоковом пайплайне /search: {e}")
+            await emit("error", {"detail": str(e)})
+        finally:
+            await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            yield item
+    finally:
+        producer.cancel()
+        stats_task.cancel()
@@ -1,26 +1,31 @@
-import io
+import json
 import logging
 from typing import Dict, List
 
-from fastapi import APIRouter
-
-from openai import OpenAI
+from fastapi import APIRouter, Query, Request, Response
+from fastapi.responses import StreamingResponse
 
 import base64
 from fastapi import HTTPException
-from gtts import gTTS
-
-from AI.agents import search_agent, movie_stats_agent
-from AI.chains import retrieval_chain
-from backend.models import MovieQuery, MovieResponse, VoiceResponse, VoiceQuery
 
-client = OpenAI()
+from AI.chains import create_retrieval_chain
+from AI.similar import find_similar_movies
+from AI.vector import current_vector_store
+from backend.cache import get_response_cache, is_cache_bypassed, make_cache_key
+from backend.models import (MovieQuery, MovieResponse, SimilarMoviesResponse, SpeechQuery, VoiceResponse,
+                            VoiceQuery)
+from backend.pipeline import run_search_pipeline, stream_search_pipeline
+from backend.tts import get_speech_synthesizer
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
+def query_filters(query) -> dict:
+    return query.filters.model_dump() if query.filters else {}
+
+
 def wrap_prompt(user_query: str, genres: Dict[str, List[str]]) -> str:
     """
     Формирует промпт для ChatGPT на основе запроса пользователя.
@@ -48,33 +53,144 @@ def wrap_prompt(user_query: str, genres: Dict[str, List[str]]) -> str:
     return prompt
 
 
+async def get_cached_response(request: Request, response: Response, key: str):
+    """
+    Ищет готовый ответ в кэше. Возвращает None при промахе или если клиент попросил пропустить кэш.
+    Статус кэша отдается клиенту в заголовке X-Cache.
+    """
+    response_cache = get_response_cache()
+    if response_cache is None:
+        return None
+
+    if is_cache_bypassed(request.headers):
+        response_cache.record_bypass()
+        response.headers["X-Cache"] = "BYPASS"
+        return None
+
+    cached = await response_cache.get(key)
+    response.headers["X-Cache"] = "HIT" if cached is not None else "MISS"
+    return cached
+
+
+async def store_cached_response(key: str, value: dict):
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        await response_cache.set(key, value)
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    response_cache = get_response_cache()
+    if response_cache is None:
+        return {"backend": None}
+    return response_cache.stats()
+
+
 @router.post("/search", response_model=MovieResponse)
-async def search_movies(query: MovieQuery):
+async def search_movies(query: MovieQuery, request: Request, response: Response):
     if len(query.query.strip().split()) < 3:
         return {"answer": "Запрос слишком короткий или неоднозначный, уточните, пожалуйста.", 'query': query.query}
-    try:
-        wrapped_prompt = wrap_prompt(query.query, query.genres)
-        answer = retrieval_chain.invoke(wrapped_prompt).get('result', '')
-
-        if not answer or any(phrase in answer.lower() for phrase in ["не найден", "не смог", "нет похожих", "ничего не найдено", "не найдено"]):
-            answer = search_agent.invoke(wrapped_prompt).get('result', '')
-            logger.error('2====> ')
-            logger.error(answer)
 
-        stats_agent_answer_agent = await movie_stats_agent.ainvoke(input=query)
-        stats_agent_answer = stats_agent_answer_agent['messages'][0].text()
-        logger.error('3====> ')
-        logger.error(stats_agent_answer_agent['messages'][0].text())
+    cache_key = make_cache_key("search", query.query, query.genres, query_filters(query))
+    cached = await get_cached_response(request, response, cache_key)
+    if cached is not None:
+        return cached
 
-        return {"query": query.query, "answer": answer + '\n' + stats_agent_answer}
+    try:
+        wrapped_prompt = wrap_prompt(query.query, query.genres)
+        pipeline_result = await run_search_pipeline(query.query, query.genres, wrapped_prompt,
+                                                    query_filters(query))
+
+        result = {"query": query.query, "answer": pipeline_result["answer"]}
+        # Частичные ответы (сработал таймаут стадии) не кэшируем
+        if not pipeline_result["degraded"]:
+            await store_cached_response(cache_key, result)
+        return result
     except Exception as e:
         logger.error(f"Ошибка в /search: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# TODO: разделить на 2 различных эндпоинта
-# один для файла
-# второй для ответа от гпт (возможно вместо второго стоит использовать эндпоинт /search)
+@router.get("/movies/{movie_id}/similar", response_model=SimilarMoviesResponse)
+def similar_movies(movie_id: int, favorite: List[str] = Query([]), hated: List[str] = Query([]),
+                   limit: int = Query(10, ge=1, le=50)):
+    """
+    Похожие фильмы из предрасчитанного графа без обращения к LLM: для "еще похожих" и карточки фильма.
+    Фильмы с нелюбимыми жанрами отбрасываются, с любимыми - поднимаются выше.
+    Обычная функция, а не корутина: чтение соседей из mmap-файлов выполняется в пуле потоков FastAPI.
+    """
+    results = find_similar_movies(current_vector_store(), movie_id, favorite, hated, limit)
+    if results is None:
+        raise HTTPException(status_code=404, detail="Movie not found")
+
+    fields = ("name", "year", "genres", "rating_kp", "rating_imdb")
+    similar = [{"id": document.metadata["id"], "score": round(score, 4),
+                **{field: document.metadata.get(field) for field in fields}}
+               for document, score in results]
+    return {"movie_id": movie_id, "similar": similar}
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/search/stream")
+async def search_movies_stream(query: MovieQuery, request: Request):
+    """
+    Потоковый вариант /search через Server-Sent Events: токены LLM отправляются по мере генерации,
+    границы стадий - отдельными событиями. При отключении клиента генерация на сервере отменяется.
+    """
+    async def events():
+        if len(query.query.strip().split()) < 3:
+            answer = "Запрос слишком короткий или неоднозначный, уточните, пожалуйста."
+            yield sse_event("done", {"answer": answer, "degraded": False})
+            return
+
+        cache_key = make_cache_key("search", query.query, query.genres, query_filters(query))
+        cached = await get_cached_response(request, Response(), cache_key)
+        if cached is not None:
+            yield sse_event("done", {"answer": cached["answer"], "degraded": False, "cached": True})
+            return
+
+        stream = stream_search_pipeline(query.query, query.genres, wrap_prompt(query.query, query.genres),
+                                        query_filters(query))
+        try:
+            async for event, data in stream:
+                if await request.is_disconnected():
+                    logger.info("Клиент отключился, генерация /search/stream отменена")
+                    break
+
+                if event == "done" and not data["degraded"]:
+                    await store_cached_response(cache_key, {"query": query.query, "answer": data["answer"]})
+                yield sse_event(event, data)
+        except Exception as e:
+            logger.error(f"Ошибка в /search/stream: {e}")
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            await stream.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/voice/audio",
+             response_class=StreamingResponse,
+             responses={200: {"content": {"audio/mpeg": {}}, "description": "MP3 audio stream"}},
+             )
+async def voice_audio(query: SpeechQuery):
+    """
+    Озвучивает готовый текст (например, ответ /search) и отдает audio/mpeg потоком:
+    каждое предложение отправляется, как только синтезировано, без base64 и буферизации всего ответа.
+    """
+    if not query.text.strip():
+        raise HTTPException(status_code=400, detail="Empty text")
+
+    return StreamingResponse(get_speech_synthesizer().stream(query.text), media_type="audio/mpeg")
+
+
 @router.post("/voice",
              response_model=VoiceResponse,
              responses={
@@ -85,23 +201,28 @@ async def search_movies(query: MovieQuery):
                  500: {"description": "Internal server error"}
              },
              )
-async def voice_interface(query: VoiceQuery):
+async def voice_interface(query: VoiceQuery, request: Request, response: Response):
+    cache_key = make_cache_key("voice", query.transcription, query.genres, query_filters(query))
+    cached = await get_cached_response(request, response, cache_key)
+    if cached is not None:
+        return cached
+
     try:
 
         # Обработка запроса
-        answer = await retrieval_chain.arun(wrap_prompt(query.transcription, query.genres))
+        chain = create_retrieval_chain(genres=query.genres, filters=query_filters(query),
+                                       search_query=query.transcription)
+        answer = (await chain.ainvoke(wrap_prompt(query.transcription, query.genres))).get('result', '')
 
-        # Генерация аудио в памяти
-        with io.BytesIO() as audio_buffer:
-            tts = gTTS(text=answer, lang="ru")
-            tts.write_to_fp(audio_buffer)
-            audio_buffer.seek(0)
-            audio_base64 = base64.b64encode(audio_buffer.read()).decode()
+        # Синтез идет в пуле потоков TTS с кэшем аудио; для потоковой отдачи есть /voice/audio
+        audio_base64 = base64.b64encode(await get_speech_synthesizer().synthesize(answer)).decode()
 
-        return {
+        result = {
             "answer": answer,
             "audio_base64": audio_base64
         }
+        await store_cached_response(cache_key, result)
+        return result
 
     except Exception as e:
         logger.error(f"Error: {str(e)}")
@@ -0,0 +1,188 @@
+import asyncio
+import contextvars
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from monitoring import record_cache, span
+from registry import registry
+
+TTS_BACKEND = os.getenv("TTS_BACKEND", "gtts")  # gtts | silent
+TTS_LANG = "ru"
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", "4"))
+AUDIO_CACHE_PATH = os.getenv("AUDIO_CACHE_PATH", "audio_cache")
+AUDIO_CACHE_MAX_FILES = int(os.getenv("AUDIO_CACHE_MAX_FILES", "5000"))
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Один кадр MPEG-1 Layer III 128 кбит/с 44.1 кГц с нулевыми данными - тишина длиной ~26 мс
+SILENT_MP3_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413
+
+
+class GTTSBackend:
+    """Синтез речи через Google TTS"""
+
+    name = "gtts"
+
+    def __init__(self, lang=TTS_LANG):
+        self.lang = lang
+
+    def synthesize(self, text: str) -> bytes:
+        from gtts import gTTS
+
+        with io.BytesIO() as audio_buffer:
+            gTTS(text=text, lang=self.lang).write_to_fp(audio_buffer)
+            return audio_buffer.getvalue()
+
+
+class SilentTTSBackend:
+    """Офлайн-замена gTTS для тестов: возвращает тишину, длина которой пропорциональна тексту"""
+
+    name = "silent"
+
+    def synthesize(self, text: str) -> bytes:
+        return SILENT_MP3_FRAME * max(1, len(text) // 4)
+
+
+class AudioCache:
+    """
+    Кэш синтезированного аудио на диске: один mp3-файл на хэш (бэкенд + текст).
+    Время изменения файла обновляется при каждом попадании, поэтому cleanup вытесняет давно не использованные
+    файлы (LRU), пока их не станет не больше max_files и суммарно не больше max_bytes.
+    """
+
+    CLEANUP_EVERY = 100
+    # Временные файлы старше этого возраста остались от упавших процессов
+    STALE_TMP_AGE = 3600
+
+    def __init__(self, path=AUDIO_CACHE_PATH, max_files=AUDIO_CACHE_MAX_FILES, max_bytes=AUDIO_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.writes = 0
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, backend_name, text):
+        key = hashlib.sha256(f"{backend_name}\0{text}".encode("utf-8")).hexdigest()
+        return os.path.join(self.path, key + ".mp3")
+
+    def get(self, backend_name, text):
+        path = self._file(backend_name, text)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            os.utime(path)
+            return audio
+        except OSError:
+            return None
+
+    def put(self, backend_name, text, audio: bytes):
+        # У каждого писателя свой временный файл: одно и то же предложение могут синтезировать
+        # одновременно несколько потоков и процессов, os.replace атомарно оставит одну из копий
+        with tempfile.NamedTemporaryFile(dir=self.path, suffix=".tmp", delete=False) as f:
+            f.write(audio)
+        os.replace(f.name, self._file(backend_name, text))
+
+        with self.lock:
+            self.writes += 1
+            need_cleanup = self.writes % self.CLEANUP_EVERY == 0
+        if need_cleanup:
+            self.cleanup()
+
+    def cleanup(self):
+        """Вытесняет давно не использованные файлы сверх max_files и max_bytes"""
+        files = []
+        now = time.time()
+        for entry in os.scandir(self.path):
+            try:
+                stat = entry.stat()
+                if entry.name.endswith(".tmp") and now - stat.st_mtime > self.STALE_TMP_AGE:
+                    os.remove(entry.path)
+                elif entry.name.endswith(".mp3"):
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+            except OSError:
+                continue
+
+        files.sort()
+        count = len(files)
+        total_bytes = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if count <= self.max_files and total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            count -= 1
+            total_bytes -= size
+
+
+def create_tts_backend(name=TTS_BACKEND):
+    if name == "silent":
+        return SilentTTSBackend()
+    return GTTSBackend()
+
+
+def split_sentences(text: str) -> list:
+    """Делит ответ на предложения, чтобы синтезировать и отдавать аудио по частям"""
+    sentences = re.split(r"(?<=[.!?…])\s+|\n+", text)
+    return [sentence.strip() for sentence in sentences if sentence.strip()]
+
+
+class SpeechSynthesizer:
+    """
+    Синтез речи в отдельном пуле потоков с кэшем аудио по предложениям.
+    Повторяющиеся ответы (и отдельные предложения) не синтезируются повторно.
+    """
+
+    def __init__(self, backend=None, cache=None, workers=TTS_WORKERS):
+        self.backend = backend or create_tts_backend()
+        self.cache = cache if cache is not None else AudioCache()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts")
+
+    def synthesize_sentence(self, sentence: str) -> bytes:
+        audio = self.cache.get(self.backend.name, sentence)
+        record_cache("audio", "miss" if audio is None else "hit")
+        if audio is None:
+            with span("tts.synthesize"):
+                audio = self.backend.synthesize(sentence)
+            self.cache.put(self.backend.name, sentence, audio)
+        return audio
+
+    async def stream(self, text: str):
+        """
+        Асинхронный генератор mp3-фрагментов по предложениям.
+        Предложения синтезируются параллельно, а отдаются по порядку, как только готово очередное.
+        """
+        loop = asyncio.get_running_loop()
+        # Контекст копируется, чтобы спаны синтеза попали в трассу запроса
+        futures = [
+            loop.run_in_executor(self.executor, contextvars.copy_context().run, self.synthesize_sentence, sentence)
+            for sentence in split_sentences(text)
+        ]
+        try:
+            for future in futures:
+                yield await future
+        finally:
+            # Клиент отключился - не синтезируем оставшиеся предложения
+            for future in futures:
+                future.cancel()
+
+    async def synthesize(self, text: str) -> bytes:
+        return b"".join([chunk async for chunk in self.stream(text)])
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Создается при прогреве или первом обращении: импорт не создает каталог кэша аудио и пул потоков
+registry.register("speech_synthesizer", SpeechSynthesizer, required=False)
+
+
+def get_speech_synthesizer() -> SpeechSynthesizer:
+    return registry.get("speech_synthesizer")
@@ -0,0 +1,270 @@
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, List
+from urllib.parse import parse_qs, urlparse
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import BaseTool
+
+from AI.embedding_cache import HashEmbeddings
+from backend.tts import SilentTTSBackend
+
+# Детерминированные локальные заглушки внешних сервисов (OpenAI, Tavily, Кинопоиск, gTTS)
+# с настраиваемым распределением задержек. Используются нагрузочным тестом bench/load_test.py.
+
+
+class LatencyModel:
+    """
+    Распределение задержки, задается строкой:
+        fixed:200             - всегда 200 мс
+        uniform:100,300       - равномерно от 100 до 300 мс
+        lognormal:800,0.5     - логнормальное с медианой 800 мс и sigma 0.5
+    """
+
+    def __init__(self, spec: str, seed: int = 0):
+        self.spec = spec
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(value) for value in params.split(",") if value]
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+        if kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Неизвестное распределение задержки: {spec}")
+
+    def sample_ms(self) -> float:
+        with self.lock:
+            if self.kind == "fixed":
+                return self.params[0]
+            if self.kind == "uniform":
+                return self.rng.uniform(self.params[0], self.params[1])
+            median, sigma = self.params
+            return self.rng.lognormvariate(0, sigma) * median
+
+    def sample(self) -> float:
+        return self.sample_ms() / 1000
+
+    def sleep(self):
+        time.sleep(self.sample())
+
+    async def asleep(self):
+        await asyncio.sleep(self.sample())
+
+
+def stable_fraction(text: str) -> float:
+    """Детерминированное число из [0, 1) по тексту"""
+    return int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16) / 0x100000000
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Заглушка чат-модели: отвечает шаблонным текстом после задержки из распределения,
+    умеет стримить ответ по словам и не вызывает инструменты (агенты завершаются за один шаг).
+    Доля запросов fallback_rate (детерминированно по тексту) получает ответ "не смог найти",
+    чтобы нагружать ветку веб-поиска.
+    """
+
+    latency: str = "lognormal:300,0.4"
+    fallback_rate: float = 0.2
+    seed: int = 0
+    latency_model: Any = None
+
+    def model_post_init(self, __context):
+        self.latency_model = LatencyModel(self.latency, self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def answer(self, messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(message.text() for message in messages)
+        if "подсчет статистики" in prompt:
+            return ""
+        if "поиск фильмов в интернете" in prompt:
+            return "В интернете нашелся фильм 'Тестовый фильм' (рейтинг IMDB 7.5, рейтинг взят с IMDB)."
+        if stable_fraction(prompt) < self.fallback_rate:
+            return "Извините, к сожалению, я не смог найти подходящих фильмов или сериалов"
+        return ("Могу порекомендовать фильм 'Фильм " + hashlib.md5(prompt.encode("utf-8")).hexdigest()[:6] +
+                "'. Рейтинг на IMDB 7.8, рейтинг взят с IMDB. Это история, которая вам понравится.")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self.latency_model.sleep()
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer(messages)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await self.latency_model.asleep()
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer(messages)))])
+
+    def _chunks(self, messages):
+        words = self.answer(messages).split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words) if word or i == 0]
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        chunks = self._chunks(messages)
+        delay = self.latency_model.sample() / len(chunks)
+        for token in chunks:
+            time.sleep(delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        chunks = self._chunks(messages)
+        delay = self.latency_model.sample() / len(chunks)
+        for token in chunks:
+            await asyncio.sleep(delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+class FakeEmbeddings(HashEmbeddings):
+    """HashEmbeddings с задержкой на каждый вызов, как у удаленной модели"""
+
+    def __init__(self, latency: str = "fixed:5", dim: int = 256, seed: int = 0):
+        super().__init__(dim=dim)
+        self.latency_model = LatencyModel(latency, seed)
+
+    def embed_documents(self, texts):
+        self.latency_model.sleep()
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.latency_model.sleep()
+        return super().embed_query(text)
+
+
+class FakeSearchTool(BaseTool):
+    """Заглушка Tavily: возвращает фиксированные результаты после задержки"""
+
+    name: str = "tavily_search_results_json"
+    description: str = "Поиск в интернете. Принимает поисковый запрос."
+    latency: str = "lognormal:400,0.5"
+    seed: int = 0
+    latency_model: Any = None
+
+    def model_post_init(self, __context):
+        self.latency_model = LatencyModel(self.latency, self.seed)
+
+    def results(self, query: str) -> list:
+        return [{"url": "https://example.org/movie", "content": f"Фильм по запросу: {query}"}]
+
+    def _run(self, query: str, run_manager=None) -> list:
+        self.latency_model.sleep()
+        return self.results(query)
+
+    async def _arun(self, query: str, run_manager=None) -> list:
+        await self.latency_model.asleep()
+        return self.results(query)
+
+
+class LatencyTTSBackend(SilentTTSBackend):
+    """Тишина вместо gTTS с задержкой синтеза на каждое предложение"""
+
+    name = "silent-latency"
+
+    def __init__(self, latency: str = "fixed:50", seed: int = 0):
+        self.latency_model = LatencyModel(latency, seed)
+
+    def synthesize(self, text: str) -> bytes:
+        self.latency_model.sleep()
+        return super().synthesize(text)
+
+
+GENRES = ["драма", "комедия", "боевик", "фантастика", "ужасы", "мелодрама", "триллер", "мультфильм",
+          "детектив", "приключения", "фэнтези", "криминал", "семейный", "документальный"]
+COUNTRIES = ["Россия", "США", "Франция", "Китай", "Япония", "Корея Южная", "Великобритания"]
+WORDS = ["история", "герой", "город", "любовь", "тайна", "путешествие", "война", "семья", "дружба", "космос",
+         "мечта", "преступление", "спасение", "прошлое", "будущее", "команда", "испытание", "судьба"]
+
+
+def fixture_movie(movie_id: int, rng: random.Random) -> dict:
+    """Синтетический фильм в формате ответа API Кинопоиска"""
+    genres = rng.sample(GENRES, rng.randint(1, 3))
+    description = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 16))).capitalize() + "."
+    return {
+        "id": movie_id,
+        "name": f"Фильм {movie_id}",
+        "type": rng.choice(["movie", "tv-series", "cartoon"]),
+        "year": rng.randint(1990, 2025),
+        "shortDescription": description,
+        "status": "completed",
+        "rating": {"kp": round(rng.uniform(6, 9.5), 3), "imdb": round(rng.uniform(5.5, 9), 1)},
+        "genres": [{"name": genre} for genre in genres],
+        "countries": [{"name": rng.choice(COUNTRIES)}],
+        "persons": [{"id": movie_id * 10 + i, "name": f"Актер {movie_id * 10 + i}", "enProfession": "actor"}
+                    for i in range(rng.randint(1, 4))],
+        "similarMovies": [{"id": rng.randint(1, movie_id + 100)} for _ in range(rng.randint(0, 3))],
+    }
+
+
+class FakeKinopoiskServer:
+    """
+    Локальный HTTP-сервер, отдающий страницы каталога в формате /v1.4/movie?page=N&limit=L.
+    Контент детерминирован по seed, задержка ответа задается распределением.
+    """
+
+    def __init__(self, total_movies: int = 10_000, latency: str = "fixed:20", seed: int = 0):
+        self.total_movies = total_movies
+        self.latency_model = LatencyModel(latency, seed)
+        self.seed = seed
+        self.requests = 0
+        self.server = None
+        self.thread = None
+
+    def page(self, page: int, limit: int) -> dict:
+        start = (page - 1) * limit
+        ids = range(start + 1, min(start + limit, self.total_movies) + 1)
+        docs = [fixture_movie(movie_id, random.Random(self.seed * 1_000_003 + movie_id)) for movie_id in ids]
+        pages = (self.total_movies + limit - 1) // limit
+        return {"docs": docs, "total": self.total_movies, "limit": limit, "page": page, "pages": pages}
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake.requests += 1
+                url = urlparse(self.path)
+                if not url.path.endswith("/movie"):
+                    self.send_error(404)
+                    return
+
+                query = parse_qs(url.query)
+                fake.latency_model.sleep()
+                body = json.dumps(fake.page(int(query.get("page", ["1"])[0]), int(query.get("limit", ["250"])[0])),
+                                  ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    @property
+    def api_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1.4/"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
@@ -0,0 +1,144 @@
+import argparse
+import gc
+import json
+import os
+import time
+
+import faiss
+import numpy as np
+
+from AI.index_factory import build_faiss_index
+
+DEFAULT_CONFIGS = [
+    {"index_type": "flat"},
+    {"index_type": "ivf_flat", "nlist": 1024, "nprobe": 8},
+    {"index_type": "ivf_flat", "nlist": 1024, "nprobe": 32},
+    {"index_type": "ivf_pq", "nlist": 1024, "nprobe": 16, "pq_m": 64, "pq_nbits": 8},
+    {"index_type": "ivf_pq", "nlist": 1024, "nprobe": 64, "pq_m": 128, "pq_nbits": 8},
+    {"index_type": "hnsw", "hnsw_m": 16, "ef_search": 64},
+    {"index_type": "hnsw", "hnsw_m": 32, "ef_search": 128},
+]
+
+
+def resident_memory_bytes():
+    """RSS текущего процесса (Linux)"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def synthetic_embeddings(n_vectors, dim, n_clusters=200, seed=0):
+    """Кластеризованные нормированные векторы, по распределению похожие на эмбеддинги текстов"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size=n_vectors)
+    vectors = centers[labels] + 0.5 * rng.normal(size=(n_vectors, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def load_embeddings(path):
+    """Векторы из .npy или из файла кэша эмбеддингов (vectors.f32 + index.json рядом)"""
+    if path.endswith(".npy"):
+        return np.load(path).astype(np.float32)
+
+    with open(os.path.join(os.path.dirname(path), "index.json"), encoding="utf-8") as f:
+        index = json.load(f)
+    vectors = np.memmap(path, dtype=np.float32, mode="r", shape=(index["capacity"], index["dim"]))
+    slots = sorted(slot for slot, _ in index["entries"].values())
+    return np.array(vectors[slots])
+
+
+def recall_at_k(found, truth, k):
+    hits = sum(len(set(row[:k]) & set(expected[:k])) for row, expected in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def benchmark_config(vectors, queries, truth, k, config):
+    config = dict(config)
+    index_type = config.pop("index_type")
+
+    gc.collect()
+    rss_before = resident_memory_bytes()
+    started_at = time.perf_counter()
+    index = build_faiss_index(vectors, index_type, **config)
+    build_seconds = time.perf_counter() - started_at
+    rss_after = resident_memory_bytes()
+
+    # Задержка одиночного запроса - так индекс используется при обслуживании /search
+    latencies = []
+    found = []
+    for query in queries:
+        started_at = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - started_at) * 1000)
+        found.append(ids[0].tolist())
+
+    return {
+        "index_type": index_type,
+        "params": config,
+        "build_seconds": round(build_seconds, 3),
+        f"recall@{k}": round(recall_at_k(found, truth, k), 4),
+        "latency_ms_p50": round(float(np.percentile(latencies, 50)), 4),
+        "latency_ms_p99": round(float(np.percentile(latencies, 99)), 4),
+        "index_bytes": int(faiss.serialize_index(index).nbytes),
+        "rss_delta_bytes": rss_after - rss_before,
+    }
+
+
+def main():
+    """
+    Сравнение типов индекса FAISS: recall@k относительно точного поиска, p50/p99 задержки запроса
+    и потребление памяти. Пример:
+        python -m bench.index_benchmark --vectors 100000 --dim 1536 --output index_bench.json
+        python -m bench.index_benchmark --embeddings embedding_cache/text-embedding-ada-002/vectors.f32
+    """
+    parser = argparse.ArgumentParser(description="Бенчмарк индексов FAISS")
+    parser.add_argument("--vectors", type=int, default=100_000, help="размер синтетического набора")
+    parser.add_argument("--dim", type=int, default=1536, help="размерность синтетических векторов")
+    parser.add_argument("--embeddings", help="сохраненные эмбеддинги (.npy или vectors.f32 кэша)")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--configs", help="JSON-файл со списком конфигураций индексов")
+    parser.add_argument("--output", help="куда сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    vectors = load_embeddings(args.embeddings) if args.embeddings else synthetic_embeddings(args.vectors, args.dim)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)]
+    # Запросы немного сдвинуты, чтобы не совпадать с векторами индекса
+    queries = np.ascontiguousarray(queries + 0.05 * rng.normal(size=queries.shape).astype(np.float32))
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+    truth = truth.tolist()
+    del exact
+
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs, encoding="utf-8") as f:
+            configs = json.load(f)
+
+    print(f"====> {len(vectors)} векторов, размерность {vectors.shape[1]}, {len(queries)} запросов, k={args.k}")
+    results = []
+    for config in configs:
+        result = benchmark_config(vectors, queries, truth, args.k, config)
+        results.append(result)
+        print(f"{result['index_type']:<9} {json.dumps(result['params']):<60} "
+              f"recall@{args.k}={result[f'recall@{args.k}']:<7} p50={result['latency_ms_p50']}ms "
+              f"p99={result['latency_ms_p99']}ms index={result['index_bytes'] / 2 ** 20:.1f}MiB "
+              f"build={result['build_seconds']}s")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "vectors": len(vectors),
+                "dim": int(vectors.shape[1]),
+                "queries": len(queries),
+                "k": args.k,
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ENDPOINTS = ("search", "voice")
+
+
+def configure_environment(workdir, args):
+    """
+    Настройки приложения читаются из окружения при импорте модулей,
+    поэтому окружение выставляется до импорта backend и AI.
+    """
+    os.environ.update({
+        "EMBEDDINGS_BACKEND": "hash",
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache"),
+        "VECTOR_STORE_PATH": os.path.join(workdir, "movie_vector_store"),
+        "AUDIO_CACHE_PATH": os.path.join(workdir, "audio_cache"),
+        "RESPONSE_CACHE_BACKEND": "memory" if args.cache else "none",
+        "TTS_BACKEND": "silent",
+        "KINOPOISK_API_KEY": "bench",
+    })
+
+
+def build_catalog(api_url, movies_count):
+    """Скачивает каталог с фейкового Кинопоиска и публикует индекс, не трогая БД"""
+    import external_api.api as kinopoisk
+    from AI.index_factory import create_faiss_store
+    from AI.vector import get_embeddings, prepare_movies, save_vector_store
+
+    kinopoisk.api_url = api_url
+    pages = (movies_count + kinopoisk.MOVIES_PAGE_LIMIT - 1) // kinopoisk.MOVIES_PAGE_LIMIT
+    movies = kinopoisk.get_movies(1, pages, rate_limit=0, checkpoint_path=None)
+    texts, metadatas, ids = prepare_movies(movies)
+    save_vector_store(create_faiss_store(texts, get_embeddings(), metadatas, ids))
+    return len(movies)
+
+
+def install_fakes(args):
+    """Подменяет LLM, веб-поиск, эмбеддинги запросов и синтез речи локальными заглушками"""
+    from AI.mmap_store import GenerationalVectorStore
+    from AI.vector import VECTOR_STORE_PATH
+    from backend.health import readiness
+    from backend.tts import SpeechSynthesizer
+    from bench.fakes import FakeChatModel, FakeEmbeddings, FakeSearchTool, LatencyTTSBackend
+    from registry import registry
+
+    registry.override("llm", FakeChatModel(latency=args.llm_latency, fallback_rate=args.fallback_rate,
+                                           seed=args.seed))
+    registry.override("tavily_tool", FakeSearchTool(latency=args.search_latency, seed=args.seed))
+    registry.override("vector_store", GenerationalVectorStore(VECTOR_STORE_PATH,
+                                                              FakeEmbeddings(args.embedding_latency)))
+    registry.override("speech_synthesizer", SpeechSynthesizer(LatencyTTSBackend(args.tts_latency, seed=args.seed)))
+    # Прогрев (БД, реальные компоненты) не нужен: все зависимости уже подменены
+    readiness.ready = True
+
+
+def make_queries(count, seed):
+    """Набор различных запросов; повторы в нагрузке дают попадания в кэш ответов при --cache"""
+    from bench.fakes import GENRES, WORDS
+
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        words = rng.sample(WORDS, 2)
+        genres = rng.sample(GENRES, 3)
+        queries.append({
+            "text": f"посоветуй фильм про {words[0]} и {words[1]}",
+            "genres": {"favorite": genres[:2], "hated": genres[2:]},
+        })
+    return queries
+
+
+def request_body(endpoint, query):
+    if endpoint == "voice":
+        return {"transcription": query["text"], "genres": query["genres"]}
+    return {"query": query["text"], "genres": query["genres"]}
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    values = np.asarray(values) * 1000
+    return {
+        "count": len(values),
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+        "p99_ms": round(float(np.percentile(values, 99)), 2),
+        "max_ms": round(float(values.max()), 2),
+    }
+
+
+async def run_load(client, args, queries):
+    """Гоняет args.requests запросов с args.concurrency одновременно выполняющимися клиентами"""
+    rng = random.Random(args.seed)
+    mix = [endpoint for endpoint in ENDPOINTS for _ in range(getattr(args, f"{endpoint}_weight"))]
+    plan = [(rng.choice(mix), rng.choice(queries)) for _ in range(args.requests)]
+
+    latencies = defaultdict(list)
+    statuses = defaultdict(lambda: defaultdict(int))
+    errors = defaultdict(int)
+    next_request = iter(plan)
+
+    async def worker():
+        for endpoint, query in next_request:
+            started_at = time.perf_counter()
+            try:
+                response = await client.post(f"/{endpoint}", json=request_body(endpoint, query),
+                                             timeout=args.timeout)
+                statuses[endpoint][response.status_code] += 1
+                if response.status_code == 200:
+                    latencies[endpoint].append(time.perf_counter() - started_at)
+                else:
+                    errors[endpoint] += 1
+            except Exception as e:
+                statuses[endpoint][type(e).__name__] += 1
+                errors[endpoint] += 1
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started_at
+
+    return {
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(args.requests / elapsed, 2),
+        "endpoints": {
+            endpoint: {
+                **percentiles(latencies[endpoint]),
+                "errors": errors[endpoint],
+                "statuses": {str(status): count for status, count in statuses[endpoint].items()},
+            }
+            for endpoint in statuses
+        },
+    }
+
+
+async def run(args):
+    import httpx
+
+    stage_timings = defaultdict(list)
+    stage_statuses = defaultdict(lambda: defaultdict(int))
+
+    if args.url:
+        # Внешний сервер: заглушки в нем должны быть настроены отдельно, per-stage метрики недоступны
+        transport = None
+        base_url = args.url
+    else:
+        from backend.pipeline import stage_observers
+        from main import BLOCKING_POOL_SIZE, app
+
+        def observe(name, seconds, status):
+            stage_timings[name].append(seconds)
+            stage_statuses[name][status] += 1
+
+        stage_observers.append(observe)
+        # ASGITransport не запускает lifespan, поэтому ограниченный пул потоков выставляется здесь
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=BLOCKING_POOL_SIZE))
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://bench"
+
+    queries = make_queries(args.distinct_queries, args.seed)
+    async with httpx.AsyncClient(transport=transport, base_url=base_url) as client:
+        if args.warmup:
+            warmup_args = argparse.Namespace(**{**vars(args), "requests": args.warmup})
+            await run_load(client, warmup_args, queries)
+            stage_timings.clear()
+            stage_statuses.clear()
+
+        report = await run_load(client, args, queries)
+
+    report["stages"] = {
+        name: {**percentiles(stage_timings[name]), "statuses": dict(stage_statuses[name])}
+        for name in stage_timings
+    }
+    return report
+
+
+def print_report(report):
+    print(f"====> {report['seconds']} сек, {report['throughput_rps']} запросов/сек")
+    for group in ("endpoints", "stages"):
+        for name, stats in sorted(report[group].items()):
+            print(f"{group[:-1]:<8} {name:<12} n={stats.get('count', 0):<6} p50={stats.get('p50_ms')}ms "
+                  f"p95={stats.get('p95_ms')}ms p99={stats.get('p99_ms')}ms {json.dumps(stats['statuses'])}")
+
+
+def main():
+    """
+    Воспроизводимый нагрузочный тест /search и /voice без сети: OpenAI, Tavily, Кинопоиск и gTTS
+    заменены заглушками с заданными распределениями задержек (fixed:MS, uniform:MIN,MAX, lognormal:MEDIAN,SIGMA).
+    Пример:
+        python -m bench.load_test --requests 2000 --concurrency 64 --llm-latency lognormal:800,0.5
+        python -m bench.load_test --cache --distinct-queries 50 --output load.json
+    """
+    parser = argparse.ArgumentParser(description="Нагрузочный тест /search и /voice")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=20, help="запросов до начала замеров")
+    parser.add_argument("--search-weight", type=int, default=3, help="доля /search в смеси запросов")
+    parser.add_argument("--voice-weight", type=int, default=1, help="доля /voice в смеси запросов")
+    parser.add_argument("--distinct-queries", type=int, default=200)
+    parser.add_argument("--movies", type=int, default=5000, help="размер синтетического каталога")
+    parser.add_argument("--llm-latency", default="lognormal:800,0.5")
+    parser.add_argument("--fallback-rate", type=float, default=0.2, help="доля ответов RAG 'не нашел'")
+    parser.add_argument("--search-latency", default="lognormal:600,0.6")
+    parser.add_argument("--embedding-latency", default="lognormal:80,0.3")
+    parser.add_argument("--tts-latency", default="uniform:100,300")
+    parser.add_argument("--kinopoisk-latency", default="fixed:20")
+    parser.add_argument("--cache", action="store_true", help="включить кэш ответов (memory)")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="нагружать уже запущенный сервер вместо приложения в процессе")
+    parser.add_argument("--output", help="куда сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="load_test_") as workdir:
+        configure_environment(workdir, args)
+        if not args.url:
+            from bench.fakes import FakeKinopoiskServer
+
+            kinopoisk = FakeKinopoiskServer(args.movies, args.kinopoisk_latency, args.seed).start()
+            try:
+                movies = build_catalog(kinopoisk.api_url, args.movies)
+            finally:
+                kinopoisk.stop()
+            print(f"====> Каталог: {movies} фильмов")
+            install_fakes(args)
+
+        report = asyncio.run(run(args))
+
+    report["config"] = {key: value for key, value in vars(args).items() if key != "output"}
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
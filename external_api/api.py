@@ -1,40 +1,248 @@
+import json
 import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from requests import RequestException, get
+from requests import RequestException, Session
+from requests.adapters import HTTPAdapter
 
-from setup import kinopoisk_api_key
+from setup import require_env
 
 api_url = "https://api.kinopoisk.dev/v1.4/"
 
+MOVIES_PAGE_LIMIT = 250
+MOVIES_QUERY = (
+    "movie?page={page}&limit={limit}&selectFields=id&selectFields=name&selectFields=shortDescription"
+    "&selectFields=type&selectFields=year&selectFields=rating&selectFields=status&selectFields=genres"
+    "&selectFields=countries&selectFields=persons&selectFields=similarMovies&notNullFields=name"
+    "&notNullFields=shortDescription&notNullFields=rating.kp&notNullFields=genres.name&notNullFields=persons.name"
+    "&year=1990-2025&rating.kp=6-10"
+)
 
-def get_movies(pages_start=1, pages_count=1):
-    get_movies_url = api_url + "movie?page=1&limit=250&selectFields=id&selectFields=name&selectFields=shortDescription&selectFields=type&selectFields=year&selectFields=rating&selectFields=status&selectFields=genres&selectFields=countries&selectFields=persons&selectFields=similarMovies&notNullFields=name&notNullFields=shortDescription&notNullFields=rating.kp&notNullFields=genres.name&notNullFields=persons.name&year=1990-2025&rating.kp=6-10"
-    all_movies = []
+# Параметры загрузки каталога (можно переопределить через переменные окружения)
+KINOPOISK_CONCURRENCY = int(os.getenv("KINOPOISK_CONCURRENCY", "8"))
+KINOPOISK_RATE_LIMIT = float(os.getenv("KINOPOISK_RATE_LIMIT", "10"))  # запросов в секунду
+KINOPOISK_MAX_RETRIES = int(os.getenv("KINOPOISK_MAX_RETRIES", "4"))
+KINOPOISK_BACKOFF = float(os.getenv("KINOPOISK_BACKOFF", "0.5"))  # базовая задержка в секундах
+KINOPOISK_TIMEOUT = float(os.getenv("KINOPOISK_TIMEOUT", "30"))
+CHECKPOINT_PATH = os.getenv("KINOPOISK_CHECKPOINT_PATH", "kinopoisk_checkpoint.jsonl")
 
-    print('===> Началось получение фильмов по Api')
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Потокобезопасный token bucket для соблюдения квоты API.
+    rate - скорость пополнения (токенов в секунду), capacity - максимальный размер всплеска.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Блокирует поток, пока в ведре не появится свободный токен"""
+        if self.rate <= 0:
+            return
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class PageCheckpoint:
+    """
+    Чекпоинт загрузки каталога: JSONL-файл, в который дописывается каждая успешно скачанная страница.
+    Прерванная загрузка при следующем запуске продолжается с недостающих страниц.
+    Первая строка - ключ загрузки (запрос, размер страницы, диапазон страниц): чекпоинт другой загрузки
+    (или старого формата без ключа) отбрасывается, а не восстанавливается как свой.
+    """
+
+    def __init__(self, path, key=None):
+        self.path = path
+        self.key = key
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Возвращает словарь {номер страницы: список фильмов} из уже сохраненных страниц"""
+        pages = {}
+        if not self.path or not os.path.exists(self.path):
+            return pages
+
+        with open(self.path, encoding="utf-8") as f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                header = None
+            if isinstance(header, dict) and header.get("key") == self.key:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Последняя строка могла быть записана не полностью при аварийной остановке
+                        continue
+                    pages[record["page"]] = record["docs"]
+                return pages
+
+        logging.warning(f"Checkpoint {self.path} belongs to another catalog download, discarding it")
+        self.clear()
+        return pages
+
+    def save_page(self, page, docs):
+        if not self.path:
+            return
+
+        line = json.dumps({"page": page, "docs": docs}, ensure_ascii=False)
+        with self.lock, open(self.path, "a", encoding="utf-8") as f:
+            if f.tell() == 0:
+                f.write(json.dumps({"key": self.key}, ensure_ascii=False) + "\n")
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
 
-    for i in range(pages_start, pages_start + pages_count):
+
+def create_session(pool_size=KINOPOISK_CONCURRENCY):
+    """Создает HTTP-сессию с пулом соединений под заданное количество параллельных запросов"""
+    session = Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"X-API-KEY": require_env("KINOPOISK_API_KEY")})
+    return session
+
+
+def fetch_movies_page(session, page, bucket=None, max_retries=KINOPOISK_MAX_RETRIES, backoff=KINOPOISK_BACKOFF):
+    """
+    Скачивает одну страницу каталога. Сетевые ошибки и ответы 429/5xx повторяются
+    с экспоненциальной задержкой и джиттером.
+    """
+    url = api_url + MOVIES_QUERY.format(page=page, limit=MOVIES_PAGE_LIMIT)
+
+    for attempt in range(max_retries + 1):
+        if bucket is not None:
+            bucket.acquire()
+
+        delay = backoff * (2 ** attempt) * (1 + random.random())
         try:
-            response = get(get_movies_url, headers={"X-API-KEY": kinopoisk_api_key})
-            response.raise_for_status()
+            response = session.get(url, timeout=KINOPOISK_TIMEOUT)
 
-            movies = response.json()
+            if response.status_code in RETRYABLE_STATUS_CODES and attempt < max_retries:
+                retry_after = response.headers.get("Retry-After")
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+                logging.warning(f"Page {page}: status {response.status_code}, retry in {delay:.2f}s")
+                time.sleep(delay)
+                continue
 
-            all_movies += movies['docs']
+            response.raise_for_status()
+            return response.json()['docs']
 
         except RequestException as e:
-            logging.error(f"Request failed for page {i}: {str(e)}")
-            break  # или continue для пропуска ошибки
+            if attempt >= max_retries:
+                raise
+            logging.warning(f"Request failed for page {page}: {str(e)}, retry in {delay:.2f}s")
+            time.sleep(delay)
+
+
+def dedupe_movies(movies):
+    """Убирает повторы по id Кинопоиска, сохраняя порядок первого появления"""
+    seen = set()
+    unique = []
+    for movie in movies:
+        movie_id = movie.get("id")
+        if movie_id in seen:
+            continue
+        seen.add(movie_id)
+        unique.append(movie)
+    return unique
+
+
+def get_movies(pages_start=1, pages_count=1, concurrency=KINOPOISK_CONCURRENCY, rate_limit=KINOPOISK_RATE_LIMIT,
+               checkpoint_path=CHECKPOINT_PATH, snapshot=None):
+    """
+    Параллельно скачивает страницы каталога [pages_start, pages_start + pages_count).
+    Запросы идут через общий пул соединений и ограничиваются token bucket'ом,
+    каждая страница повторяется при ошибках, а скачанные страницы сохраняются в чекпоинт.
+    Если передан snapshot (external_api.snapshot.SnapshotWriter), страницы по мере получения дописываются в снимок.
+    Возвращает фильмы без повторов по id.
+    """
+    pages = list(range(pages_start, pages_start + pages_count))
+    key = {"query": MOVIES_QUERY, "limit": MOVIES_PAGE_LIMIT, "pages_start": pages_start, "pages_count": pages_count}
+    checkpoint = PageCheckpoint(checkpoint_path, key)
+    done = {page: docs for page, docs in checkpoint.load().items() if page in pages}
+    pending = [page for page in pages if page not in done]
+
+    print('===> Началось получение фильмов по Api')
+    if done:
+        print('===> Из чекпоинта восстановлено ', len(done), ' страниц')
+    if snapshot is not None:
+        snapshot.expect_pages(pages)
+        for page in sorted(done):
+            snapshot.write_page(page, done[page])
+
+    started_at = time.perf_counter()
+    failed = []
+
+    if pending:
+        bucket = TokenBucket(rate_limit)
+        workers = max(1, min(concurrency, len(pending)))
+
+        with create_session(workers) as session, ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(fetch_movies_page, session, page, bucket): page for page in pending}
+
+            for future in as_completed(futures):
+                page = futures[future]
+                try:
+                    docs = future.result()
+                except RequestException as e:
+                    logging.error(f"Request failed for page {page}: {str(e)}")
+                    failed.append(page)
+                    continue
+                except ValueError as e:
+                    logging.error(f"JSON parsing error for page {page}: {str(e)}")
+                    failed.append(page)
+                    continue
+                except Exception as e:
+                    logging.error(f"Unexpected error for page {page}: {str(e)}")
+                    failed.append(page)
+                    continue
+
+                done[page] = docs
+                checkpoint.save_page(page, docs)
+                if snapshot is not None:
+                    snapshot.write_page(page, docs)
 
-        except ValueError as e:
-            logging.error(f"JSON parsing error for page {i}: {str(e)}")
-            break
+    all_movies = dedupe_movies(movie for page in sorted(done) for movie in done[page])
 
-        except Exception as e:
-            logging.error(f"Unexpected error for page {i}: {str(e)}")
-            break
+    if failed:
+        # Чекпоинт остается на диске: следующий вызов докачает только пропущенные страницы
+        logging.error(f"Pages not loaded: {sorted(failed)}")
+        if snapshot is not None:
+            snapshot.mark_failed(failed)
+    else:
+        checkpoint.clear()
 
-    print('====> получено ', len(all_movies), ' фильмов')
+    print('====> получено ', len(all_movies), ' фильмов за ', round(time.perf_counter() - started_at, 2), ' сек')
     return all_movies
 
 
@@ -0,0 +1,217 @@
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Снимки сырого каталога Кинопоиска для офлайн-пересборки индекса и БД без обращения к API:
+#
+#     catalog_snapshots/
+#         LATEST                   - имя последнего полного снимка, подменяется атомарно через os.replace
+#         snap-000001/
+#             movies.jsonl.gz      - документы API как есть, по одному JSON на строку, без повторов по id
+#             manifest.json        - версия формата, время создания, число фильмов, страницы, запрос к API
+#
+# Снимок пишется во временный каталог и переименовывается целиком, поэтому читатели не видят недописанных файлов.
+
+SNAPSHOT_FORMAT_VERSION = 1
+LATEST_FILE = "LATEST"
+MOVIES_FILE = "movies.jsonl.gz"
+MANIFEST_FILE = "manifest.json"
+
+# Пустое значение отключает запись снимков при скачивании каталога
+CATALOG_SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH", "catalog_snapshots")
+# Сколько снимков хранить на диске
+KEEP_SNAPSHOTS = int(os.getenv("CATALOG_KEEP_SNAPSHOTS", "5"))
+SNAPSHOT_COMPRESS_LEVEL = int(os.getenv("CATALOG_SNAPSHOT_COMPRESS_LEVEL", "6"))
+
+
+class SnapshotError(Exception):
+    """Снимок не найден, неполный или поврежден"""
+
+
+def list_snapshots(path):
+    if not os.path.isdir(path):
+        return []
+    return sorted(name for name in os.listdir(path)
+                  if name.startswith("snap-") and not name.endswith(".tmp")
+                  and os.path.isdir(os.path.join(path, name)))
+
+
+def read_latest_snapshot(path):
+    try:
+        with open(os.path.join(path, LATEST_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def read_manifest(path, name=None, allow_incomplete=False):
+    """
+    Манифест снимка name (по умолчанию - последнего полного).
+    Неполный снимок (были ошибки загрузки страниц) отклоняется, если не передан allow_incomplete.
+    """
+    name = name or read_latest_snapshot(path)
+    if name is None:
+        raise SnapshotError(f"В '{path}' нет полных снимков каталога")
+    try:
+        with open(os.path.join(path, name, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except OSError:
+        raise SnapshotError(f"Снимок каталога '{name}' не найден в '{path}'")
+
+    if manifest.get("format") != SNAPSHOT_FORMAT_VERSION:
+        raise SnapshotError(f"Снимок '{name}' в неподдерживаемом формате {manifest.get('format')}")
+    if not manifest.get("complete") and not allow_incomplete:
+        raise SnapshotError(f"Снимок '{name}' неполный: не загружены страницы {manifest.get('failed_pages')}")
+    return manifest
+
+
+class SnapshotWriter:
+    """
+    Потоково записывает сырые документы каталога в новый снимок по мере скачивания страниц.
+    Потокобезопасен: страницы можно дописывать из воркеров загрузки. Страницы записываются по возрастанию номера
+    (пришедшие раньше очереди ждут в памяти), а из повторов по id остается первый - как в dedupe_movies,
+    поэтому пересборка из снимка видит те же документы, что и сборка по свежему каталогу.
+    Снимок публикуется при выходе из with; если были ошибки загрузки (mark_failed), он сохраняется,
+    но LATEST на него не переключается. При исключении внутри with снимок удаляется.
+    """
+
+    def __init__(self, path=CATALOG_SNAPSHOT_PATH, source=None):
+        self.path = path
+        self.source = source
+        self.lock = threading.Lock()
+        self.seen_ids = set()
+        self.pages = set()
+        self.failed_pages = set()
+        self.expected_pages = []  # страницы, которые еще должны прийти, по возрастанию
+        self.pending = {}  # page -> docs, пришедшие раньше своей очереди
+        self.count = 0
+
+        os.makedirs(path, exist_ok=True)
+        snapshots = list_snapshots(path)
+        number = int(snapshots[-1].split("-")[1]) + 1 if snapshots else 1
+        self.name = f"snap-{number:06d}"
+        self.tmp_dir = os.path.join(path, self.name + ".tmp")
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir)
+        self.file = gzip.open(os.path.join(self.tmp_dir, MOVIES_FILE), "wt", encoding="utf-8",
+                              compresslevel=SNAPSHOT_COMPRESS_LEVEL)
+
+    def expect_pages(self, pages):
+        """Задает страницы загрузки: каждая записывается, только когда записаны все предыдущие"""
+        with self.lock:
+            self.expected_pages = sorted(set(pages) - self.pages - self.failed_pages)
+            self._flush_ready()
+
+    def write_page(self, page, docs):
+        with self.lock:
+            self.pages.add(page)
+            self.pending[page] = docs
+            self._flush_ready()
+
+    def mark_failed(self, pages):
+        with self.lock:
+            self.failed_pages.update(pages)
+            self.expected_pages = [page for page in self.expected_pages if page not in self.failed_pages]
+            self._flush_ready()
+
+    def _flush_ready(self):
+        """Пишет буферизованные страницы, для которых все предыдущие ожидаемые страницы уже записаны"""
+        while True:
+            ready = sorted(page for page in self.pending
+                           if not self.expected_pages or page <= self.expected_pages[0])
+            if not ready:
+                return
+            for page in ready:
+                if self.expected_pages and page == self.expected_pages[0]:
+                    self.expected_pages.pop(0)
+                self._write_docs(self.pending.pop(page))
+
+    def _write_docs(self, docs):
+        for movie in docs:
+            movie_id = movie.get("id")
+            if movie_id in self.seen_ids:
+                continue
+            self.seen_ids.add(movie_id)
+            self.file.write(json.dumps(movie, ensure_ascii=False) + "\n")
+            self.count += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.publish()
+
+    def abort(self):
+        self.file.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def publish(self):
+        with self.lock:
+            # Страницы, которых не ждали, или пришедшие после пропавших
+            for page in sorted(self.pending):
+                self._write_docs(self.pending.pop(page))
+            self.expected_pages = []
+        self.file.close()
+        complete = not self.failed_pages
+        manifest = {
+            "format": SNAPSHOT_FORMAT_VERSION,
+            "name": self.name,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "source": self.source,
+            "movies": self.count,
+            "pages": sorted(self.pages),
+            "failed_pages": sorted(self.failed_pages),
+            "complete": complete,
+        }
+        with open(os.path.join(self.tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.tmp_dir, os.path.join(self.path, self.name))
+
+        if not complete:
+            logger.warning(f"Снимок каталога {self.name} неполный (страницы {manifest['failed_pages']}), "
+                           f"{LATEST_FILE} не переключен")
+            return self.name
+
+        latest_tmp = os.path.join(self.path, LATEST_FILE + ".tmp")
+        with open(latest_tmp, "w", encoding="utf-8") as f:
+            f.write(self.name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(latest_tmp, os.path.join(self.path, LATEST_FILE))
+
+        for old in list_snapshots(self.path)[:-KEEP_SNAPSHOTS]:
+            if old != self.name:
+                shutil.rmtree(os.path.join(self.path, old), ignore_errors=True)
+
+        print('====> ', 'Записан снимок каталога ', self.name, ' (', self.count, ' фильмов)')
+        return self.name
+
+
+def iter_snapshot_movies(path=CATALOG_SNAPSHOT_PATH, name=None, allow_incomplete=False):
+    """
+    Потоково читает документы каталога из снимка name (по умолчанию - последнего полного) без обращения к API.
+    Обрезанный или поврежденный файл приводит к SnapshotError, а не к тихой пересборке по части каталога.
+    """
+    manifest = read_manifest(path, name, allow_incomplete)
+    count = 0
+    try:
+        with gzip.open(os.path.join(path, manifest["name"], MOVIES_FILE), "rt", encoding="utf-8") as f:
+            for line in f:
+                count += 1
+                yield json.loads(line)
+    except (OSError, EOFError, ValueError) as e:
+        raise SnapshotError(f"Снимок каталога '{manifest['name']}' поврежден: {e}")
+
+    if count != manifest["movies"]:
+        raise SnapshotError(f"В снимке '{manifest['name']}' {count} фильмов вместо {manifest['movies']}")
@@ -1,26 +1,72 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
-from DB.db import init_db
+from AI.tools import web_search_guard
+from DB.db import close_pool
+from backend.health import ALWAYS_ALLOWED_PATHS, readiness, router as health_router
 from backend.router import router
+from monitoring import RequestTracingMiddleware
+from registry import registry
+
+# Размер пула потоков для блокирующих вызовов (синхронные части LangChain, FAISS, синтез речи)
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", "32"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # asyncio.to_thread и run_in_executor(None, ...) используют этот ограниченный пул
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=BLOCKING_POOL_SIZE))
+
+    # Импорт и старт приложения ничего не загружают: индекс, LLM, агенты и пул БД
+    # поднимаются фоновым прогревом, а до его окончания /readyz отвечает 503
+    readiness.start()
+    yield
+    await readiness.stop()
+    if registry.is_loaded("speech_synthesizer"):
+        registry.get("speech_synthesizer").close()
+    web_search_guard.close()
+    close_pool()
+
+
+app = FastAPI(title="Movie Recommendation Backend", lifespan=lifespan)
+
+
+@app.middleware("http")
+async def reject_until_ready(request: Request, call_next):
+    """Пока идет прогрев, запросы к API отклоняются с 503, чтобы балансировщик отправил их на готовый воркер"""
+    if not readiness.ready and request.url.path not in ALWAYS_ALLOWED_PATHS:
+        return JSONResponse({"detail": "Service is warming up"}, status_code=503, headers={"Retry-After": "5"})
+    return await call_next(request)
+
 
-app = FastAPI(title="Movie Recommendation Backend")
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],  # Укажите адрес вашего фронтенда
     allow_credentials=True,
     allow_methods=["*"],  # Разрешаем все методы
     allow_headers=["*"],  # Разрешаем все заголовки
+    expose_headers=["X-Request-ID"],
 )
+# Добавлен последним, поэтому внешний: учитывает и ответы 503 во время прогрева, и CORS
+app.add_middleware(RequestTracingMiddleware)
+app.include_router(health_router)
 app.include_router(router)
 
+
 #########################################
 # Запуск сервера через uvicorn          #
 #########################################
 
 
 if __name__ == "__main__":
-    init_db()  # Сначала инициализируем базу данных
+    # Схему БД создает и обновляет офлайн-сборка индекса (python -m AI.build_index), а пул соединений
+    # поднимается прогревом в рабочем процессе, а не в родительском процессе reload
     print("Starting server...")
     uvicorn.run("main:app", host="127.0.0.1", port=8003, reload=True)
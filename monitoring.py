@@ -0,0 +1,223 @@
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from contextvars import ContextVar
+
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+
+trace_logger = logging.getLogger("trace")
+
+# Доля запросов, трасса которых пишется в лог целиком (спаны с длительностями)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+# Медленные запросы логируются всегда, независимо от сэмплирования (секунды)
+TRACE_SLOW_THRESHOLD = float(os.getenv("TRACE_SLOW_THRESHOLD", "10"))
+
+REQUEST_ID_HEADER = "x-request-id"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+REQUEST_LATENCY = Histogram(
+    "movie_http_request_duration_seconds", "Длительность HTTP-запроса до отправки последнего байта ответа",
+    ["method", "endpoint", "status"], buckets=LATENCY_BUCKETS,
+)
+STAGE_LATENCY = Histogram(
+    "movie_stage_duration_seconds", "Длительность стадий обработки запроса (пайплайн, LLM, БД, инструменты, TTS)",
+    ["stage", "status"], buckets=LATENCY_BUCKETS,
+)
+PIPELINE_RUNS = Counter(
+    "movie_pipeline_runs_total", "Запуски пайплайна /search: был ли fallback на веб-поиск и деградация ответа",
+    ["fallback", "degraded"],
+)
+CACHE_REQUESTS = Counter(
+    "movie_cache_requests_total", "Обращения к кэшам по результату (hit, miss, bypass, error)",
+    ["cache", "result"],
+)
+LLM_TOKENS = Counter(
+    "movie_llm_tokens_total", "Токены LLM по модели и типу (prompt, completion)",
+    ["model", "kind"],
+)
+ERRORS = Counter(
+    "movie_errors_total", "Ошибки по компонентам",
+    ["component"],
+)
+
+
+class RequestTrace:
+    """Спаны одного HTTP-запроса: накапливаются всегда (это дешево), а в лог пишутся только для выборки"""
+
+    __slots__ = ("request_id", "started_at", "spans")
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.started_at = time.perf_counter()
+        self.spans = []
+
+    def add(self, name, started_at, elapsed, status):
+        self.spans.append((name, round((started_at - self.started_at) * 1000, 2), round(elapsed * 1000, 2), status))
+
+    def should_log(self, elapsed):
+        return elapsed >= TRACE_SLOW_THRESHOLD or random.random() < TRACE_SAMPLE_RATE
+
+
+current_trace: ContextVar = ContextVar("current_trace", default=None)
+
+
+def current_request_id():
+    trace = current_trace.get()
+    return trace.request_id if trace is not None else None
+
+
+def record_span(name, elapsed, status="ok", started_at=None):
+    STAGE_LATENCY.labels(name, status).observe(elapsed)
+    if status in ("error", "timeout"):
+        ERRORS.labels(name).inc()
+
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(name, started_at if started_at is not None else time.perf_counter() - elapsed, elapsed, status)
+
+
+class span:
+    """
+    Таймер стадии: with span("db.genre_stats"): ...
+    Длительность попадает в гистограмму movie_stage_duration_seconds и в трассу текущего запроса.
+    """
+
+    __slots__ = ("name", "started_at")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            status = "ok"
+        elif issubclass(exc_type, TimeoutError):
+            status = "timeout"
+        else:
+            status = "error"
+        record_span(self.name, time.perf_counter() - self.started_at, status, self.started_at)
+        return False
+
+
+def record_cache(cache, result, count=1):
+    if count:
+        CACHE_REQUESTS.labels(cache, result).inc(count)
+
+
+def record_pipeline_run(fallback, degraded):
+    PIPELINE_RUNS.labels("yes" if fallback else "no", "yes" if degraded else "no").inc()
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """Время каждого вызова LLM и расход токенов (из token_usage или usage_metadata сообщений при стриминге)"""
+
+    # Обработчик только обновляет счетчики, поэтому выполняется прямо в event loop, без пула потоков
+    run_inline = True
+
+    def __init__(self, model):
+        self.model = model
+        self.started = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.started[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.started[run_id] = time.perf_counter()
+
+    def _finish(self, run_id, status):
+        started_at = self.started.pop(run_id, None)
+        if started_at is not None:
+            record_span("llm", time.perf_counter() - started_at, status, started_at)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id, "ok")
+
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        if not usage:
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    prompt_tokens += metadata.get("input_tokens", 0)
+                    completion_tokens += metadata.get("output_tokens", 0)
+
+        if prompt_tokens:
+            LLM_TOKENS.labels(self.model, "prompt").inc(prompt_tokens)
+        if completion_tokens:
+            LLM_TOKENS.labels(self.model, "completion").inc(completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, "timeout" if isinstance(error, TimeoutError) else "error")
+
+
+class RequestTracingMiddleware:
+    """
+    ASGI-middleware: присваивает запросу id (из заголовка X-Request-ID или новый), возвращает его в ответе,
+    пишет длительность в movie_http_request_duration_seconds и логирует трассу сэмплированных и медленных запросов.
+    Длительность считается до последнего байта ответа, поэтому для SSE и потокового аудио она тоже честная.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope["headers"]).get(REQUEST_ID_HEADER.encode())
+        request_id = incoming.decode("latin-1")[:64] if incoming else uuid.uuid4().hex
+        trace = RequestTrace(request_id)
+        token = current_trace.set(trace)
+        status = 500
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                header = (REQUEST_ID_HEADER.encode(), request_id.encode("latin-1"))
+                message["headers"] = [*message.get("headers", []), header]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            current_trace.reset(token)
+            elapsed = time.perf_counter() - trace.started_at
+            # Метка - шаблон маршрута (/movies/{movie_id}/similar), а не путь: иначе каждый id фильма порождает
+            # отдельную серию. Ненайденные пути схлопываются в одну метку, чтобы сканеры не раздували число серий
+            endpoint = getattr(scope.get("route"), "path", None) or "unmatched"
+            REQUEST_LATENCY.labels(scope["method"], endpoint, str(status)).observe(elapsed)
+
+            if trace.should_log(elapsed):
+                trace_logger.info(json.dumps({
+                    "request_id": request_id,
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status,
+                    "duration_ms": round(elapsed * 1000, 2),
+                    "spans": trace.spans,
+                }, ensure_ascii=False))
+
+
+def render_metrics():
+    """
+    Метрики в текстовом формате Prometheus. При нескольких воркерах uvicorn
+    (PROMETHEUS_MULTIPROC_DIR задан) значения собираются со всех процессов.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        collector = CollectorRegistry()
+        multiprocess.MultiProcessCollector(collector)
+        return generate_latest(collector), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,98 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ComponentRegistry:
+    """
+    Реестр тяжелых компонентов (LLM, векторное хранилище, агенты и т.д.) с ленивой инициализацией.
+    Модули регистрируют фабрики при импорте, а сами компоненты создаются при первом обращении
+    или во время прогрева, поэтому импорт приложения не делает сетевых вызовов и не читает индекс.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._required = {}
+        self._instances = {}
+        self._errors = {}
+        self._timings = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory, required=True):
+        """required=False - без компонента сервис работает в урезанном режиме (например, без веб-поиска)"""
+        with self._lock:
+            self._factories[name] = factory
+            self._required[name] = required
+            self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        if name not in self._factories:
+            raise KeyError(f"Компонент '{name}' не зарегистрирован")
+
+        with self._locks[name]:
+            if name not in self._instances:
+                started_at = time.perf_counter()
+                try:
+                    self._instances[name] = self._factories[name]()
+                except Exception as e:
+                    self._errors[name] = str(e)
+                    raise
+                self._errors.pop(name, None)
+                self._timings[name] = round(time.perf_counter() - started_at, 3)
+                logger.info(f"Компонент '{name}' инициализирован за {self._timings[name]} сек")
+            return self._instances[name]
+
+    def override(self, name, instance):
+        """Подменяет компонент готовым объектом (локальные заглушки в бенчмарках и тестах)"""
+        with self._lock:
+            self._locks.setdefault(name, threading.Lock())
+            self._factories.setdefault(name, lambda: instance)
+            self._required.setdefault(name, False)
+            self._instances[name] = instance
+
+    def reset(self, name=None):
+        """Сбрасывает созданный компонент (или все), следующий get() создаст его заново"""
+        with self._lock:
+            names = [name] if name else list(self._instances)
+            for component in names:
+                self._instances.pop(component, None)
+                self._errors.pop(component, None)
+
+    def is_loaded(self, name):
+        return name in self._instances
+
+    def warmup(self, names=None):
+        """
+        Создает компоненты заранее. Ошибки необязательных компонентов только логируются.
+        Возвращает True, если все обязательные компоненты готовы.
+        """
+        ready = True
+        for name in names or list(self._factories):
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.error(f"Не удалось инициализировать компонент '{name}': {e}")
+                if self._required.get(name, True):
+                    ready = False
+        return ready
+
+    def status(self):
+        return {
+            name: {
+                "loaded": name in self._instances,
+                "required": self._required[name],
+                "init_seconds": self._timings.get(name),
+                "error": self._errors.get(name),
+            }
+            for name in self._factories
+        }
+
+
+registry = ComponentRegistry()
@@ -1,28 +1,41 @@
 import os
 
 from dotenv import load_dotenv
-import openai
-from langchain_openai import ChatOpenAI
+
+from registry import registry
 
 load_dotenv()
+
+# Ключи читаются при импорте, но проверяются только при создании компонента, которому они нужны:
+# отсутствие, например, TAVILY_API_KEY отключает веб-поиск, а не роняет весь процесс
 kinopoisk_api_key = os.getenv("KINOPOISK_API_KEY")
-if not kinopoisk_api_key:
-    raise Exception("Переменная окружения KINOPOISK_API_KEY не установлена в файле .env.")
+tavily_api_key = os.getenv("TAVILY_API_KEY")
+openai_api_key = os.getenv("OPENAI_API_KEY")
+db_password = os.getenv("DB_PASSWORD")
 
 
-tavily_api_key = os.getenv("TAVILY_API_KEY")
-if not tavily_api_key:
-    raise Exception("Переменная окружения TAVILY_API_KEY не установлена в файле .env.")
+def require_env(name):
+    value = os.getenv(name)
+    if not value:
+        raise Exception(f"Переменная окружения {name} не установлена в файле .env.")
+    return value
 
 
-openai_api_key = os.getenv("OPENAI_API_KEY")
-if not openai_api_key:
-    raise Exception("Переменная окружения OPENAI_API_KEY не установлена в файле .env.")
+LLM_MODEL = "o3-mini"
 
 
-db_password = os.getenv("DB_PASSWORD")
-if not db_password:
-    raise Exception("Переменная окружения DB_PASSWORD не установлена в файле .env.")
+def create_llm():
+    from langchain_openai import ChatOpenAI
+
+    from monitoring import LLMMetricsCallback
+
+    # stream_usage - расход токенов приходит и при потоковой генерации (/search/stream)
+    return ChatOpenAI(model_name=LLM_MODEL, openai_api_key=require_env("OPENAI_API_KEY"), stream_usage=True,
+                      callbacks=[LLMMetricsCallback(LLM_MODEL)])
+
+
+registry.register("llm", create_llm)
 
 
-llm = ChatOpenAI(model_name="o3-mini", openai_api_key=openai_api_key)
+def get_llm():
+    return registry.get("llm")
@@ -0,0 +1,17 @@
+import pytest
+
+
+@pytest.fixture
+def override_component():
+    """Подменяет компонент реестра на время теста: override_component(name, instance)"""
+    from registry import registry
+
+    names = []
+
+    def override(name, instance):
+        registry.override(name, instance)
+        names.append(name)
+
+    yield override
+    for name in names:
+        registry.reset(name)
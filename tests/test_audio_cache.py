@@ -0,0 +1,55 @@
+import os
+import threading
+
+import pytest
+
+tts = pytest.importorskip("backend.tts")
+
+
+def test_concurrent_puts_of_same_sentence_publish_whole_file(tmp_path):
+    cache = tts.AudioCache(str(tmp_path))
+    audio = b"\x01" * 100_000
+    errors = []
+
+    def put():
+        try:
+            for _ in range(20):
+                cache.put("silent", "одно и то же предложение", audio)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=put) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert cache.get("silent", "одно и то же предложение") == audio
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_cleanup_evicts_least_recently_used_over_byte_limit(tmp_path):
+    cache = tts.AudioCache(str(tmp_path), max_files=100, max_bytes=250)
+    for i, text in enumerate(["первое", "второе", "третье"]):
+        cache.put("silent", text, b"\x00" * 100)
+        os.utime(cache._file("silent", text), (1000 + i, 1000 + i))
+
+    # Попадание делает "первое" самым свежим
+    assert cache.get("silent", "первое") is not None
+    cache.cleanup()
+
+    assert cache.get("silent", "второе") is None
+    assert cache.get("silent", "первое") is not None
+    assert cache.get("silent", "третье") is not None
+
+
+def test_cleanup_keeps_at_most_max_files(tmp_path):
+    cache = tts.AudioCache(str(tmp_path), max_files=2)
+    for i in range(5):
+        cache.put("silent", f"предложение {i}", b"\x00")
+        os.utime(cache._file("silent", f"предложение {i}"), (1000 + i, 1000 + i))
+    cache.cleanup()
+
+    assert [cache.get("silent", f"предложение {i}") is not None for i in range(5)] == [False, False, False, True,
+                                                                                      True]
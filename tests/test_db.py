@@ -0,0 +1,344 @@
+import asyncio
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("psycopg2")
+db = pytest.importorskip("DB.db")
+
+from psycopg2 import OperationalError
+from psycopg2.pool import PoolError
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        self.conn.log.append(("execute", query, params))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    def __init__(self):
+        self.log = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.log.append(("commit",))
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    conn = FakeConnection()
+
+    @contextmanager
+    def connection():
+        yield conn
+        conn.commit()
+
+    def execute_values(cursor, query, rows, page_size):
+        conn.log.append(("execute_values", query, list(rows)))
+
+    monkeypatch.setattr(db, "get_db_connection", connection)
+    monkeypatch.setattr(db, "execute_values", execute_values)
+    monkeypatch.setattr(db, "refresh_genre_stats", lambda: conn.log.append(("refresh",)))
+    return conn
+
+
+def movie(movie_id, name=None):
+    return {
+        "countries": ["США"], "actors": ["Актер"], "year": 2000, "rating_imdb": 7.1, "rating_kp": 7.0,
+        "genres": ["драма"], "type": "movie", "name": name or f"Фильм {movie_id}", "id": movie_id,
+        "content_hash": "не попадает в БД",
+    }
+
+
+def test_bulk_load_chunks_rows_and_selects_columns_by_name(fake_db):
+    db.add_movies_from_metadata([movie(1), movie(2), movie(3), movie(1, "Дубль")], chunk_size=2)
+
+    batches = [entry[2] for entry in fake_db.log if entry[0] == "execute_values"]
+    # Повтор kp_id схлопывается (последняя версия), колонки идут в порядке MOVIE_COLUMNS
+    assert batches == [
+        [(1, "Дубль", "movie", ["драма"], 7.0, 7.1, 2000, ["Актер"], ["США"]),
+         (2, "Фильм 2", "movie", ["драма"], 7.0, 7.1, 2000, ["Актер"], ["США"])],
+        [(3, "Фильм 3", "movie", ["драма"], 7.0, 7.1, 2000, ["Актер"], ["США"])],
+    ]
+    assert [entry[0] for entry in fake_db.log] == ["execute_values", "commit", "execute_values", "commit",
+                                                   "commit", "refresh"]
+
+
+def test_removed_ids_are_deleted_in_first_transaction(fake_db):
+    db.add_movies_from_metadata([movie(1)], removed_ids=[7, 8])
+
+    assert fake_db.log[0] == ("execute", db.DELETE_MOVIES_QUERY, ([7, 8],))
+    assert fake_db.log[1][0] == "execute_values"
+    assert fake_db.log[2] == ("commit",)
+
+
+def test_full_load_deletes_rows_without_kp_id(fake_db):
+    db.add_movies_from_metadata([movie(1)], full_load=True)
+    assert fake_db.log[0] == ("execute", db.DELETE_LEGACY_MOVIES_QUERY, None)
+
+    fake_db.log.clear()
+    db.add_movies_from_metadata([movie(1)])
+    assert ("execute", db.DELETE_LEGACY_MOVIES_QUERY, None) not in fake_db.log
+
+
+class PooledConnection:
+    def __init__(self):
+        self.closed = 0
+        self.commits = 0
+        self.rollbacks = 0
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakeThreadedPool:
+    """Как ThreadedConnectionPool: при исчерпании getconn бросает PoolError, а не ждет"""
+
+    def __init__(self, minconn, maxconn, **kwargs):
+        self.maxconn = maxconn
+        self.in_use = 0
+        self.returned = []
+
+    def getconn(self):
+        if self.in_use >= self.maxconn:
+            raise PoolError("connection pool exhausted")
+        self.in_use += 1
+        return PooledConnection()
+
+    def putconn(self, conn, close=False):
+        self.in_use -= 1
+        self.returned.append((conn, close))
+
+    def closeall(self):
+        pass
+
+
+@pytest.fixture
+def make_pool(monkeypatch):
+    monkeypatch.setenv("DB_PASSWORD", "test")
+    monkeypatch.setattr(db, "ThreadedConnectionPool", FakeThreadedPool)
+    pools = []
+
+    def make(max_size):
+        pools.append(db.DBPool(min_size=1, max_size=max_size))
+        return pools[-1]
+
+    yield make
+    for pool in pools:
+        pool.close()
+
+
+def test_exhausted_pool_waits_for_free_connection(make_pool):
+    pool = make_pool(max_size=1)
+    acquired = []
+
+    def wait_for_connection():
+        with pool.connection() as conn:
+            acquired.append(conn)
+
+    with pool.connection():
+        waiter = threading.Thread(target=wait_for_connection)
+        waiter.start()
+        waiter.join(timeout=0.2)
+        # Второй поток ждет на семафоре, а не получает PoolError
+        assert waiter.is_alive() and not acquired
+
+    waiter.join(timeout=2)
+    assert len(acquired) == 1
+
+
+def test_broken_connection_is_dropped_from_pool(make_pool):
+    pool = make_pool(max_size=2)
+    with pytest.raises(OperationalError):
+        with pool.connection() as conn:
+            conn.closed = 2
+            raise OperationalError("server closed the connection unexpectedly")
+
+    assert pool.pool.returned == [(conn, True)]
+    assert conn.rollbacks == 0
+    # Слот семафора освобожден: пул снова выдает соединения
+    with pool.connection() as conn:
+        pass
+    assert pool.pool.returned[-1] == (conn, False) and conn.commits == 1
+
+
+def test_failed_query_rolls_back_and_returns_connection(make_pool):
+    pool = make_pool(max_size=1)
+    with pytest.raises(ValueError):
+        with pool.connection() as conn:
+            raise ValueError("bad query")
+
+    assert (conn.commits, conn.rollbacks) == (0, 1)
+    assert pool.pool.returned == [(conn, False)]
+
+
+def test_async_run_uses_db_threads_and_keeps_context(make_pool):
+    request_id = contextvars.ContextVar("request_id", default=None)
+    pool = make_pool(max_size=2)
+
+    def query(value):
+        return value, request_id.get(), threading.current_thread().name
+
+    async def main():
+        request_id.set("req-1")
+        return await pool.run(query, 42)
+
+    value, context_value, thread_name = asyncio.run(main())
+    assert (value, context_value) == (42, "req-1")
+    assert thread_name.startswith("db")
+
+
+def test_async_wrappers_run_queries_in_pool(make_pool, monkeypatch):
+    pool = make_pool(max_size=1)
+    monkeypatch.setattr(db, "get_pool", lambda: pool)
+    monkeypatch.setattr(db, "fetch_movies", lambda: [threading.current_thread().name])
+
+    assert asyncio.run(db.afetch_movies())[0].startswith("db")
+
+
+class StatsCursor:
+    def __init__(self, database):
+        self.database = database
+        self.rows = []
+
+    def execute(self, query, params=None):
+        self.database.queries.append(query)
+        if query == db.GENRE_STATS_VERSION_QUERY:
+            self.rows = [{"version": self.database.version}]
+        elif query == db.ALL_GENRE_STATS_QUERY:
+            self.rows = list(self.database.stats.values())
+        elif query == db.STATS_MOVIE_BY_GENRES_QUERY:
+            self.rows = [row for genre, row in self.database.stats.items() if genre in params[0]]
+
+    def fetchone(self):
+        return self.rows[0]
+
+    def fetchall(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class StatsDatabase:
+    """genre_stats и genre_stats_version, общие для нескольких процессов сервера"""
+
+    def __init__(self):
+        self.version = 1
+        self.clock = Clock()
+        self.queries = []
+        self.stats = {}
+        self.set_genre("драма", 10, 7.456)
+
+    def set_genre(self, genre, count, rating):
+        self.stats[genre] = {"genre": genre, "movie_count": count, "avg_rating_kp": rating, "avg_rating_imdb": None}
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    def cursor(self):
+        return StatsCursor(self)
+
+
+@pytest.fixture
+def stats_db(monkeypatch):
+    database = StatsDatabase()
+    monkeypatch.setattr(db, "get_db_connection", database.connection)
+    monkeypatch.setattr(db, "time", SimpleNamespace(monotonic=database.clock, perf_counter=time.perf_counter))
+    monkeypatch.setattr(db, "genre_stats_cache", db.GenreStatsCache(ttl=600, check_interval=30))
+    return database
+
+
+def test_missing_genres_are_loaded_in_one_normalized_query(stats_db):
+    db.prime_genre_stats_cache()
+    stats_db.queries.clear()
+
+    stats = db.get_movies_stats_by_genres([" Драма", "КОМЕДИЯ", "ужасы", "комедия "])
+
+    assert list(stats) == ["драма", "комедия", "ужасы"]
+    assert stats["драма"] == {"movie_count": 10, "avg_rating_kp": 7.46, "avg_rating_imdb": None}
+    assert stats["комедия"] == db.EMPTY_GENRE_STATS
+    assert stats_db.queries == [db.STATS_MOVIE_BY_GENRES_QUERY]
+
+    # Отсутствующие жанры тоже кэшируются
+    stats_db.queries.clear()
+    db.get_movies_stats_by_genres(["ужасы", "драма"])
+    assert stats_db.queries == []
+
+
+def test_cached_stats_expire_after_ttl(stats_db):
+    db.prime_genre_stats_cache()
+    stats_db.set_genre("драма", 11, 7.0)
+    stats_db.clock.now += 599
+    assert db.get_movies_stats_by_genres(["драма"])["драма"]["movie_count"] == 10
+
+    stats_db.clock.now += 2
+    assert db.get_movies_stats_by_genres(["драма"])["драма"]["movie_count"] == 11
+
+
+def test_refresh_in_other_process_is_picked_up_with_new_vocabulary(stats_db):
+    db.prime_genre_stats_cache()
+    assert db.genre_stats_cache.vocabulary == {"драма"}
+
+    # Каталог загрузил AI.build_index: агрегаты пересчитаны, номер версии увеличен
+    stats_db.set_genre("драма", 12, 7.0)
+    stats_db.set_genre("вестерн", 3, 6.5)
+    stats_db.version += 1
+
+    stats_db.clock.now += 10
+    assert db.get_movies_stats_by_genres(["драма"])["драма"]["movie_count"] == 10
+
+    stats_db.clock.now += 30
+    assert db.get_movies_stats_by_genres(["драма"])["драма"]["movie_count"] == 12
+    assert db.genre_stats_cache.vocabulary == {"драма", "вестерн"}
+
+
+def test_version_check_without_refresh_keeps_cache(stats_db):
+    db.prime_genre_stats_cache()
+    stats_db.clock.now += 31
+    stats_db.queries.clear()
+
+    db.get_movies_stats_by_genres(["драма"])
+    db.get_movies_stats_by_genres(["драма"])
+
+    assert stats_db.queries == [db.GENRE_STATS_VERSION_QUERY]
+
+
+def test_vocabulary_is_reloaded_when_ttl_expires(stats_db):
+    db.prime_genre_stats_cache()
+    # Пересчет без увеличения версии (например, REFRESH вручную)
+    stats_db.set_genre("вестерн", 3, 6.5)
+    stats_db.clock.now += 601
+
+    db.ensure_fresh_genre_stats()
+    assert db.genre_stats_cache.vocabulary == {"драма", "вестерн"}
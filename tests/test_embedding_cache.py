@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+embedding_cache = pytest.importorskip("AI.embedding_cache")
+
+EmbeddingCache = embedding_cache.EmbeddingCache
+
+
+def vector(value, dim=4):
+    return [float(value)] * dim
+
+
+def test_put_get_and_reload_from_disk(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_entries=10)
+    cache.put_many("model", ["a", "b"], [vector(1), vector(2)])
+    cache.save()
+
+    reloaded = EmbeddingCache(str(tmp_path), max_entries=10)
+    assert reloaded.get_many("model", ["b", "a", "c"]) == [vector(2), vector(1), None]
+    # Ключ учитывает модель
+    assert reloaded.get_many("other", ["a"]) == [None]
+
+
+def test_lru_eviction_keeps_recently_used(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_entries=2)
+    cache.put_many("model", ["a", "b"], [vector(1), vector(2)])
+    cache.get_many("model", ["a"])
+    cache.put_many("model", ["c"], [vector(3)])
+
+    assert cache.get_many("model", ["a", "b", "c"]) == [vector(1), None, vector(3)]
+    assert cache.capacity == 2
+
+
+def test_resize_keeps_existing_vectors(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_entries=5000)
+    cache.put_many("model", ["a"], [vector(1)])
+    texts = [str(i) for i in range(2000)]
+    cache.put_many("model", texts, [vector(i) for i in range(2000)])
+
+    assert cache.capacity >= 2001
+    assert cache.get_many("model", ["a", "1999"]) == [vector(1), vector(1999)]
+
+
+def test_dimension_mismatch_is_rejected(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put_many("small", ["a"], [vector(1, dim=4)])
+    with pytest.raises(ValueError):
+        cache.put_many("big", ["a"], [vector(1, dim=8)])
+
+
+def test_models_are_partitioned_by_directory(tmp_path):
+    small = embedding_cache.cache_path_for(str(tmp_path), "hash-256")
+    big = embedding_cache.cache_path_for(str(tmp_path), "text-embedding-3-large")
+    assert small != big
+
+    EmbeddingCache(small).put_many("hash-256", ["a"], [vector(1, dim=256)])
+    EmbeddingCache(big).put_many("text-embedding-3-large", ["a"], [vector(1, dim=3072)])
+
+
+def test_cached_embeddings_call_model_only_for_misses(tmp_path):
+    class CountingEmbeddings(embedding_cache.HashEmbeddings):
+        calls = 0
+
+        def embed_documents(self, texts):
+            CountingEmbeddings.calls += len(texts)
+            return super().embed_documents(texts)
+
+    cache = EmbeddingCache(str(tmp_path))
+    embeddings = embedding_cache.CachedEmbeddings(CountingEmbeddings(dim=8), cache, batch_size=2)
+    first = embeddings.embed_documents(["один", "два", "один"])
+    second = embeddings.embed_documents(["два", "три"])
+
+    assert CountingEmbeddings.calls == 3
+    assert np.allclose(first[1], second[0])
+
+
+def test_eviction_is_persisted_before_slots_are_reused(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_entries=2)
+    cache.put_many("model", ["a", "b"], [vector(1), vector(2)])
+    cache.save()
+    cache.get_many("model", ["a"])
+    # "b" вытесняется, его слот получает "c"; процесс падает до save()
+    cache.put_many("model", ["c"], [vector(3)])
+
+    crashed = EmbeddingCache(str(tmp_path), max_entries=2)
+    assert crashed.get_many("model", ["a", "b"]) == [vector(1), None]
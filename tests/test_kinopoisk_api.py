@@ -0,0 +1,80 @@
+import json
+import threading
+import time
+
+import pytest
+
+api = pytest.importorskip("external_api.api")
+
+KEY = {"query": "movie?page={page}", "limit": 250, "pages_start": 1, "pages_count": 3}
+
+
+def test_token_bucket_limits_rate_after_burst():
+    bucket = api.TokenBucket(rate=50, capacity=5)
+    started_at = time.monotonic()
+    for _ in range(15):
+        bucket.acquire()
+    elapsed = time.monotonic() - started_at
+
+    # 5 токенов доступны сразу, остальные 10 приходят со скоростью 50 в секунду
+    assert 0.15 <= elapsed < 1.0
+
+
+def test_token_bucket_is_shared_between_threads():
+    bucket = api.TokenBucket(rate=100, capacity=1)
+    acquired = []
+
+    def worker():
+        for _ in range(10):
+            bucket.acquire()
+            acquired.append(time.monotonic())
+
+    started_at = time.monotonic()
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(acquired) == 40
+    assert time.monotonic() - started_at >= 0.35
+
+
+def test_zero_rate_disables_limit():
+    bucket = api.TokenBucket(rate=0)
+    started_at = time.monotonic()
+    for _ in range(1000):
+        bucket.acquire()
+    assert time.monotonic() - started_at < 0.5
+
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / "checkpoint.jsonl")
+    checkpoint = api.PageCheckpoint(path, KEY)
+    checkpoint.save_page(2, [{"id": 2}])
+    checkpoint.save_page(1, [{"id": 1}])
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"page": 3, "docs": [')  # оборванная запись
+
+    assert api.PageCheckpoint(path, KEY).load() == {1: [{"id": 1}], 2: [{"id": 2}]}
+
+
+def test_checkpoint_of_other_download_is_discarded(tmp_path):
+    path = str(tmp_path / "checkpoint.jsonl")
+    api.PageCheckpoint(path, KEY).save_page(1, [{"id": 1}])
+
+    other = api.PageCheckpoint(path, dict(KEY, query="movie?year=2020"))
+    assert other.load() == {}
+    assert not (tmp_path / "checkpoint.jsonl").exists()
+
+
+def test_checkpoint_without_key_is_discarded(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    path.write_text(json.dumps({"page": 1, "docs": [{"id": 1}]}) + "\n", encoding="utf-8")
+
+    assert api.PageCheckpoint(str(path), KEY).load() == {}
+
+
+def test_dedupe_movies_keeps_first_occurrence():
+    movies = [{"id": 1, "v": 1}, {"id": 2}, {"id": 1, "v": 2}]
+    assert api.dedupe_movies(movies) == [{"id": 1, "v": 1}, {"id": 2}]
@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+import pytest
+
+from AI import lexical_index
+
+
+def document(movie_id, name="", description="", actors=(), countries=()):
+    metadata = {"id": movie_id, "name": name, "actors": list(actors), "countries": list(countries)}
+    return SimpleNamespace(metadata=metadata, page_content=description)
+
+
+@pytest.mark.parametrize("word, expected", [
+    ("вавилонской", "вавилонск"),
+    ("вагона", "вагон"),
+    ("важная", "важн"),
+    ("важнейшие", "важн"),
+    ("вдохновения", "вдохновен"),
+    ("взгляды", "взгляд"),
+    ("великолепный", "великолепн"),
+    ("kinopoisk", "kinopoisk"),
+])
+def test_stem_matches_snowball(word, expected):
+    assert lexical_index.stem(word) == expected
+
+
+def test_tokenize_normalizes_case_yo_and_drops_stop_words():
+    assert lexical_index.tokenize("Фильм про Ёлки и Космос") == ["елк", "космос"]
+    assert lexical_index.tokenize("комедии") == lexical_index.tokenize("Комедия") == ["комед"]
+
+
+def build_index(tmp_path, documents):
+    builder = lexical_index.LexicalIndexBuilder()
+    for position, doc in enumerate(documents):
+        builder.add(position, doc)
+    builder.save(str(tmp_path))
+    return lexical_index.LexicalIndex.load(str(tmp_path))
+
+
+def test_bm25_ranks_name_and_actor_matches_first(tmp_path):
+    index = build_index(tmp_path, [
+        document(1, "Космос", "про пилота"),
+        document(2, "Пилот", "история о космосе и звездах"),
+        document(3, "Звезды", "космос космос", actors=["Киану Ривз"]),
+        document(4, "Океан", "подводная лодка"),
+    ])
+
+    results = index.search("пилот", 10)
+    assert [position for position, _ in results] == [1, 0]
+    assert results[0][1] > results[1][1] > 0
+
+    assert index.search("киану ривз", 10)[0][0] == 2
+    assert index.search("неизвестное слово", 10) == []
+
+
+def test_bm25_limits_results_to_k(tmp_path):
+    index = build_index(tmp_path, [document(i, f"Фильм {i}", "космос") for i in range(20)])
+    assert len(index.search("космос", 5)) == 5
+
+
+def test_missing_index_loads_as_none(tmp_path):
+    assert lexical_index.LexicalIndex.load(str(tmp_path)) is None
+
+
+def test_reciprocal_rank_fusion_prefers_documents_in_both_rankings():
+    a, b, c, d = (document(movie_id) for movie_id in (1, 2, 3, 4))
+    fused = lexical_index.reciprocal_rank_fusion([[a, b, c], [c, d, b]], k=60)
+    assert [doc.metadata["id"] for doc in fused] == [3, 2, 1, 4]
+
+
+def test_reciprocal_rank_fusion_breaks_ties_by_first_ranking():
+    a, b = document(1), document(2)
+    fused = lexical_index.reciprocal_rank_fusion([[a], [b]])
+    assert [doc.metadata["id"] for doc in fused] == [1, 2]
+
+
+def test_reciprocal_rank_fusion_weights_lists():
+    a, b = document(1), document(2)
+    fused = lexical_index.reciprocal_rank_fusion([[a], [b]], weights=[1.0, 1.2])
+    assert [doc.metadata["id"] for doc in fused] == [2, 1]
@@ -0,0 +1,66 @@
+import argparse
+import asyncio
+
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("httpx")
+load_test = pytest.importorskip("bench.load_test")
+
+
+def smoke_args(**overrides):
+    """Аргументы bench.load_test с нулевыми задержками заглушек"""
+    args = {
+        "requests": 12, "concurrency": 4, "warmup": 2, "search_weight": 3, "voice_weight": 1,
+        "distinct_queries": 5, "movies": 300, "fallback_rate": 0.5, "cache": False, "timeout": 30,
+        "seed": 0, "url": None, "output": None,
+        "llm_latency": "fixed:0", "search_latency": "fixed:0", "embedding_latency": "fixed:0",
+        "tts_latency": "fixed:0", "kinopoisk_latency": "fixed:0",
+    }
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+
+def test_load_test_runs_in_process_and_reports_latencies(tmp_path, monkeypatch, override_component):
+    import backend.pipeline as pipeline
+    import external_api.api as kinopoisk
+    from AI import vector
+    from backend.health import readiness
+    from bench.fakes import FakeKinopoiskServer
+    from registry import registry
+
+    # Модули уже импортированы, поэтому настройки configure_environment подменяются напрямую;
+    # относительные пути индекса и кэшей указывают во временный каталог
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("KINOPOISK_API_KEY", "bench")
+    monkeypatch.setattr(vector, "EMBEDDINGS_BACKEND", "hash")
+    monkeypatch.setattr(kinopoisk, "api_url", kinopoisk.api_url)
+    monkeypatch.setattr(readiness, "ready", readiness.ready)
+    monkeypatch.setattr(pipeline, "stage_observers", [])
+    override_component("response_cache", None)
+
+    args = smoke_args()
+    server = FakeKinopoiskServer(args.movies, args.kinopoisk_latency, args.seed).start()
+    try:
+        assert load_test.build_catalog(server.api_url, args.movies) == args.movies
+    finally:
+        server.stop()
+
+    try:
+        load_test.install_fakes(args)
+        report = asyncio.run(load_test.run(args))
+    finally:
+        registry.get("vector_store").close()
+        registry.get("speech_synthesizer").close()
+        registry.reset()
+
+    assert report["throughput_rps"] > 0
+    endpoints = report["endpoints"]
+    assert set(endpoints) <= set(load_test.ENDPOINTS)
+    assert sum(stats["count"] for stats in endpoints.values()) == args.requests
+    for stats in endpoints.values():
+        assert stats["errors"] == 0
+        assert set(stats["statuses"]) == {"200"}
+        assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"] <= stats["max_ms"]
+    assert "retrieval" in report["stages"]
+    assert set(report["stages"]["retrieval"]["statuses"]) == {"ok"}
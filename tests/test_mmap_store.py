@@ -0,0 +1,48 @@
+import pytest
+
+pytest.importorskip("faiss")
+mmap_store = pytest.importorskip("AI.mmap_store")
+
+from AI.embedding_cache import HashEmbeddings
+from AI.index_factory import create_faiss_store
+
+
+def build_store(descriptions):
+    ids = [str(i + 1) for i in range(len(descriptions))]
+    metadatas = [{"id": i + 1, "name": f"Фильм {i + 1}", "genres": ["драма"]} for i in range(len(descriptions))]
+    return create_faiss_store(descriptions, HashEmbeddings(dim=16), metadatas, ids)
+
+
+def test_published_generation_round_trips_through_mmap(tmp_path):
+    path = str(tmp_path)
+    name = mmap_store.publish_generation(build_store(["космос и звезды", "любовь в париже", "ограбление банка"]), path)
+
+    assert mmap_store.read_current_generation(path) == name
+    loaded = mmap_store.load_generation(path, HashEmbeddings(dim=16))
+    assert loaded.index.ntotal == 3
+    assert loaded.docstore.search("2").page_content == "любовь в париже"
+    assert loaded.docstore.position(4) is None
+    assert loaded.lexical_index.search("банк", 5)[0][0] == 2
+
+
+def test_reload_swaps_generation_without_io_in_current(tmp_path):
+    path = str(tmp_path)
+    mmap_store.publish_generation(build_store(["первый"]), path)
+    store = mmap_store.GenerationalVectorStore(path, HashEmbeddings(dim=16), reload_interval=0)
+    assert store.thread is None
+    first = store.current()
+
+    name = mmap_store.publish_generation(build_store(["первый", "второй"]), path)
+    # Без фонового потока current() не видит новое поколение: проверка CURRENT идет только в reload()
+    assert store.current() is first
+
+    store.reload()
+    assert store.generation == name
+    assert store.current().index.ntotal == 2
+
+
+def test_old_generations_are_pruned(tmp_path):
+    path = str(tmp_path)
+    for _ in range(mmap_store.KEEP_GENERATIONS + 2):
+        mmap_store.publish_generation(build_store(["фильм"]), path)
+    assert len(mmap_store.list_generations(path)) == mmap_store.KEEP_GENERATIONS
@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+prometheus_client = pytest.importorskip("prometheus_client")
+monitoring = pytest.importorskip("monitoring")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+
+def request_count(endpoint):
+    return prometheus_client.REGISTRY.get_sample_value(
+        "movie_http_request_duration_seconds_count", {"method": "GET", "endpoint": endpoint, "status": "200"}) or 0
+
+
+def test_request_latency_is_labelled_by_route_template():
+    app = FastAPI()
+
+    @app.get("/movies/{movie_id}/similar")
+    def similar(movie_id: int):
+        return {"movie_id": movie_id}
+
+    app.add_middleware(monitoring.RequestTracingMiddleware)
+    client = TestClient(app)
+
+    before = request_count("/movies/{movie_id}/similar")
+    for movie_id in (1, 2, 3):
+        response = client.get(f"/movies/{movie_id}/similar")
+        assert response.headers[monitoring.REQUEST_ID_HEADER]
+
+    assert request_count("/movies/{movie_id}/similar") == before + 3
+    assert request_count("/movies/1/similar") == 0
+
+
+def test_unknown_paths_share_one_label():
+    app = FastAPI()
+    app.add_middleware(monitoring.RequestTracingMiddleware)
+    client = TestClient(app)
+
+    client.get("/wp-admin/setup.php")
+    assert prometheus_client.REGISTRY.get_sample_value(
+        "movie_http_request_duration_seconds_count", {"method": "GET", "endpoint": "unmatched", "status": "404"}) >= 1
@@ -0,0 +1,276 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_core")
+pipeline = pytest.importorskip("backend.pipeline")
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from registry import registry
+
+NOT_FOUND = "Извините, к сожалению, я не смог найти подходящих фильмов или сериалов"
+
+
+class FakeChain:
+    """RetrievalQA-заглушка: отвечает answer через delay секунд или бросает error"""
+
+    def __init__(self, answer="Посмотрите 'Фильм'.", delay=0.0, error=None):
+        self.answer = answer
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    async def ainvoke(self, prompt):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return {"result": self.answer}
+
+
+class FakeAgent(FakeChain):
+    async def ainvoke(self, request):
+        result = await super().ainvoke(request)
+        return {"messages": [AIMessage(content=result["result"])]}
+
+
+class FakeStats:
+    def __init__(self, answer="", delay=0.0):
+        self.answer = answer
+        self.delay = delay
+        self.cancelled = False
+
+    async def __call__(self, user_query, genres):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return self.answer
+
+
+@pytest.fixture
+def stages(monkeypatch):
+    """Подменяет цепочку RetrievalQA, агента веб-поиска и статистику; собирает статусы стадий"""
+    fakes = {"chain": FakeChain(), "agent": FakeAgent("В интернете нашелся 'Другой фильм'."),
+             "stats_agent": FakeAgent("Больше всего драм."), "stats": FakeStats(), "statuses": []}
+    registry.override("search_agent", fakes["agent"])
+    registry.override("movie_stats_agent", fakes["stats_agent"])
+    monkeypatch.setattr(pipeline, "create_retrieval_chain", lambda **kwargs: fakes["chain"])
+    monkeypatch.setattr(pipeline, "answer_stats", lambda *args: fakes["stats"](*args))
+    monkeypatch.setattr(pipeline, "web_search_available", lambda: True)
+    monkeypatch.setattr(pipeline, "RETRIEVAL_TIMEOUT", 0.5)
+    monkeypatch.setattr(pipeline, "WEB_SEARCH_TIMEOUT", 0.5)
+    monkeypatch.setattr(pipeline, "STATS_TIMEOUT", 0.5)
+    monkeypatch.setattr(pipeline, "stage_observers",
+                        [lambda name, seconds, status: fakes["statuses"].append((name, status))])
+    yield fakes
+    registry.reset("search_agent")
+    registry.reset("movie_stats_agent")
+
+
+GENRES = {"favorite": ["драма"], "hated": []}
+
+
+def run(user_query="посоветуй фильм про космос"):
+    return asyncio.run(pipeline.run_search_pipeline(user_query, GENRES, "промпт"))
+
+
+def test_answer_from_retrieval_skips_web_search(stages):
+    stages["stats"].answer = "Драма: 10 фильмов."
+
+    assert run() == {"answer": "Посмотрите 'Фильм'.\nДрама: 10 фильмов.", "degraded": False}
+    assert stages["agent"].calls == 0
+    assert sorted(stages["statuses"]) == [("retrieval", "ok"), ("stats", "ok")]
+
+
+def test_open_ended_stats_question_goes_to_stats_agent(stages):
+    stages["stats"].answer = None
+
+    assert run()["answer"] == "Посмотрите 'Фильм'.\nБольше всего драм."
+    assert stages["stats_agent"].calls == 1
+
+
+def test_web_search_runs_only_when_retrieval_finds_nothing(stages):
+    stages["chain"].answer = NOT_FOUND
+
+    assert run() == {"answer": "В интернете нашелся 'Другой фильм'.", "degraded": False}
+    assert stages["agent"].calls == 1
+
+
+def test_slow_stats_degrade_answer_instead_of_failing(stages):
+    stages["stats"].delay = 5
+
+    assert run() == {"answer": "Посмотрите 'Фильм'.", "degraded": True}
+    assert ("stats", "timeout") in stages["statuses"]
+
+
+def test_failed_web_search_returns_not_found_answer(stages):
+    stages["chain"].answer = ""
+    stages["agent"].error = RuntimeError("tavily недоступен")
+
+    assert run() == {"answer": pipeline.NOT_FOUND_ANSWER, "degraded": True}
+    assert ("web_search", "error") in stages["statuses"]
+
+
+def test_retrieval_timeout_falls_back_to_web_search(stages):
+    stages["chain"].delay = 5
+
+    assert run() == {"answer": "В интернете нашелся 'Другой фильм'.", "degraded": True}
+    assert ("retrieval", "timeout") in stages["statuses"]
+
+
+def test_open_breaker_skips_web_search(stages, monkeypatch):
+    monkeypatch.setattr(pipeline, "web_search_available", lambda: False)
+    stages["chain"].answer = NOT_FOUND
+
+    assert run() == {"answer": NOT_FOUND, "degraded": True}
+    assert stages["agent"].calls == 0
+    assert ("web_search", "skipped") in stages["statuses"]
+
+
+def test_stats_stage_is_cancelled_with_request(stages):
+    stages["stats"].delay = 5
+    stages["chain"].delay = 5
+
+    async def cancel_request():
+        task = asyncio.create_task(pipeline.run_search_pipeline("посоветуй фильм", GENRES, "промпт"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+
+    asyncio.run(cancel_request())
+    assert stages["stats"].cancelled
+
+
+def test_degraded_answers_are_not_cached(monkeypatch, override_component):
+    pytest.importorskip("httpx")
+    router = pytest.importorskip("backend.router")
+    cache = pytest.importorskip("backend.cache")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    override_component("response_cache", cache.ResponseCache(cache.MemoryCacheBackend()))
+    results = iter([{"answer": "частичный ответ", "degraded": True}, {"answer": "полный ответ", "degraded": False}])
+
+    async def fake_pipeline(*args):
+        return next(results)
+
+    monkeypatch.setattr(router, "run_search_pipeline", fake_pipeline)
+    app = FastAPI()
+    app.include_router(router.router)
+    client = TestClient(app)
+    body = {"query": "посоветуй фильм про космос", "genres": GENRES}
+
+    assert client.post("/search", json=body).json()["answer"] == "частичный ответ"
+    assert client.post("/search", json=body).json()["answer"] == "полный ответ"
+    response = client.post("/search", json=body)
+    assert response.json()["answer"] == "полный ответ"
+    assert response.headers["X-Cache"] == "HIT"
+
+
+class FakeStreamingChain(FakeChain):
+    """Отдает ответ по словам через astream_events, как RetrievalQA с потоковой LLM"""
+
+    def __init__(self, answer="Посмотрите 'Фильм'.", hang=False):
+        super().__init__(answer)
+        self.hang = hang
+        self.cancelled = False
+
+    async def astream_events(self, prompt, version):
+        for word in self.answer.split(" "):
+            yield {"event": "on_chat_model_stream", "data": {"chunk": AIMessageChunk(content=word + " ")},
+                   "parent_ids": ["run"]}
+        try:
+            if self.hang:
+                await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        yield {"event": "on_chain_end", "data": {"output": {"result": self.answer}}, "parent_ids": []}
+
+
+class FakeStreamingAgent(FakeAgent):
+    async def astream(self, request, stream_mode):
+        yield AIMessageChunk(content="вызов инструмента"), {"langgraph_node": "tools"}
+        for word in self.answer.split(" "):
+            yield AIMessageChunk(content=word + " "), {"langgraph_node": "agent"}
+
+
+async def collect(stream, limit=None):
+    events = []
+    async for event, data in stream:
+        events.append((event, data))
+        if limit and len(events) >= limit:
+            break
+    await stream.aclose()
+    return events
+
+
+def stream(user_query="посоветуй фильм про космос"):
+    return pipeline.stream_search_pipeline(user_query, GENRES, "промпт")
+
+
+def test_stream_emits_stages_tokens_stats_and_done_in_order(stages):
+    stages["chain"] = FakeStreamingChain("Посмотрите 'Фильм'.")
+    stages["stats"].answer = "Драма: 10 фильмов."
+
+    events = asyncio.run(collect(stream()))
+
+    assert events == [
+        ("stage", {"stage": "retrieval", "status": "started"}),
+        ("token", {"stage": "retrieval", "text": "Посмотрите "}),
+        ("token", {"stage": "retrieval", "text": "'Фильм'. "}),
+        ("stage", {"stage": "retrieval", "status": "done"}),
+        ("stats", {"text": "Драма: 10 фильмов."}),
+        ("done", {"answer": "Посмотрите 'Фильм'.\nДрама: 10 фильмов.", "degraded": False}),
+    ]
+
+
+def test_stream_falls_back_to_web_search_tokens(stages):
+    stages["chain"] = FakeStreamingChain(NOT_FOUND)
+    stages["agent"] = FakeStreamingAgent("Нашелся 'Другой фильм'.")
+    registry.override("search_agent", stages["agent"])
+
+    events = asyncio.run(collect(stream()))
+    web_events = events[events.index(("stage", {"stage": "web_search", "status": "started"})):]
+
+    assert web_events == [
+        ("stage", {"stage": "web_search", "status": "started"}),
+        ("token", {"stage": "web_search", "text": "Нашелся "}),
+        ("token", {"stage": "web_search", "text": "'Другой "}),
+        ("token", {"stage": "web_search", "text": "фильм'. "}),
+        ("stage", {"stage": "web_search", "status": "done"}),
+        ("done", {"answer": "Нашелся 'Другой фильм'. ", "degraded": False}),
+    ]
+
+
+def test_stream_reports_skipped_web_search_when_breaker_is_open(stages, monkeypatch):
+    monkeypatch.setattr(pipeline, "web_search_available", lambda: False)
+    stages["chain"] = FakeStreamingChain(NOT_FOUND)
+
+    events = asyncio.run(collect(stream()))
+
+    assert ("stage", {"stage": "web_search", "status": "skipped"}) in events
+    assert events[-1] == ("done", {"answer": NOT_FOUND, "degraded": True})
+    assert ("web_search", "skipped") in stages["statuses"]
+
+
+def test_closing_stream_cancels_running_stages(stages):
+    stages["chain"] = FakeStreamingChain("Посмотрите 'Фильм'.", hang=True)
+    stages["stats"].delay = 60
+
+    async def disconnect():
+        events = await collect(stream(), limit=2)
+        # Отмена задач доходит до стадий на следующих итерациях цикла событий
+        await asyncio.sleep(0.05)
+        return events
+
+    events = asyncio.run(disconnect())
+
+    assert [event for event, _ in events] == ["stage", "token"]
+    assert stages["chain"].cancelled
+    assert stages["stats"].cancelled
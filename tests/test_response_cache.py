@@ -0,0 +1,43 @@
+import pytest
+
+cache = pytest.importorskip("backend.cache")
+
+
+def test_memory_backend_counts_utf8_bytes():
+    backend = cache.MemoryCacheBackend(max_entries=10, max_bytes=100)
+    payload = "фильм" * 6  # 30 символов, 60 байт
+
+    backend.set("a", payload, ttl=60)
+    assert backend.size == 60
+
+    backend.set("b", payload, ttl=60)
+    # Вместе 120 байт > 100: старейшая запись вытеснена, хотя в символах (60) лимит не превышен
+    assert backend.get("a") is None
+    assert backend.get("b") == payload
+    assert backend.size == 60
+
+
+def test_memory_backend_skips_payload_larger_than_limit():
+    backend = cache.MemoryCacheBackend(max_entries=10, max_bytes=50)
+    backend.set("a", "я" * 30, ttl=60)
+    assert backend.get("a") is None
+    assert backend.size == 0
+
+
+def test_memory_backend_is_lru_by_access():
+    backend = cache.MemoryCacheBackend(max_entries=2, max_bytes=1000)
+    backend.set("a", "1", ttl=60)
+    backend.set("b", "2", ttl=60)
+    backend.get("a")
+    backend.set("c", "3", ttl=60)
+
+    assert backend.get("a") == "1"
+    assert backend.get("b") is None
+    assert backend.get("c") == "3"
+
+
+def test_cache_key_normalizes_query_and_genres():
+    first = cache.make_cache_key("search", "  Фильмы про Ёлку!", {"favorite": ["Драма", "комедия"], "hated": []})
+    second = cache.make_cache_key("search", "фильмы про елку", {"favorite": ["комедия", "драма "], "hated": []})
+    assert first == second
+    assert first != cache.make_cache_key("voice", "фильмы про елку", {"favorite": ["комедия", "драма"], "hated": []})
@@ -0,0 +1,118 @@
+import pytest
+
+pytest.importorskip("faiss")
+vector = pytest.importorskip("AI.vector")
+
+from AI.embedding_cache import HashEmbeddings
+from AI.index_factory import create_faiss_store
+from AI.mmap_store import load_generation, publish_generation
+from AI.retriever import create_movie_retriever
+from backend.cache import make_cache_key
+
+
+def make_movie(movie_id, description, name=None, genres=("драма",), year=2010, rating=7.0):
+    return {
+        "id": movie_id,
+        "name": name or f"Фильм {movie_id}",
+        "type": "movie",
+        "shortDescription": description,
+        "year": year,
+        "rating": {"kp": rating, "imdb": rating},
+        "genres": [{"name": genre} for genre in genres],
+        "countries": [{"name": "США"}],
+        "persons": [],
+    }
+
+
+MOVIES = [
+    make_movie(1, "корабль летит в далекий космос", genres=("фантастика",), year=1995, rating=8.0),
+    make_movie(2, "корабль летит в далекий космос", genres=("ужасы", "фантастика"), year=2005, rating=7.0),
+    make_movie(3, "корабль летит в далекий космос", genres=("фантастика", "комедия"), year=2015, rating=6.0),
+    make_movie(4, "корабль летит в далекий космос", genres=("фантастика",), year=2020, rating=5.0),
+    make_movie(5, "история любви в маленьком городе", genres=("мелодрама",), year=2012, rating=7.5),
+]
+
+
+def build_store(movies=MOVIES):
+    texts, metadatas, ids = vector.prepare_movies(movies)
+    return create_faiss_store(texts, HashEmbeddings(dim=64), metadatas, ids)
+
+
+def result_ids(documents):
+    return [document.metadata["id"] for document in documents]
+
+
+def test_hard_filters_drop_hated_genres_years_and_low_ratings():
+    store = build_store()
+    search = "корабль летит в космос"
+
+    retriever = create_movie_retriever(store, {"favorite": [], "hated": ["Ужасы"]}, search_query=search)
+    retriever.k = 10
+    assert 2 not in result_ids(retriever.search(search))
+
+    retriever = create_movie_retriever(store, filters={"year_from": 2000, "year_to": 2016})
+    retriever.k = 10
+    assert sorted(result_ids(retriever.search(search))) == [2, 3, 5]
+
+    retriever = create_movie_retriever(store, filters={"min_rating_kp": 7.0})
+    retriever.k = 10
+    assert sorted(result_ids(retriever.search(search))) == [1, 2, 5]
+
+
+def test_fetch_window_grows_until_enough_candidates_survive(monkeypatch):
+    movies = [make_movie(i, f"корабль летит в космос номер {i}", year=2000) for i in range(1, 40)]
+    movies += [make_movie(100, "история любви", year=1980), make_movie(101, "любовь и разлука", year=1981)]
+    store = build_store(movies)
+
+    fetched = []
+    search = store.similarity_search_with_score
+
+    def spy(query, k, **kwargs):
+        fetched.append(k)
+        return search(query, k=k, **kwargs)
+
+    monkeypatch.setattr(store, "similarity_search_with_score", spy)
+    retriever = create_movie_retriever(store, filters={"year_to": 1990})
+    retriever.k, retriever.fetch_k = 2, 2
+
+    assert sorted(result_ids(retriever.search("корабль летит в космос"))) == [100, 101]
+    # Выживают только 2 кандидата из 41: запас растет в 4 раза, пока не покроет весь индекс
+    assert fetched == [2, 8, 32, 128]
+
+
+def test_favorite_genres_and_rating_boost_rank_score():
+    store = build_store()
+    retriever = create_movie_retriever(store, {"favorite": ["Комедия"], "hated": []})
+    retriever.k = 4
+
+    # Описания одинаковые: порядок задают бонус за любимый жанр, затем рейтинг
+    assert result_ids(retriever.search("корабль летит в далекий космос")) == [3, 1, 2, 4]
+
+    documents = {document.metadata["id"]: document for document in retriever.search("корабль")}
+    assert retriever.rank_score(documents[3], 0.5) > retriever.rank_score(documents[1], 0.5)
+    assert retriever.rank_score(documents[1], 0.5) > retriever.rank_score(documents[2], 0.5)
+
+
+def test_filters_are_part_of_cache_key():
+    genres = {"favorite": ["драма"], "hated": []}
+    plain = make_cache_key("search", "фильм про космос", genres, {})
+
+    assert make_cache_key("search", "фильм про космос", genres, {"year_from": None}) == plain
+    assert make_cache_key("search", "фильм про космос", genres, {"year_from": 2000}) != plain
+    assert (make_cache_key("search", "фильм про космос", genres, {"min_rating_kp": 7})
+            != make_cache_key("search", "фильм про космос", genres, {"min_rating_imdb": 7}))
+
+
+def test_unique_title_match_outranks_top_vector_hit(tmp_path):
+    movies = MOVIES + [make_movie(6, "хакер узнает правду о мире", name="Матрица", genres=("фантастика",))]
+    publish_generation(build_store(movies), str(tmp_path))
+    store = load_generation(str(tmp_path), HashEmbeddings(dim=64))
+
+    retriever = create_movie_retriever(store)
+    retriever.k = retriever.fetch_k = retriever.max_fetch_k = 1
+    retriever.similar_k = 0
+    vector_top = store.similarity_search_with_score("Матрица", k=1)[0][0]
+    # Фильм найден только BM25 по названию; без веса лексического списка он делил бы место с векторным
+    assert vector_top.metadata["id"] != 6
+
+    assert result_ids(retriever.search("Матрица")) == [6]
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+similar = pytest.importorskip("AI.similar")
+
+from langchain_core.documents import Document
+
+
+def make_index(vectors, factory="Flat"):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    index = faiss.index_factory(vectors.shape[1], factory)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+VECTORS = [[0, 0], [0.1, 0], [5, 5], [5.1, 5], [10, 0]]
+IDS = [11, 12, 13, 14, 15]
+
+
+def test_graph_is_sorted_csr_without_self_loops(tmp_path):
+    similar.build_similarity_graph(make_index(VECTORS), IDS, [[] for _ in IDS], str(tmp_path), k=2, batch_size=2)
+    graph = similar.SimilarityGraph.load(str(tmp_path))
+
+    assert len(graph.offsets) == len(IDS) + 1
+    for position in range(len(IDS)):
+        neighbors = graph.neighbors_of(position)
+        assert position not in [neighbor for neighbor, _ in neighbors]
+        scores = [score for _, score in neighbors]
+        assert scores == sorted(scores, reverse=True)
+    assert graph.neighbors_of(0)[0][0] == 1
+    assert graph.neighbors_of(2)[0][0] == 3
+
+
+def test_kinopoisk_links_outrank_embedding_neighbors(tmp_path):
+    kinopoisk_similar = [[15, 999], [], [], [], []]
+    similar.build_similarity_graph(make_index(VECTORS), IDS, kinopoisk_similar, str(tmp_path), k=1)
+    graph = similar.SimilarityGraph.load(str(tmp_path))
+
+    # Связь Кинопоиска на далекий фильм 15 выше ближайшего соседа; неизвестный id 999 пропускается
+    assert [neighbor for neighbor, _ in graph.neighbors_of(0)] == [4, 1]
+
+
+def test_graph_build_does_not_add_direct_map_to_ivf_index(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.random((100, 8), dtype=np.float32)
+    index = make_index(vectors, "IVF2,Flat")
+
+    similar.build_similarity_graph(index, list(range(100)), [[] for _ in range(100)], str(tmp_path), k=3)
+
+    assert faiss.extract_index_ivf(index).direct_map.type == faiss.DirectMap.NoMap
+    index.remove_ids(np.array([0], dtype=np.int64))
+    assert similar.SimilarityGraph.load(str(tmp_path)).neighbors_of(99)
+
+
+def test_missing_graph_loads_as_none(tmp_path):
+    assert similar.SimilarityGraph.load(str(tmp_path)) is None
+
+
+class FakeDocstore:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def position(self, doc_id):
+        ids = [document.metadata["id"] for document in self.documents]
+        return ids.index(int(doc_id)) if int(doc_id) in ids else None
+
+    def document_at(self, position):
+        return self.documents[position]
+
+
+class FakeVectorStore:
+    def __init__(self, documents, graph):
+        self.docstore = FakeDocstore(documents)
+        self.similarity_graph = graph
+
+
+def test_find_similar_movies_applies_genre_preferences(tmp_path):
+    genres = [["драма"], ["ужасы"], ["драма"], ["драма", "комедия"], ["ужасы", "драма"]]
+    documents = [Document(page_content="", metadata={"id": movie_id, "genres": movie_genres})
+                 for movie_id, movie_genres in zip(IDS, genres)]
+    similar.build_similarity_graph(make_index(VECTORS), IDS, [[] for _ in IDS], str(tmp_path), k=4)
+    vector_store = FakeVectorStore(documents, similar.SimilarityGraph.load(str(tmp_path)))
+
+    results = similar.find_similar_movies(vector_store, 11, favorite_genres=["Комедия"], hated_genres=["ужасы"])
+    result_ids = [document.metadata["id"] for document, _ in results]
+
+    assert 12 not in result_ids and 15 not in result_ids
+    assert result_ids == [14, 13]
+    assert similar.find_similar_movies(vector_store, 404) is None
+
+
+def test_favorite_genre_bonus_does_not_outrank_near_duplicate(tmp_path):
+    genres = [["драма"], ["драма"], ["драма"], ["комедия"], ["комедия"]]
+    documents = [Document(page_content="", metadata={"id": movie_id, "genres": movie_genres})
+                 for movie_id, movie_genres in zip(IDS, genres)]
+    similar.build_similarity_graph(make_index(VECTORS), IDS, [[] for _ in IDS], str(tmp_path), k=4)
+    vector_store = FakeVectorStore(documents, similar.SimilarityGraph.load(str(tmp_path)))
+
+    results = similar.find_similar_movies(vector_store, 11, favorite_genres=["комедия"])
+
+    # Почти дубль 12 остается первым; любимый жанр поднимает 14 над почти равным по score 13,
+    # а далекий 15 - над 13, но не над 12
+    assert [document.metadata["id"] for document, _ in results] == [12, 14, 15, 13]
+    assert results[0][1] > 0.9
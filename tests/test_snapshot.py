@@ -0,0 +1,139 @@
+import gzip
+import json
+import os
+import threading
+
+import pytest
+
+from external_api import snapshot as snapshots
+
+
+def movie(movie_id, version=1):
+    return {"id": movie_id, "name": f"Фильм {movie_id}", "version": version}
+
+
+def read_all(path, name=None, allow_incomplete=False):
+    return list(snapshots.iter_snapshot_movies(path, name, allow_incomplete))
+
+
+def test_round_trip_and_latest_pointer(tmp_path):
+    path = str(tmp_path)
+    with snapshots.SnapshotWriter(path, source={"query": "movie"}) as writer:
+        writer.expect_pages([1, 2])
+        writer.write_page(1, [movie(1), movie(2)])
+        writer.write_page(2, [movie(3)])
+
+    manifest = snapshots.read_manifest(path)
+    assert manifest["name"] == writer.name == snapshots.read_latest_snapshot(path)
+    assert manifest["movies"] == 3
+    assert manifest["complete"] and manifest["pages"] == [1, 2]
+    assert read_all(path) == [movie(1), movie(2), movie(3)]
+
+
+def test_pages_are_written_in_page_order_and_dedupe_matches_get_movies(tmp_path):
+    # Фильм 2 есть на страницах 1 и 3 в разных версиях; страницы приходят не по порядку
+    pages = {1: [movie(1), movie(2, version=1)], 2: [movie(3)], 3: [movie(2, version=3), movie(4)]}
+    path = str(tmp_path)
+    with snapshots.SnapshotWriter(path) as writer:
+        writer.expect_pages(pages)
+        for page in (3, 2, 1):
+            writer.write_page(page, pages[page])
+
+    # То же, что dedupe_movies по страницам в порядке возрастания
+    expected, seen = [], set()
+    for page in sorted(pages):
+        for doc in pages[page]:
+            if doc["id"] not in seen:
+                seen.add(doc["id"])
+                expected.append(doc)
+
+    assert read_all(path) == expected
+    assert read_all(path)[1]["version"] == 1
+
+
+def test_concurrent_writers_produce_deterministic_snapshot(tmp_path):
+    pages = {page: [movie(page * 10 + i) for i in range(5)] + [movie(0, version=page)] for page in range(1, 21)}
+    path = str(tmp_path)
+    with snapshots.SnapshotWriter(path) as writer:
+        writer.expect_pages(pages)
+        threads = [threading.Thread(target=writer.write_page, args=(page, pages[page]))
+                   for page in sorted(pages, reverse=True)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    movies = read_all(path)
+    expected_ids = [10, 11, 12, 13, 14, 0] + [page * 10 + i for page in range(2, 21) for i in range(5)]
+    assert [doc["id"] for doc in movies] == expected_ids
+    assert movies[5] == movie(0, version=1)
+
+
+def test_failed_pages_make_snapshot_incomplete(tmp_path):
+    path = str(tmp_path)
+    with snapshots.SnapshotWriter(path) as first:
+        first.write_page(1, [movie(1)])
+
+    with snapshots.SnapshotWriter(path) as second:
+        second.expect_pages([1, 2, 3])
+        second.write_page(1, [movie(1)])
+        second.write_page(3, [movie(3)])
+        second.mark_failed([2])
+
+    assert snapshots.read_latest_snapshot(path) == first.name
+    with pytest.raises(snapshots.SnapshotError):
+        snapshots.read_manifest(path, second.name)
+    with pytest.raises(snapshots.SnapshotError):
+        read_all(path, second.name)
+    assert read_all(path, second.name, allow_incomplete=True) == [movie(1), movie(3)]
+
+
+def test_exception_inside_writer_discards_snapshot(tmp_path):
+    path = str(tmp_path)
+    with pytest.raises(RuntimeError):
+        with snapshots.SnapshotWriter(path) as writer:
+            writer.write_page(1, [movie(1)])
+            raise RuntimeError("загрузка упала")
+
+    assert os.listdir(path) == []
+    with pytest.raises(snapshots.SnapshotError):
+        snapshots.read_manifest(path)
+
+
+def test_truncated_file_is_detected(tmp_path):
+    path = str(tmp_path)
+    with snapshots.SnapshotWriter(path) as writer:
+        writer.write_page(1, [movie(i) for i in range(2000)])
+
+    movies_path = os.path.join(path, writer.name, snapshots.MOVIES_FILE)
+    with open(movies_path, "rb") as f:
+        data = f.read()
+    with open(movies_path, "wb") as f:
+        f.write(data[:len(data) // 2])
+
+    with pytest.raises(snapshots.SnapshotError):
+        read_all(path)
+
+
+def test_movie_count_mismatch_is_detected(tmp_path):
+    path = str(tmp_path)
+    with snapshots.SnapshotWriter(path) as writer:
+        writer.write_page(1, [movie(1), movie(2)])
+
+    movies_path = os.path.join(path, writer.name, snapshots.MOVIES_FILE)
+    with gzip.open(movies_path, "wt", encoding="utf-8") as f:
+        f.write(json.dumps(movie(1)) + "\n")
+
+    with pytest.raises(snapshots.SnapshotError):
+        read_all(path)
+
+
+def test_old_snapshots_are_pruned(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshots, "KEEP_SNAPSHOTS", 2)
+    path = str(tmp_path)
+    for i in range(4):
+        with snapshots.SnapshotWriter(path) as writer:
+            writer.write_page(1, [movie(i)])
+
+    assert snapshots.list_snapshots(path) == ["snap-000003", "snap-000004"]
+    assert read_all(path) == [movie(3)]
@@ -0,0 +1,39 @@
+import pytest
+
+stats_engine = pytest.importorskip("AI.stats_engine")
+
+VOCABULARY = frozenset({"драма", "комедия", "ужасы", "история", "детектив", "для взрослых", "реальное тв",
+                        "военный", "мультфильм", "криминал", "фантастика"})
+
+
+@pytest.mark.parametrize("query, genres", [
+    ("статистика по драмам и комедиям", ["драма", "комедия"]),
+    ("статистика по жанру история", ["история"]),
+    ("статистика детективов и ужастиков", ["детектив", "ужасы"]),
+    ("количество мультиков", ["мультфильм"]),
+    ("статистика по фильмам для взрослых", ["для взрослых"]),
+    ("средний рейтинг криминала", ["криминал"]),
+    ("сколько фильмов про войну", ["военный"]),
+])
+def test_detect_genres_matches_word_forms_and_synonyms(query, genres):
+    assert stats_engine.detect_genres(query, VOCABULARY) == genres
+
+
+@pytest.mark.parametrize("query", [
+    "средний рейтинг исторических фильмов",
+    "статистика по драматургии",
+    "сколько фильмов звездные войны",
+])
+def test_detect_genres_ignores_words_sharing_a_prefix(query):
+    assert stats_engine.detect_genres(query, VOCABULARY) == []
+
+
+def test_synonyms_require_genre_in_loaded_vocabulary():
+    assert stats_engine.detect_genres("статистика хорроров", frozenset({"драма"})) == []
+    assert stats_engine.detect_genres("статистика хорроров", frozenset()) == ["ужасы"]
+
+
+def test_open_ended_questions_go_to_agent():
+    assert stats_engine.is_stats_request("какой средний рейтинг у комедий")
+    assert stats_engine.is_open_ended("какой жанр самый популярный по количеству фильмов")
+    assert not stats_engine.is_stats_request("посоветуй фильм про средневековье")
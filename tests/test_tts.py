@@ -0,0 +1,102 @@
+import asyncio
+import base64
+import threading
+import time
+
+import pytest
+
+tts = pytest.importorskip("backend.tts")
+
+
+class RecordingBackend(tts.SilentTTSBackend):
+    """Тишина с задержкой; запоминает синтезированные предложения и потоки, в которых шел синтез"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.sentences = []
+        self.threads = set()
+        self.lock = threading.Lock()
+
+    def synthesize(self, text):
+        time.sleep(self.delay)
+        with self.lock:
+            self.sentences.append(text)
+            self.threads.add(threading.current_thread().name)
+        return super().synthesize(text)
+
+
+@pytest.fixture
+def synthesizer(tmp_path):
+    synthesizer = tts.SpeechSynthesizer(RecordingBackend(), tts.AudioCache(str(tmp_path)), workers=2)
+    yield synthesizer
+    synthesizer.close()
+
+
+def test_split_sentences():
+    text = "Посмотрите 'Фильм'. Он вам понравится!  Рейтинг 8.1?\nЕще есть сериал… Конец"
+    assert tts.split_sentences(text) == ["Посмотрите 'Фильм'.", "Он вам понравится!", "Рейтинг 8.1?",
+                                         "Еще есть сериал…", "Конец"]
+    assert tts.split_sentences(" \n ") == []
+
+
+def test_stream_yields_sentences_in_order_and_caches_them(synthesizer):
+    async def consume(text):
+        return [chunk async for chunk in synthesizer.stream(text)]
+
+    text = "Первое предложение. Второе, подлиннее предложение! Третье."
+    chunks = asyncio.run(consume(text))
+
+    assert chunks == [synthesizer.backend.synthesize(sentence) for sentence in tts.split_sentences(text)]
+    synthesizer.backend.sentences.clear()
+    assert asyncio.run(consume(text)) == chunks
+    assert synthesizer.backend.sentences == []
+
+
+def test_abandoned_stream_cancels_remaining_sentences(tmp_path):
+    backend = RecordingBackend(delay=0.05)
+    synthesizer = tts.SpeechSynthesizer(backend, tts.AudioCache(str(tmp_path)), workers=1)
+    text = " ".join(f"Предложение номер {i}." for i in range(10))
+
+    async def consume_first():
+        stream = synthesizer.stream(text)
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first
+
+    assert asyncio.run(consume_first())
+    synthesizer.executor.shutdown(wait=True)
+    # Синтезированы первое предложение и, возможно, уже начатое второе; остальные отменены
+    assert len(backend.sentences) <= 2
+
+
+def test_voice_endpoints_synthesize_in_tts_pool(synthesizer, monkeypatch, override_component):
+    pytest.importorskip("httpx")
+    router = pytest.importorskip("backend.router")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    answer = "Посмотрите 'Фильм'. Рейтинг на IMDB 7.8."
+
+    class FakeChain:
+        async def ainvoke(self, prompt):
+            return {"result": answer}
+
+    monkeypatch.setattr(router, "create_retrieval_chain", lambda **kwargs: FakeChain())
+    override_component("speech_synthesizer", synthesizer)
+    override_component("response_cache", None)
+    app = FastAPI()
+    app.include_router(router.router)
+    client = TestClient(app)
+    expected_audio = b"".join(synthesizer.backend.synthesize(sentence) for sentence in tts.split_sentences(answer))
+    synthesizer.backend.threads.clear()
+
+    body = {"transcription": "посоветуй фильм", "genres": {"favorite": [], "hated": []}}
+    response = client.post("/voice", json=body)
+    assert response.status_code == 200
+    assert response.json()["answer"] == answer
+    assert base64.b64decode(response.json()["audio_base64"]) == expected_audio
+    assert synthesizer.backend.threads and all(name.startswith("tts") for name in synthesizer.backend.threads)
+
+    response = client.post("/voice/audio", json={"text": answer})
+    assert response.headers["content-type"] == "audio/mpeg"
+    assert response.content == expected_audio
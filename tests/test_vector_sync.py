@@ -0,0 +1,81 @@
+import pytest
+
+faiss = pytest.importorskip("faiss")
+vector = pytest.importorskip("AI.vector")
+
+from AI.embedding_cache import HashEmbeddings
+from AI.index_factory import create_faiss_store, index_supports_removal
+
+
+def make_movie(movie_id, description=None):
+    return {
+        "id": movie_id,
+        "name": f"Фильм {movie_id}",
+        "type": "movie",
+        "shortDescription": description or f"описание фильма номер {movie_id}",
+        "year": 2000 + movie_id % 20,
+        "rating": {"kp": 7.0, "imdb": 7.1},
+        "genres": [{"name": "драма"}],
+        "countries": [{"name": "Россия"}],
+        "persons": [{"name": f"Актер {movie_id}", "enProfession": "actor"}],
+    }
+
+
+def build_store(movies, index_type="flat"):
+    texts, metadatas, ids = vector.prepare_movies(movies)
+    return create_faiss_store(texts, HashEmbeddings(dim=32), metadatas, ids, index_type=index_type)
+
+
+def store_ids(vector_store):
+    return sorted(vector_store.index_to_docstore_id[position] for position in range(vector_store.index.ntotal))
+
+
+def test_sync_removes_stale_movies_without_other_changes():
+    movies = [make_movie(movie_id) for movie_id in range(1, 6)]
+    vector_store = build_store(movies)
+
+    changed, removed = vector.sync_vector_store(vector_store, movies[:3])
+
+    assert changed == []
+    assert sorted(removed) == ["4", "5"]
+    assert store_ids(vector_store) == ["1", "2", "3"]
+    assert "4" not in vector_store.docstore._dict
+
+
+def test_sync_replaces_changed_movie():
+    movies = [make_movie(movie_id) for movie_id in range(1, 4)]
+    vector_store = build_store(movies)
+
+    updated = movies[:2] + [make_movie(3, "совсем другое описание")]
+    changed, removed = vector.sync_vector_store(vector_store, updated)
+
+    assert [metadata["id"] for metadata in changed] == [3]
+    assert removed == []
+    assert store_ids(vector_store) == ["1", "2", "3"]
+    assert vector_store.docstore.search("3").page_content == "совсем другое описание"
+
+
+def test_only_flat_index_supports_removal():
+    movies = [make_movie(movie_id) for movie_id in range(1, 50)]
+    assert index_supports_removal(build_store(movies, "flat").index)
+    assert not index_supports_removal(build_store(movies, "ivf_flat").index)
+    assert not index_supports_removal(build_store(movies, "hnsw").index)
+
+
+def test_sync_deletes_removed_movies_from_database(monkeypatch):
+    movies = [make_movie(movie_id) for movie_id in range(1, 6)]
+    vector_store = build_store(movies)
+    db_calls = []
+
+    monkeypatch.setattr(vector, "read_current_generation", lambda path: "gen-000001")
+    monkeypatch.setattr(vector, "is_legacy_vector_store", lambda: False)
+    monkeypatch.setattr(vector, "get_embeddings", lambda: HashEmbeddings(dim=32))
+    monkeypatch.setattr(vector, "load_generation", lambda *args, **kwargs: vector_store)
+    monkeypatch.setattr(vector, "load_catalog", lambda snapshot=None: movies[:4])
+    monkeypatch.setattr(vector, "save_vector_store", lambda store: None)
+    monkeypatch.setattr(vector, "add_movies_from_metadata", lambda metadata, removed_ids=(), full_load=False:
+                        db_calls.append((metadata, removed_ids, full_load)))
+
+    vector.get_vector_store(sync=True)
+
+    assert db_calls == [([], [5], False)]
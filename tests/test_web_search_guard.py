@@ -0,0 +1,58 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+tools = pytest.importorskip("AI.tools")
+
+
+class SlowTool:
+    def __init__(self, delay=0.2, result=None):
+        self.delay = delay
+        self.result = result if result is not None else [{"content": "результат"}]
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def invoke(self, query):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return self.result
+
+
+def test_timeout_of_one_waiter_does_not_cancel_coalesced_search():
+    guard = tools.WebSearchGuard(breaker=tools.CircuitBreaker(failure_threshold=100))
+    tool = SlowTool()
+
+    async def run():
+        impatient = asyncio.wait_for(guard.asearch(tool, "Фильмы про космос"), timeout=0.05)
+        patient = guard.asearch(tool, "фильмы  про космос!")
+        return await asyncio.gather(impatient, patient, return_exceptions=True)
+
+    try:
+        impatient, patient = asyncio.run(run())
+        assert isinstance(impatient, asyncio.TimeoutError)
+        assert patient == tool.result
+        assert tool.calls == 1
+        # Результат попал в кэш, хотя первый ожидающий отвалился по таймауту
+        assert guard.search(tool, "фильмы про космос") == tool.result
+        assert tool.calls == 1
+    finally:
+        guard.close()
+
+
+def test_breaker_opens_after_failures_and_recovers_after_probe():
+    breaker = tools.CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open()
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()  # пока идет пробный вызов, остальные отклоняются
+    breaker.record_success()
+    assert not breaker.is_open()
+    assert breaker.allow()